@@ -0,0 +1,75 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""An in-process stand-in for the binary API.
+
+Every function returns immediately without touching the buffers, so the
+benchmarks only measure the overhead of the Python layer. Unlike a mock
+object, calling it is about as cheap as calling the extension module.
+"""
+
+NUM_DEVICES = 4
+
+class FakeAPI(object):
+    def py_aa_find_devices(self, num_devices, devices):
+        for i in range(min(num_devices, NUM_DEVICES)):
+            devices[i] = i
+        return NUM_DEVICES
+
+    def py_aa_find_devices_ext(self, num_devices, num_ids, devices, ids):
+        for i in range(min(num_devices, NUM_DEVICES)):
+            devices[i] = i
+            ids[i] = 2237000000 + i
+        return NUM_DEVICES
+
+    def py_aa_open_ext(self, port):
+        return port + 1, (0x0500, 0x0300, 0x0300, 0x0500, 0x0300, 0x0500)
+
+    def py_aa_close(self, handle):
+        return 0
+
+    def py_aa_unique_id(self, handle):
+        return 2237000000 + handle - 1
+
+    def py_aa_configure(self, handle, config):
+        return 3
+
+    def py_aa_i2c_write(self, handle, addr, flags, num, data):
+        return num
+
+    def py_aa_i2c_read(self, handle, addr, flags, num, data):
+        return num
+
+    def py_aa_i2c_write_ext(self, handle, addr, flags, num, data):
+        return 0, num
+
+    def py_aa_i2c_read_ext(self, handle, addr, flags, num, data):
+        return 0, num
+
+    def py_aa_spi_write(self, handle, num_out, data_out, num_in, data_in):
+        return num_out
+
+    def py_aa_i2c_slave_read(self, handle, num, data):
+        return num, 0x50
+
+    def py_aa_async_poll(self, handle, timeout):
+        return 0
+
+    def __getattr__(self, name):
+        # every other function just succeeds
+        if not name.startswith('py_aa_'):
+            raise AttributeError(name)
+        return lambda *args: 0
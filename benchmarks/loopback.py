@@ -0,0 +1,154 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""A minimal JSON-RPC server speaking the protocol of pyRemoteAardvark.
+
+It answers the requests from the :class:`FakeAPI`, so the benchmarks
+measure the client and the loopback network stack, but no hardware. An
+additional `latency` can be given to emulate a remote server.
+"""
+
+import json
+import struct
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from fakeapi import FakeAPI
+
+TAG = 93
+HEADER = struct.Struct('>BI')
+
+def _read_exactly(f, n):
+    data = f.read(n)
+    if len(data) < n:
+        raise EOFError()
+    return data
+
+def _version(ver):
+    names = ('software', 'firmware', 'hardware', 'sw_req_by_fw',
+            'fw_req_by_sw', 'api_req_by_sw')
+    return dict(zip(names, ver))
+
+class _Handler(socketserver.StreamRequestHandler):
+    # the client waits for each response, see JsonRPCClient
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        api = self.server.api
+        latency = self.server.latency
+        if latency:
+            responses = queue.Queue()
+            writer = threading.Thread(target=self._write_delayed,
+                    args=(responses,))
+            writer.daemon = True
+            writer.start()
+        try:
+            while True:
+                try:
+                    (tag, length) = HEADER.unpack(_read_exactly(self.rfile,
+                            HEADER.size))
+                    request = json.loads(_read_exactly(self.rfile, length)
+                            .decode('utf-8'))
+                except EOFError:
+                    return
+                received = time.time()
+                result = self.server.dispatch(api, request['method'],
+                        request['params'])
+                response = json.dumps(dict(jsonrpc='2.0', id=request['id'],
+                        result=result)).encode('utf-8')
+                data = HEADER.pack(TAG, len(response)) + response
+                if latency:
+                    responses.put((received + latency, data))
+                else:
+                    self.wfile.write(data)
+        finally:
+            if latency:
+                responses.put(None)
+
+    def _write_delayed(self, responses):
+        # a delay line, the responses are late but not throttled
+        while True:
+            item = responses.get()
+            if item is None:
+                return
+            (due, data) = item
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self.wfile.write(data)
+            except (IOError, ValueError):
+                return
+
+class LoopbackServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0):
+        socketserver.ThreadingTCPServer.__init__(self, address, _Handler)
+        self.api = FakeAPI()
+        # added to the time of each response, in seconds
+        self.latency = latency
+        self.thread = None
+        # number of bytes returned by an I2C slave read
+        self.slave_read_size = 64
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever,
+                name='loopback-server')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def dispatch(self, api, method, params):
+        method = method.split('.', 1)[1]
+        handle = params.get('Aardvark')
+        if method == 'aa_find_devices':
+            num = api.py_aa_find_devices(0, [])
+            return dict(num_devices=num, devices=list(range(num)))
+        if method == 'aa_open_ext':
+            (handle, ver) = api.py_aa_open_ext(params['port'])
+            return dict(Aardvark=handle,
+                    AardvarkExt=dict(AardvarkVersionValue=_version(ver)))
+        if method == 'aa_unique_id':
+            return api.py_aa_unique_id(handle)
+        if method in ('aa_i2c_read', 'aa_spi_write'):
+            num = params['num_bytes']
+            return dict(returnCode=num, data_in=[0] * num)
+        if method == 'aa_i2c_write':
+            return dict(returnCode=len(params['data_out']))
+        if method == 'aa_i2c_slave_read':
+            num = min(params['num_bytes'], self.slave_read_size)
+            return dict(returnCode=num, slave_addr=0x50, data_in=[0] * num)
+        return dict(returnCode=0)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Benchmarks of the pyaardvark hot paths, no hardware required.
+
+The local benchmarks replace the binary API with :class:`FakeAPI`, so the
+numbers are the pure overhead of pyaardvark. The remote benchmarks run the
+pyRemoteAardvark client against a loopback server.
+
+Usage::
+
+  python benchmarks/run.py --save baseline.json
+  python benchmarks/run.py --compare baseline.json --threshold 0.25
+
+With ``--compare``, the exit code is 1 if any benchmark got slower than the
+baseline by more than the threshold.
+
+Besides the time, the number of objects retained per call is reported,
+which is non-zero if a hot path leaks or grows a cache.
+"""
+
+from __future__ import print_function
+import argparse
+import gc
+import json
+import os
+import platform
+import re
+import socket
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyaardvark import aardvark
+from fakeapi import FakeAPI
+from loopback import LoopbackServer
+
+#: Payload sizes of the transfer benchmarks, up to the adapter limit.
+SIZES = (1, 16, 256, 4096, 65535)
+
+#: Number of requests on the way at once in the pipelined benchmarks.
+PIPELINE_DEPTH = 16
+
+def transfer_cases(a, sizes):
+    """Return a list of `(name, func, num_bytes)` tuples for the transfer
+    methods of the Aardvark object `a`.
+    """
+    cases = []
+    for size in sizes:
+        data = b'\x55' * size
+        buf = bytearray(size)
+        cases += [
+            ('i2c_master_write/%d' % size,
+                lambda data=data: a.i2c_master_write(0x50, data), size),
+            ('i2c_master_read/%d' % size,
+                lambda size=size: a.i2c_master_read(0x50, size), size),
+            ('i2c_master_read_into/%d' % size,
+                lambda buf=buf: a.i2c_master_read_into(0x50, buf), size),
+            ('spi_write/%d' % size,
+                lambda data=data: a.spi_write(data), size),
+            ('spi_transfer_into/%d' % size,
+                lambda buf=buf: a.spi_transfer_into(buf, buf), size),
+        ]
+    return cases
+
+def device_cases(a):
+    return [
+        ('find_devices', aardvark.find_devices, 0),
+        ('open_close', lambda: aardvark.open(0).close(), 0),
+        ('i2c_slave_read', a.i2c_slave_read, 0),
+    ]
+
+def _timed(func, number):
+    start = timeit.default_timer()
+    for _ in range(number):
+        func()
+    return timeit.default_timer() - start
+
+def measure(func, min_time=0.1, repeat=3):
+    """Return the best time per call in seconds. The number of calls per
+    round is chosen so that a round takes at least `min_time` seconds.
+    """
+    number = 1
+    while True:
+        t = _timed(func, number)
+        if t >= min_time:
+            break
+        number *= max(2, min(10, int(min_time / max(t, 1e-9)) + 1))
+    best = t
+    for _ in range(repeat - 1):
+        best = min(best, _timed(func, number))
+    return best / number
+
+def retained_objects(func, calls=100):
+    """Return the number of objects tracked by the garbage collector which
+    are left over per call of `func`. Only container objects (lists,
+    dictionaries, instances, futures, ...) are tracked, plain buffers
+    aren't. Unlike tracemalloc, this works on Python 2.
+    """
+    func()
+    gc.collect()
+    before = len(gc.get_objects())
+    for _ in range(calls):
+        func()
+    gc.collect()
+    return max(0, len(gc.get_objects()) - before) / float(calls)
+
+def run_cases(prefix, cases, args, results):
+    for (name, func, num_bytes) in cases:
+        name = '%s/%s' % (prefix, name)
+        if args.filter and not re.search(args.filter, name):
+            continue
+        per_call = measure(func, args.min_time, args.repeat)
+        result = dict(
+                per_call_us=per_call * 1e6,
+                throughput_mb_s=num_bytes / per_call / 1e6 if num_bytes
+                    else None,
+                retained_objects=retained_objects(func),
+        )
+        results[name] = result
+        print('%-40s %12.2f us %10s MB/s %8.2f obj' % (name,
+                result['per_call_us'],
+                '%.1f' % result['throughput_mb_s']
+                    if num_bytes else '-',
+                result['retained_objects']))
+
+def run_local(args, results):
+    aardvark.api = FakeAPI()
+    a = aardvark.open(0)
+    try:
+        run_cases('local', device_cases(a) + transfer_cases(a, SIZES), args,
+                results)
+    finally:
+        a.close()
+
+def pipeline_cases(rpc, handle, sizes, depth=PIPELINE_DEPTH):
+    """Return benchmark cases sending `depth` I2C reads at once with the
+    pipelining JsonRPCClient `rpc`.
+    """
+    cases = []
+    for size in sizes:
+        params = {'Aardvark': handle, 'slave_addr': 0x50,
+                'AardvarkI2cFlags': 0, 'num_bytes': size}
+        def func(params=params):
+            futures = [rpc.submit('Aardvark.aa_i2c_read', params)
+                    for _ in range(depth)]
+            for future in futures:
+                rpc.wait(future)
+        cases.append(('pipelined/i2c_read/%dx%d' % (size, depth), func,
+                size * depth))
+    return cases
+
+def run_remote(args, results):
+    try:
+        server = LoopbackServer(latency=args.remote_latency / 1000.0)
+    except socket.error as e:
+        print('skipping remote benchmarks: %s' % (e,))
+        return
+    server.start()
+    local_api = aardvark.api
+    try:
+        # the remote API replaces the API of pyaardvark on import
+        from pyRemoteAardvark import remoteaardvark
+        remoteaardvark.configure(port=server.port)
+        a = aardvark.open(0)
+        rpc = remoteaardvark.JsonRPCClient(port=server.port, pipeline=True)
+        try:
+            run_cases('remote', [('open_close',
+                    lambda: aardvark.open(0).close(), 0)]
+                    + transfer_cases(a, SIZES)
+                    + pipeline_cases(rpc, a.handle, SIZES), args, results)
+        finally:
+            rpc.close()
+            a.close()
+    finally:
+        aardvark.api.close()
+        aardvark.api = local_api
+        server.stop()
+
+def compare(results, baseline, threshold):
+    """Print the changes against `baseline` and return the names of the
+    benchmarks which got slower by more than `threshold`.
+    """
+    regressions = []
+    for (name, result) in sorted(results.items()):
+        old = baseline.get(name)
+        if old is None:
+            continue
+        ratio = result['per_call_us'] / old['per_call_us']
+        marker = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            marker = '  REGRESSION'
+        print('%-40s %+7.1f%%%s' % (name, (ratio - 1) * 100, marker))
+    return regressions
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-k', dest='filter',
+            help='only run benchmarks matching this regular expression')
+    parser.add_argument('--min-time', type=float, default=0.1,
+            help='minimal time per round in seconds')
+    parser.add_argument('--repeat', type=int, default=3,
+            help='number of rounds, the best one counts')
+    parser.add_argument('--no-remote', action='store_true',
+            help='skip the benchmarks of the remote API')
+    parser.add_argument('--remote-latency', type=float, default=0.0,
+            metavar='MS', help='delay of the responses of the loopback '
+            'server in milliseconds (default: 0)')
+    parser.add_argument('--save', metavar='FILE',
+            help='save the results as a new baseline')
+    parser.add_argument('--compare', metavar='FILE',
+            help='compare the results with a baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+            help='allowed slowdown against the baseline (default: 0.25)')
+    args = parser.parse_args(args)
+
+    results = {}
+    run_local(args, results)
+    if not args.no_remote:
+        run_remote(args, results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(dict(
+                python=platform.python_version(),
+                implementation=platform.python_implementation(),
+                machine=platform.machine(),
+                results=results), f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('%d benchmark(s) slower than the baseline by more than '
+                    '%d%%' % (len(regressions), args.threshold * 100))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,9 +15,12 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 
 
+import select
 import socket
+import threading
 import time
 import json
+import concurrent.futures
 import JsonParser
 import JsonRpcMsg
 from struct import *
@@ -30,69 +33,254 @@ RECEIVEBUFFER_LENGTH = 2048
 TAG = 93
   
 def find_json_object(objectName, jsonMsg):
-  if(objectName in jsonMsg):
-    retValue = jsonMsg[objectName]
-    
-  if(retValue < 0):
-    #raise KeyError(retValue)
-    print objectName
-  else:
-    return retValue
-  
- 
+  """Return the member `objectName` of `jsonMsg`, negative return codes
+  included. Raises KeyError if it is missing."""
+  if objectName not in jsonMsg:
+    raise KeyError(objectName)
+  return jsonMsg[objectName]
+
+
+
+class ConnectionLost(socket.error):
+    """The server closed the connection or sent garbage."""
+
 
 class JsonRPCClient(object):
-  
-    def __init__(self, address="127.0.0.1", port= 1234):
-      self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-      self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-      self.sock.connect((address,port))
-      self.messageId = 0
-      self.encoder = JsonParser.Encoder()
-      self.decoder = JsonParser.Decoder()
-      
-    
+    """Client for the tag/length framed JSON-RPC protocol.
+
+    The connection is made on the first request. If the server closed an
+    idle connection, e.g. because it was restarted, the client connects
+    again before sending the next request. Failed connection attempts are
+    retried `retries` times, the delay between them starts at `backoff`
+    seconds and is doubled up to `max_backoff`. A request is never resent;
+    if the connection breaks while it is pending, :class:`ConnectionLost`
+    is raised and the next request uses a new connection.
+
+    The attribute `connections` counts the connections made so far, which
+    lets a caller notice that the server side state is gone.
+
+    :meth:`submit` sends a request without waiting for its response, so
+    many requests can be on the way at once. The responses are then
+    received by a reader thread, which matches them to the requests by
+    their id. This is enabled on the first call of :meth:`submit` or, if
+    `pipeline` is true, for every connection, which lets threads sharing
+    the client wait for their responses at the same time.
+    """
+
+    def __init__(self, address="127.0.0.1", port=1234, timeout=None,
+            retries=5, backoff=0.05, max_backoff=2.0, pipeline=False):
+        self.address = address
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pipeline = pipeline
+        self.sock = None
+        self.connections = 0
+        self.lock = threading.RLock()
+        self.messageId = 0
+        self.encoder = JsonParser.Encoder()
+        self.decoder = JsonParser.Decoder()
+        self._rbuf = b''
+        self._reader = None
+        # futures of the pending requests by id, None if the connection
+        # has no reader or it stopped
+        self._pending = None
+        self._pending_lock = threading.Lock()
+
+
     def __exit__(self):
-      self.sock.close()
-      self.sock = None
-    
-    
+        self.close()
+
+
     def close(self):
-        self.sock.close()
+        if self.sock is not None:
+            # wakes up the reader, which fails the pending requests
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self.sock.close()
         self.sock = None
-        
+        self._rbuf = b''
+        self._reader = None
+
+
+    @property
+    def pipelined(self):
+        """True if the responses are received by the reader thread."""
+        return self._reader is not None
+
+
+    def connect(self):
+        """Connect to the server unless there is a usable connection."""
+        with self.lock:
+            if self.sock is not None:
+                if self._reader is None:
+                    if not self._dropped():
+                        return
+                elif self._pending is not None:
+                    return
+            self.close()
+            delay = self.backoff
+            for attempt in range(self.retries + 1):
+                try:
+                    sock = socket.create_connection((self.address, self.port),
+                            self.timeout)
+                    break
+                except socket.error:
+                    if attempt == self.retries:
+                        raise
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.max_backoff)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.sock = sock
+            self.connections += 1
+            if self.pipeline:
+                self._start_reader()
+
+
+    def _start_reader(self):
+        # the reader waits for responses as long as the connection is up
+        self.sock.settimeout(None)
+        self._pending = pending = {}
+        self._reader = threading.Thread(target=self._read_responses,
+                args=(self.sock, pending), name="jsonrpc-reader")
+        self._reader.daemon = True
+        self._reader.start()
+
+
+    def _read_responses(self, sock, pending):
+        f = sock.makefile("rb")
+        error = ConnectionLost("connection closed by server")
+        try:
+            while True:
+                header = f.read(HEADER_FIELD_LENGTH)
+                if len(header) < HEADER_FIELD_LENGTH:
+                    break
+                length = self.readHeader(header)
+                jsonResponse = f.read(length)
+                if len(jsonResponse) < length:
+                    break
+                response = self.decoder.default(jsonResponse)
+                with self._pending_lock:
+                    future = pending.pop(response.get("id"), None)
+                if future is not None:
+                    future.set_result(response)
+        except socket.error as e:
+            error = e
+        except ValueError as e:
+            error = ConnectionLost("invalid response: %s" % e)
+        finally:
+            f.close()
+        with self._pending_lock:
+            if self._pending is pending:
+                self._pending = None
+            futures = list(pending.values())
+            pending.clear()
+        for future in futures:
+            future.set_exception(error)
+
+
+    def _dropped(self):
+        # no response is pending on an idle connection, so if it is
+        # readable the server has closed it
+        try:
+            return bool(select.select([self.sock], [], [], 0)[0])
+        except (select.error, ValueError):
+            return True
+
+
     def makeHeader(self, value):
         return pack('>BI', TAG, value)
 
 
     def readHeader(self, header):
-        temp = unpack('>BI', header)
-        return temp[1]
-           
-      
+        (tag, length) = unpack('>BI', header)
+        if tag != TAG:
+            raise ConnectionLost('invalid tag %d in response' % tag)
+        return length
+
+
+    def _encode(self, methodName, params):
+        self.messageId = self.messageId+1
+        request = JsonRpcMsg.RequestObject(methodName, params, self.messageId)
+        jsonRequest = self.encoder.default(request)
+        # header and body in one segment, see TCP_NODELAY
+        return self.makeHeader(len(jsonRequest)) + jsonRequest
+
+
+    def submit(self, methodName, params):
+        """Send a request and return a :class:`concurrent.futures.Future`
+        for its response. Thread-safe.
+        """
+        future = concurrent.futures.Future()
+        # the request can't be taken back once it is sent
+        future.set_running_or_notify_cancel()
+        with self.lock:
+            self.connect()
+            if self._reader is None:
+                self._start_reader()
+            data = self._encode(methodName, params)
+            future.request_id = self.messageId
+            with self._pending_lock:
+                if self._pending is None:
+                    raise ConnectionLost("connection closed by server")
+                self._pending[self.messageId] = future
+            try:
+                self.sock.sendall(data)
+            except socket.error:
+                self.close()
+                raise
+        return future
+
+
+    def wait(self, future):
+        """Return the response of a request sent with :meth:`submit`,
+        waiting at most `timeout` seconds for it. After a timeout, a late
+        response to the request is ignored.
+        """
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            with self._pending_lock:
+                if self._pending is not None:
+                    self._pending.pop(future.request_id, None)
+            raise socket.timeout("timed out")
+
+
     def send_request(self, methodName, params):
-      header = []
-      self.messageId = self.messageId+1
-      request = JsonRpcMsg.RequestObject(methodName, params, self.messageId)
-      jsonRequest = self.encoder.default(request)
-      header = self.makeHeader(len(jsonRequest))
-      ret = self.sock.send(header)
-      if(ret < 0):
-        print "Could not send header over socket"
-      ret = self.sock.send(jsonRequest)
-      if(ret < 0):
-        print "Could not send data over socket"
-        
-      #Receive encoded message
-      jsonResponse = self.receiveEncodedMsg(self.sock)
-      response = self.decoder.default(jsonResponse)
-      return response
-      
+        with self.lock:
+            self.connect()
+            if self._reader is not None:
+                future = self.submit(methodName, params)
+            else:
+                return self._round_trip(methodName, params)
+        return self.wait(future)
+
+
+    def _round_trip(self, methodName, params):
+        try:
+            self.sock.sendall(self._encode(methodName, params))
+            jsonResponse = self.receiveEncodedMsg(self.sock)
+        except socket.error:
+            self.close()
+            raise
+        return self.decoder.default(jsonResponse)
+
+
+    def _recv_exactly(self, s, length):
+        data = self._rbuf
+        while len(data) < length:
+            chunk = s.recv(max(RECEIVEBUFFER_LENGTH, length - len(data)))
+            if not chunk:
+                raise ConnectionLost('connection closed by server')
+            data += chunk
+        self._rbuf = data[length:]
+        return data[:length]
+
+
     def receiveEncodedMsg(self, s):
-        data = s.recv(RECEIVEBUFFER_LENGTH)
-        header = self.readHeader(data[0:HEADER_FIELD_LENGTH])
-        while(header > len(data)+HEADER_FIELD_LENGTH):
-            temp = s.recv(RECEIVEBUFFER_LENGTH)	
-            data += temp
-        return data[HEADER_FIELD_LENGTH:header+HEADER_FIELD_LENGTH]
-      
\ No newline at end of file
+        length = self.readHeader(self._recv_exactly(s, HEADER_FIELD_LENGTH))
+        return self._recv_exactly(s, length)
@@ -16,24 +16,124 @@
 
 
 import array
+import collections
+import os
 import sys
 import socket
 
+from pyaardvark.constants import (CONFIG_QUERY, I2C_PULLUP_QUERY,
+        TARGET_POWER_QUERY)
+from pyaardvark.instrument import InstrumentedAPI
+
 remoteAddress = "127.0.0.1"
 remotePort = 1234
 
+# the server can also be given as "host[:port]" in the environment
+if os.environ.get("AARDVARK_SERVER"):
+    remoteAddress, _, _port = os.environ["AARDVARK_SERVER"].partition(":")
+    if _port:
+        remotePort = int(_port)
+
 
 from JsonRPCClient import *
 
+# methods whose last value is set again after reconnecting to the server,
+# mapped to their argument and the value of a mere query
+_SETTINGS = {
+    "Aardvark.aa_configure" : ("AardvarkConfig", CONFIG_QUERY),
+    "Aardvark.aa_target_power" : ("powerMask", TARGET_POWER_QUERY),
+    "Aardvark.aa_i2c_pullup" : ("pullup_mask", I2C_PULLUP_QUERY),
+    "Aardvark.aa_i2c_bitrate" : ("bitrate", 0),
+    "Aardvark.aa_spi_bitrate" : ("bitrate", 0),
+    "Aardvark.aa_spi_configure" : (None, None),
+    "Aardvark.aa_spi_master_ss_polarity" : (None, None),
+    "Aardvark.aa_gpio_direction" : (None, None),
+    "Aardvark.aa_gpio_pullup" : (None, None),
+}
+
+
+class _RemoteDevice(object):
+    """A device opened through the API, with what is needed to open it
+    again on a new connection."""
+    def __init__(self, port, handle, rpc):
+        self.port = port
+        self.handle = handle
+        self.rpc = rpc
+        self.connection = rpc.connections
+        self.settings = collections.OrderedDict()
+
+
 class RemoteAardvarkAPI(object):
+    """Drop-in replacement for the native API talking to a server.
+
+    `address` and `port` default to `remoteAddress` and `remotePort`. No
+    connection is made until the first call. If `pool` is true, each
+    opened device gets a connection of its own, so requests for
+    different adapters don't wait for each other. The remaining keyword
+    arguments are passed to :class:`JsonRPCClient`; with `pipeline=True`
+    threads sharing a connection can have requests pending at the same
+    time.
+
+    When a connection had to be made again, the devices which were open
+    on it are opened again and their settings are restored, so the
+    handles stay valid across a restart of the server.
+    """
+
+    def __init__(self, address=None, port=None, pool=False, **options):
+        self.address = address or remoteAddress
+        self.port = port or remotePort
+        self.pool = pool
+        self.options = options
+        self.rpc = JsonRPCClient(self.address, self.port, **options)
+        self._devices = {}
 
-    def __init__(self, port=0):
-        self.rpc = JsonRPCClient(remoteAddress, remotePort)
-        
     def __exit__(self):
+        self.close()
+
+    def close(self):
+        """Close all connections."""
+        for device in self._devices.values():
+            device.rpc.close()
         self.rpc.close()
-        
-        
+
+
+    def _reopen(self, device):
+        response = device.rpc.send_request("Aardvark.aa_open_ext",
+                {"port" : device.port})
+        handle = find_json_object("Aardvark", find_json_object("result",
+                response))
+        if handle <= 0:
+            raise IOError("could not open port %d again (%s)"
+                    % (device.port, aardvark.error_string(handle)))
+        device.handle = handle
+        device.connection = device.rpc.connections
+        for (method, params) in device.settings.items():
+            params["Aardvark"] = handle
+            device.rpc.send_request(method, params)
+
+
+    def _call(self, method, params):
+        device = self._devices.get(params.get("Aardvark"))
+        if device is None:
+            return self.rpc.send_request(method, params)
+        rpc = device.rpc
+        with rpc.lock:
+            rpc.connect()
+            if device.connection != rpc.connections:
+                self._reopen(device)
+            params["Aardvark"] = device.handle
+            if method in _SETTINGS:
+                (name, query) = _SETTINGS[method]
+                if name is None or params[name] != query:
+                    device.settings.pop(method, None)
+                    device.settings[method] = params
+            if not rpc.pipelined:
+                return rpc.send_request(method, params)
+            # don't keep other threads from sending while waiting
+            future = rpc.submit(method, params)
+        return rpc.wait(future)
+
+
     def getReturnCode(self, value):
         returnCode = find_json_object("result", value)
         return find_json_object("returnCode", returnCode)
@@ -59,10 +159,24 @@ class RemoteAardvarkAPI(object):
         params = {"port" : port}
         ret = 0
         
-        response = self.rpc.send_request("Aardvark.aa_open_ext", params)
+        if self.pool:
+            rpc = JsonRPCClient(self.address, self.port, **self.options)
+        else:
+            rpc = self.rpc
+        response = rpc.send_request("Aardvark.aa_open_ext", params)
         ver = []
         val = find_json_object("result", response)
         ret = find_json_object("Aardvark", val)
+        if ret > 0:
+            # after a reconnect the server may hand out a handle which is
+            # still in use here
+            handle = ret
+            while handle in self._devices:
+                handle += 1
+            self._devices[handle] = _RemoteDevice(port, ret, rpc)
+            ret = handle
+        elif self.pool:
+            rpc.close()
         val = find_json_object("AardvarkExt", val)
         val = find_json_object("AardvarkVersionValue", val)
         ver.append(find_json_object("software", val))
@@ -76,51 +190,94 @@ class RemoteAardvarkAPI(object):
         
     def py_aa_close(self, handle):
         """Close the device."""
-        params = {"Aardvark" : handle}
-        self.rpc.send_request("Aardvark.aa_close", params)
+        device = self._devices.pop(handle, None)
+        if device is None:
+            self.rpc.send_request("Aardvark.aa_close", {"Aardvark" : handle})
+            return None
+        # nothing to do if the server has already lost the device
+        if device.connection == device.rpc.connections:
+            device.rpc.send_request("Aardvark.aa_close",
+                    {"Aardvark" : device.handle})
+        if self.pool:
+            device.rpc.close()
         return None
         
         
     def py_aa_unique_id(self, handle):
         params = {"Aardvark" : handle}
-        response = self.rpc.send_request("Aardvark.aa_unique_id", params)
+        response = self._call("Aardvark.aa_unique_id", params)
         uniqueId = find_json_object("result", response)
         return uniqueId
         
         
     def py_aa_target_power(self, handle, value):
         params = {"Aardvark" : handle, "powerMask" : value}
-        response = self.rpc.send_request("Aardvark.aa_target_power", params)
+        response = self._call("Aardvark.aa_target_power", params)
         return self.getReturnCode(response)
         
         
     def py_aa_i2c_bitrate(self, handle, value):
         params = {"Aardvark" : handle, "bitrate" : value}
-        response = self.rpc.send_request("Aardvark.aa_i2c_bitrate", params)
+        response = self._call("Aardvark.aa_i2c_bitrate", params)
         return self.getReturnCode(response)
     
     
     def py_aa_i2c_slave_enable(self, handle, slave_addr, maxTxBytes, maxRxBytes):
         params = {"Aardvark" : handle, "slave_addr": slave_addr, "maxTxBytes": maxTxBytes, "maxRxBytes": maxRxBytes}
-        response = self.rpc.send_request("Aardvark.aa_i2c_slave_enable", params)
+        response = self._call("Aardvark.aa_i2c_slave_enable", params)
         return self.getReturnCode(response)
     
     
+    def py_aa_i2c_slave_disable(self, handle):
+        params = {"Aardvark" : handle}
+        response = self._call("Aardvark.aa_i2c_slave_disable", params)
+        return self.getReturnCode(response)
+
+
+    def py_aa_i2c_slave_set_response(self, handle, num_bytes, data_out):
+        params = {"Aardvark" : handle, "num_bytes": num_bytes, "data_out": list(data_out[:num_bytes])}
+        response = self._call("Aardvark.aa_i2c_slave_set_response", params)
+        return self.getReturnCode(response)
+
+
+    def py_aa_i2c_slave_write_stats(self, handle):
+        params = {"Aardvark" : handle}
+        response = self._call("Aardvark.aa_i2c_slave_write_stats", params)
+        return self.getReturnCode(response)
+
+
     def py_aa_i2c_pullup(self, handle, value):
         params = {"Aardvark" : handle, "pullup_mask": value}
-        response = self.rpc.send_request("Aardvark.aa_i2c_pullup", params)
+        response = self._call("Aardvark.aa_i2c_pullup", params)
         return self.getReturnCode(response)
         
         
-    def py_aa_i2c_write(self, handle, i2c_address, flags, len ,data):
-        params = {"Aardvark": handle, "slave_addr" : i2c_address, "AardvarkI2cFlags" : flags, "data_out": data.tolist()}
-        response = self.rpc.send_request("Aardvark.aa_i2c_write", params)
+    def py_aa_i2c_write(self, handle, i2c_address, flags, length, data):
+        params = {"Aardvark": handle, "slave_addr" : i2c_address, "AardvarkI2cFlags" : flags, "data_out": list(data[:length])}
+        response = self._call("Aardvark.aa_i2c_write", params)
         return self.getReturnCode(response)
         
         
+    def py_aa_i2c_write_ext(self, handle, i2c_address, flags, length, data):
+        params = {"Aardvark": handle, "slave_addr" : i2c_address, "AardvarkI2cFlags" : flags, "data_out": list(data[:length])}
+        response = self._call("Aardvark.aa_i2c_write_ext", params)
+        val = find_json_object("result", response)
+        return find_json_object("returnCode", val), find_json_object("num_written", val)
+        
+        
+    def py_aa_i2c_read_ext(self, handle, addr, flags, length, data):
+        params = {"Aardvark": handle, "slave_addr": addr, "AardvarkI2cFlags" : flags, "num_bytes": length}
+        response = self._call("Aardvark.aa_i2c_read_ext", params)
+        val = find_json_object("result", response)
+        data2 = find_json_object("data_in", val)
+        for i in range(min(len(data2), length)):
+            data[i] = data2[i]
+        return find_json_object("returnCode", val), find_json_object("num_read", val)
+        
+        
     def py_aa_i2c_read(self, handle, addr, flags, length, data):
         params = {"Aardvark": handle, "slave_addr": addr, "AardvarkI2cFlags" : flags, "num_bytes": length}
-        response = self.rpc.send_request("Aardvark.aa_i2c_read", params)
+        response = self._call("Aardvark.aa_i2c_read", params)
         val = find_json_object("result", response)
         returnCode = find_json_object("returnCode", val)
         data2 = find_json_object("data_in", val)
@@ -134,61 +291,195 @@ class RemoteAardvarkAPI(object):
         
     def py_aa_i2c_slave_read(self, handle, data_length, data):
         params = {"Aardvark": handle, "num_bytes": data_length}
-        response = self.rpc.send_request("Aardvark.aa_i2c_slave_read", params)
+        response = self._call("Aardvark.aa_i2c_slave_read", params)
         val = find_json_object("result", response)
         address = find_json_object("slave_addr", val)
         data2 = find_json_object("data_in", val)
         
         if(len(data2) <= data_length):
-            for i in range(data_length):
+            for i in range(len(data2)):
                 data[i] = data2[i]
         
-        return getReturnCode(val), address
+        return find_json_object("returnCode", val), address
     
         
+    def py_aa_i2c_monitor_enable(self, handle):
+        params = {"Aardvark" : handle}
+        response = self._call("Aardvark.aa_i2c_monitor_enable", params)
+        return self.getReturnCode(response)
+
+
+    def py_aa_i2c_monitor_disable(self, handle):
+        params = {"Aardvark" : handle}
+        response = self._call("Aardvark.aa_i2c_monitor_disable", params)
+        return self.getReturnCode(response)
+
+
+    def py_aa_i2c_monitor_read(self, handle, num_words, data):
+        params = {"Aardvark" : handle, "num_bytes": num_words}
+        response = self._call("Aardvark.aa_i2c_monitor_read", params)
+        val = find_json_object("result", response)
+        returnCode = find_json_object("returnCode", val)
+        data2 = find_json_object("data_in", val)
+        if(len(data2) <= num_words):
+            for i in range(len(data2)):
+                data[i] = data2[i]
+        else:
+            returnCode = -1
+        return returnCode
+
+
     def py_aa_configure(self, handle, value):
         params = {"Aardvark" : handle, "AardvarkConfig" : value}
-        response = self.rpc.send_request("Aardvark.aa_configure", params)
+        response = self._call("Aardvark.aa_configure", params)
         return self.getReturnCode(response)
         
         
     def py_aa_spi_configure(self, handle, polarity, phase, bitorder):
         params = {"Aardvark": handle, "polarity": polarity, "phase": phase, "bitorder": bitorder}
-        response = self.rpc.send_request("Aardvark.aa_spi_configure", params)
+        response = self._call("Aardvark.aa_spi_configure", params)
         return self.getReturnCode(response)
         
         
     def py_aa_spi_bitrate(self, handle, value):
         params = {"Aardvark" : handle, "bitrate" : value}
-        response = self.rpc.send_request("Aardvark.aa_spi_bitrate", params)
+        response = self._call("Aardvark.aa_spi_bitrate", params)
         return self.getReturnCode(response)
         
         
     def py_aa_async_poll(self, handle, timeout):
         params = {"Aardvark" : handle, "timeout": timeout}
-        response = self.rpc.send_request("Aardvark.aa_async_poll", params)
+        response = self._call("Aardvark.aa_async_poll", params)
         return self.getReturnCode(response)
         
         
     def py_aa_spi_master_ss_polarity(self, handle, polarity):
         params = {"Aardvark" : handle, "polarity": polarity}
-        response = self.rpc.send_request("Aardvark.aa_spi_master_ss_polarity", params)
+        response = self._call("Aardvark.aa_spi_master_ss_polarity", params)
         return self.getReturnCode(response)
         
         
+    def py_aa_spi_slave_enable(self, handle):
+        params = {"Aardvark" : handle}
+        response = self._call("Aardvark.aa_spi_slave_enable", params)
+        return self.getReturnCode(response)
+
+
+    def py_aa_spi_slave_disable(self, handle):
+        params = {"Aardvark" : handle}
+        response = self._call("Aardvark.aa_spi_slave_disable", params)
+        return self.getReturnCode(response)
+
+
+    def py_aa_spi_slave_set_response(self, handle, num_bytes, data_out):
+        params = {"Aardvark" : handle, "num_bytes": num_bytes, "data_out": list(data_out[:num_bytes])}
+        response = self._call("Aardvark.aa_spi_slave_set_response", params)
+        return self.getReturnCode(response)
+
+
+    def py_aa_spi_slave_read(self, handle, num_bytes, data):
+        params = {"Aardvark" : handle, "num_bytes": num_bytes}
+        response = self._call("Aardvark.aa_spi_slave_read", params)
+        val = find_json_object("result", response)
+        returnCode = find_json_object("returnCode", val)
+        data2 = find_json_object("data_in", val)
+        if(len(data2) <= num_bytes):
+            for i in range(len(data2)):
+                data[i] = data2[i]
+        else:
+            returnCode = -1
+        return returnCode
+
+
     def py_aa_spi_write(self, handle, length_out, data_out, length_in, data_in):
-        params = {"Aardvark": handle, "num_bytes" : num_bytes, "data_out" : data_out}
-        response = self.rpc.send_request("Aardvark.aa_spi_write", params)
+        params = {"Aardvark": handle, "num_bytes" : length_out, "data_out" : list(data_out[:length_out])}
+        response = self._call("Aardvark.aa_spi_write", params)
         val = find_json_object("result", response)
-        data2_in = find_json_object("data_in", val)
+        returnCode = find_json_object("returnCode", val)
+        data2 = find_json_object("data_in", val)
         if(len(data2) <= length_in):
-            for i in range(length_in):
+            for i in range(len(data2)):
                 data_in[i] = data2[i]
         else:
             returnCode = -1
         return returnCode
 
 
+    def py_aa_gpio_direction(self, handle, direction_mask):
+        params = {"Aardvark": handle, "direction_mask": direction_mask}
+        response = self._call("Aardvark.aa_gpio_direction", params)
+        return self.getReturnCode(response)
+        
+        
+    def py_aa_gpio_pullup(self, handle, pullup_mask):
+        params = {"Aardvark": handle, "pullup_mask": pullup_mask}
+        response = self._call("Aardvark.aa_gpio_pullup", params)
+        return self.getReturnCode(response)
+        
+        
+    def py_aa_gpio_get(self, handle):
+        params = {"Aardvark": handle}
+        response = self._call("Aardvark.aa_gpio_get", params)
+        return self.getReturnCode(response)
+        
+        
+    def py_aa_gpio_set(self, handle, value):
+        params = {"Aardvark": handle, "value": value}
+        response = self._call("Aardvark.aa_gpio_set", params)
+        return self.getReturnCode(response)
+        
+        
+    def py_aa_gpio_change(self, handle, timeout):
+        params = {"Aardvark": handle, "timeout": timeout}
+        response = self._call("Aardvark.aa_gpio_change", params)
+        return self.getReturnCode(response)
+        
+        
+    def py_aa_batch(self, handle, ops, stop_on_error):
+        operations = []
+        for (kind, addr, flags, data_out, length) in ops:
+            op = {"op" : kind, "num_bytes" : length}
+            if addr is not None:
+                op["slave_addr"] = addr
+                op["AardvarkI2cFlags"] = flags
+            elif kind == "gpio_set":
+                op["value"] = flags
+            if data_out is not None:
+                op["data_out"] = list(data_out)
+            operations.append(op)
+        params = {"Aardvark" : handle, "operations" : operations, "stop_on_error" : stop_on_error}
+        response = self._call("Aardvark.aa_batch", params)
+        val = find_json_object("result", response)
+        results = [(None, None)] * len(ops)
+        for i, res in enumerate(find_json_object("results", val)):
+            results[i] = (res["returnCode"], res.get("data_in"))
+        return results
+
+
+def configure(address=None, port=None, pool=False, **options):
+    """Make pyaardvark use the server at `address` and `port`. See
+    :class:`RemoteAardvarkAPI` for the arguments. Returns the new API
+    object.
+
+    Importing this module installs an API with the default settings, call
+    this before the first device is opened to use another server. If
+    instrumentation is enabled, the new API is instrumented as well.
+    """
+    current = aardvark.api
+    instrumentation = None
+    if isinstance(current, InstrumentedAPI):
+        instrumentation = current._instrumentation
+        current = current._api
+    if isinstance(current, RemoteAardvarkAPI):
+        current.close()
+    api = RemoteAardvarkAPI(address, port, pool, **options)
+    if instrumentation is not None:
+        aardvark.api = InstrumentedAPI(api, instrumentation)
+    else:
+        aardvark.api = api
+    return api
+
+
 from pyaardvark import *
 aardvark.api = RemoteAardvarkAPI()
 from pyaardvark import open, find_devices
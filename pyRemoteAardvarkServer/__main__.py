@@ -0,0 +1,69 @@
+# Copyright (c) 2015  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+from __future__ import print_function
+import argparse
+import json
+import logging
+
+from .server import AardvarkServer, asyncio
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+            description='JSON-RPC server for pyRemoteAardvark clients.')
+    parser.add_argument('-v', action='store_true', dest='verbose',
+            help='be more verbose')
+    parser.add_argument('--host', default='127.0.0.1',
+            help='address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=1234,
+            help='port to listen on (default: %(default)s)')
+    parser.add_argument('--sim', type=int, metavar='NUM_DEVICES',
+            help='serve simulated devices instead of the attached ones')
+    parser.add_argument('--stats-interval', type=float, metavar='SECONDS',
+            help='log the counters periodically')
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO if args.verbose
+            else logging.WARNING)
+
+    api = None
+    if args.sim is not None:
+        from pyaardvark.sim import SimulatedAPI
+        api = SimulatedAPI(num_devices=args.sim)
+
+    loop = asyncio.get_event_loop()
+    server = AardvarkServer(api, loop)
+    loop.run_until_complete(server.start(args.host, args.port))
+    logging.getLogger(__name__).info('listening on %s:%d', args.host,
+            server.port)
+
+    if args.stats_interval:
+        def log_stats():
+            logging.getLogger(__name__).info('%s',
+                    json.dumps(server.stats(), sort_keys=True))
+            loop.call_later(args.stats_interval, log_stats)
+        loop.call_later(args.stats_interval, log_stats)
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        loop.close()
+
+if __name__ == '__main__':
+    main()
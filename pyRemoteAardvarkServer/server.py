@@ -0,0 +1,603 @@
+# Copyright (c) 2015  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""JSON-RPC server for pyRemoteAardvark.
+
+The server speaks the protocol of
+:class:`pyRemoteAardvark.RemoteAardvarkAPI`: every message is a JSON-RPC 2.0
+object prefixed by a five byte header (the tag 93 and the length as a big
+endian 32 bit number). The methods ``Aardvark.aa_*`` call the functions of
+the binary API of pyaardvark or of any object implementing it (eg.
+:class:`pyaardvark.sim.SimulatedAPI`).
+
+Any number of clients are served by one event loop. The calls of each device
+are executed by a worker with its own thread. If several clients use the
+same device, their requests are queued per client and executed round robin,
+so a busy client can't starve the others.
+"""
+
+import array
+import collections
+import json
+import logging
+import socket
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from pyaardvark import aardvark
+from pyaardvark.constants import *
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+log = logging.getLogger(__name__)
+
+TAG = 93
+HEADER = struct.Struct('>BI')
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+class RPCError(Exception):
+    def __init__(self, code, message):
+        super(RPCError, self).__init__(message)
+        self.code = code
+
+class _Counter(object):
+    __slots__ = ('total', 'max')
+
+    def __init__(self):
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+class WorkerStats(object):
+    """Counters of a :class:`DeviceWorker`. `queue_wait` is the time the
+    requests spent waiting for the device, `device_time` the time the calls
+    took.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.queue_wait = _Counter()
+        self.device_time = _Counter()
+
+    def as_dict(self):
+        n = self.requests
+        return dict(
+                requests=n,
+                errors=self.errors,
+                max_queue_depth=self.max_queue_depth,
+                queue_wait_total=self.queue_wait.total,
+                queue_wait_mean=self.queue_wait.total / n if n else 0.0,
+                queue_wait_max=self.queue_wait.max,
+                device_time_total=self.device_time.total,
+                device_time_mean=self.device_time.total / n if n else 0.0,
+                device_time_max=self.device_time.max,
+        )
+
+def _timed(times, func, args):
+    # the start and end are recorded even if the call fails
+    times.append(time.time())
+    try:
+        return func(*args)
+    finally:
+        times.append(time.time())
+
+class DeviceWorker(object):
+    """Executes calls in a dedicated thread, one at a time.
+
+    Calls are queued per client. Whenever the thread is idle, the next call
+    is taken from the queue of the next client in turn.
+    """
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._queues = collections.OrderedDict()
+        self._pending = 0
+        self._busy = False
+        self.stats = WorkerStats()
+
+    def submit(self, client, func, *args):
+        """Queue `func(*args)` for `client` and return a future."""
+        future = asyncio.Future(loop=self._loop)
+        queue = self._queues.get(client)
+        if queue is None:
+            queue = self._queues[client] = collections.deque()
+        queue.append((func, args, future, time.time()))
+        self._pending += 1
+        if self._pending > self.stats.max_queue_depth:
+            self.stats.max_queue_depth = self._pending
+        self._next()
+        return future
+
+    def _next(self):
+        if self._busy or not self._queues:
+            return
+        # take the first client and move it to the end of the line
+        (client, queue) = next(iter(self._queues.items()))
+        (func, args, future, queued) = queue.popleft()
+        del self._queues[client]
+        if queue:
+            self._queues[client] = queue
+        self._pending -= 1
+        if future.cancelled():
+            self._next()
+            return
+        self._busy = True
+        times = []
+        call = self._loop.run_in_executor(self._executor, _timed, times,
+                func, args)
+        call.add_done_callback(lambda f: self._done(f, future, queued, times))
+
+    def _done(self, call, future, queued, times):
+        self._busy = False
+        stats = self.stats
+        stats.requests += 1
+        if len(times) == 2:
+            (start, end) = times
+            stats.queue_wait.add(start - queued)
+            stats.device_time.add(end - start)
+        exc = call.exception()
+        if exc is not None:
+            stats.errors += 1
+            if not future.cancelled():
+                future.set_exception(exc)
+        elif not future.cancelled():
+            future.set_result(call.result())
+        self._next()
+
+    def discard(self, client):
+        """Drop the pending calls of `client`."""
+        queue = self._queues.pop(client, ())
+        for (_, _, future, _) in queue:
+            future.cancel()
+        self._pending -= len(queue)
+
+    def shutdown(self):
+        for client in list(self._queues):
+            self.discard(client)
+        self._executor.shutdown(wait=False)
+
+def _buffer(data):
+    return array.array('B', data)
+
+def _zeros(length):
+    return array.array('B', b'\x00') * length
+
+def _data_in(buf, ret):
+    return buf[:max(ret, 0)].tolist()
+
+def _version(ver):
+    names = ('software', 'firmware', 'hardware', 'sw_req_by_fw',
+            'fw_req_by_sw', 'api_req_by_sw')
+    return dict(zip(names, ver))
+
+# The functions below implement the Aardvark.aa_* methods. They are called
+# in the thread of the worker with the API and the parameters of the
+# request and return the result object.
+
+def _return_code(name, *params):
+    def method(api, p):
+        return dict(returnCode=getattr(api, name)(p['Aardvark'],
+                *[p[param] for param in params]))
+    return method
+
+def _find_devices(api, p):
+    # the client expects the complete list, regardless of num_devices
+    num = max(0, api.py_aa_find_devices(0, array.array('H')))
+    devices = array.array('H', (0,) * num)
+    ret = api.py_aa_find_devices(num, devices)
+    return dict(num_devices=ret, devices=devices[:max(0, min(ret, num))]
+            .tolist())
+
+def _find_devices_ext(api, p):
+    num = max(0, api.py_aa_find_devices_ext(0, 0, array.array('H'),
+            array.array('I')))
+    devices = array.array('H', (0,) * num)
+    unique_ids = array.array('I', (0,) * num)
+    ret = api.py_aa_find_devices_ext(num, num, devices, unique_ids)
+    n = max(0, min(ret, num))
+    return dict(num_devices=ret, devices=devices[:n].tolist(),
+            unique_ids=unique_ids[:n].tolist())
+
+def _open_ext(api, p):
+    (handle, ver) = api.py_aa_open_ext(p['port'])
+    return dict(Aardvark=handle,
+            AardvarkExt=dict(AardvarkVersionValue=_version(ver)))
+
+def _close(api, p):
+    return dict(returnCode=api.py_aa_close(p['Aardvark']))
+
+def _unique_id(api, p):
+    return api.py_aa_unique_id(p['Aardvark'])
+
+def _i2c_write(api, p):
+    data = _buffer(p['data_out'])
+    return dict(returnCode=api.py_aa_i2c_write(p['Aardvark'],
+            p['slave_addr'], p['AardvarkI2cFlags'], len(data), data))
+
+def _i2c_write_ext(api, p):
+    data = _buffer(p['data_out'])
+    (ret, num_written) = api.py_aa_i2c_write_ext(p['Aardvark'],
+            p['slave_addr'], p['AardvarkI2cFlags'], len(data), data)
+    return dict(returnCode=ret, num_written=num_written)
+
+def _i2c_read(api, p):
+    data = _zeros(p['num_bytes'])
+    ret = api.py_aa_i2c_read(p['Aardvark'], p['slave_addr'],
+            p['AardvarkI2cFlags'], len(data), data)
+    return dict(returnCode=ret, data_in=_data_in(data, ret))
+
+def _i2c_read_ext(api, p):
+    data = _zeros(p['num_bytes'])
+    (ret, num_read) = api.py_aa_i2c_read_ext(p['Aardvark'], p['slave_addr'],
+            p['AardvarkI2cFlags'], len(data), data)
+    return dict(returnCode=ret, num_read=num_read,
+            data_in=data[:num_read].tolist())
+
+def _i2c_slave_set_response(api, p):
+    data = _buffer(p['data_out'])
+    return dict(returnCode=api.py_aa_i2c_slave_set_response(p['Aardvark'],
+            len(data), data))
+
+def _i2c_slave_read(api, p):
+    data = _zeros(p['num_bytes'])
+    (ret, slave_addr) = api.py_aa_i2c_slave_read(p['Aardvark'], len(data),
+            data)
+    return dict(returnCode=ret, slave_addr=slave_addr,
+            data_in=_data_in(data, ret))
+
+def _i2c_monitor_read(api, p):
+    data = array.array('H', (0,) * p['num_bytes'])
+    ret = api.py_aa_i2c_monitor_read(p['Aardvark'], len(data), data)
+    return dict(returnCode=ret, data_in=_data_in(data, ret))
+
+def _spi_write(api, p):
+    data_out = _buffer(p['data_out'])
+    data_in = _zeros(len(data_out))
+    ret = api.py_aa_spi_write(p['Aardvark'], len(data_out), data_out,
+            len(data_in), data_in)
+    return dict(returnCode=ret, data_in=_data_in(data_in, ret))
+
+def _spi_slave_set_response(api, p):
+    data = _buffer(p['data_out'])
+    return dict(returnCode=api.py_aa_spi_slave_set_response(p['Aardvark'],
+            len(data), data))
+
+def _spi_slave_read(api, p):
+    data = _zeros(p['num_bytes'])
+    ret = api.py_aa_spi_slave_read(p['Aardvark'], len(data), data)
+    return dict(returnCode=ret, data_in=_data_in(data, ret))
+
+def _batch(api, p):
+    handle = p['Aardvark']
+    stop_on_error = p.get('stop_on_error', True)
+    results = []
+    for op in p['operations']:
+        kind = op['op']
+        length = op.get('num_bytes', 0)
+        data_in = None
+        if kind == 'i2c_write':
+            data = _buffer(op['data_out'])
+            ret = api.py_aa_i2c_write(handle, op['slave_addr'],
+                    op['AardvarkI2cFlags'], len(data), data)
+        elif kind in ('i2c_read', 'i2c_write_read'):
+            ret = 0
+            if kind == 'i2c_write_read':
+                data = _buffer(op['data_out'])
+                ret = api.py_aa_i2c_write(handle, op['slave_addr'],
+                        I2C_NO_STOP, len(data), data)
+            if ret >= 0:
+                buf = _zeros(length)
+                ret = api.py_aa_i2c_read(handle, op['slave_addr'],
+                        op['AardvarkI2cFlags'], length, buf)
+                data_in = _data_in(buf, ret)
+        elif kind == 'spi':
+            data = _buffer(op['data_out'])
+            buf = _zeros(len(data))
+            ret = api.py_aa_spi_write(handle, len(data), data, len(buf), buf)
+            data_in = _data_in(buf, ret)
+        elif kind == 'delay':
+            time.sleep(length / 1000.0)
+            ret = 0
+        elif kind == 'gpio_set':
+            ret = api.py_aa_gpio_set(handle, op['value'])
+        elif kind == 'gpio_get':
+            ret = api.py_aa_gpio_get(handle)
+        else:
+            raise RPCError(INVALID_PARAMS, 'unknown operation %r' % (kind,))
+        result = dict(returnCode=ret)
+        if data_in is not None and ret >= 0:
+            result['data_in'] = data_in
+        results.append(result)
+        if ret < 0 and stop_on_error:
+            break
+    return dict(results=results)
+
+#: Implementations of the ``Aardvark.*`` methods, which are executed by the
+#: worker of the device given by the `Aardvark` parameter.
+DEVICE_METHODS = {
+    'aa_close': _close,
+    'aa_unique_id': _unique_id,
+    'aa_configure': _return_code('py_aa_configure', 'AardvarkConfig'),
+    'aa_target_power': _return_code('py_aa_target_power', 'powerMask'),
+    'aa_async_poll': _return_code('py_aa_async_poll', 'timeout'),
+    'aa_i2c_bitrate': _return_code('py_aa_i2c_bitrate', 'bitrate'),
+    'aa_i2c_pullup': _return_code('py_aa_i2c_pullup', 'pullup_mask'),
+    'aa_i2c_write': _i2c_write,
+    'aa_i2c_write_ext': _i2c_write_ext,
+    'aa_i2c_read': _i2c_read,
+    'aa_i2c_read_ext': _i2c_read_ext,
+    'aa_i2c_slave_enable': _return_code('py_aa_i2c_slave_enable',
+        'slave_addr', 'maxTxBytes', 'maxRxBytes'),
+    'aa_i2c_slave_disable': _return_code('py_aa_i2c_slave_disable'),
+    'aa_i2c_slave_set_response': _i2c_slave_set_response,
+    'aa_i2c_slave_write_stats': _return_code('py_aa_i2c_slave_write_stats'),
+    'aa_i2c_slave_read': _i2c_slave_read,
+    'aa_i2c_monitor_enable': _return_code('py_aa_i2c_monitor_enable'),
+    'aa_i2c_monitor_disable': _return_code('py_aa_i2c_monitor_disable'),
+    'aa_i2c_monitor_read': _i2c_monitor_read,
+    'aa_spi_configure': _return_code('py_aa_spi_configure', 'polarity',
+        'phase', 'bitorder'),
+    'aa_spi_bitrate': _return_code('py_aa_spi_bitrate', 'bitrate'),
+    'aa_spi_master_ss_polarity': _return_code(
+        'py_aa_spi_master_ss_polarity', 'polarity'),
+    'aa_spi_write': _spi_write,
+    'aa_spi_slave_enable': _return_code('py_aa_spi_slave_enable'),
+    'aa_spi_slave_disable': _return_code('py_aa_spi_slave_disable'),
+    'aa_spi_slave_set_response': _spi_slave_set_response,
+    'aa_spi_slave_read': _spi_slave_read,
+    'aa_gpio_direction': _return_code('py_aa_gpio_direction',
+        'direction_mask'),
+    'aa_gpio_pullup': _return_code('py_aa_gpio_pullup', 'pullup_mask'),
+    'aa_gpio_get': _return_code('py_aa_gpio_get'),
+    'aa_gpio_set': _return_code('py_aa_gpio_set', 'value'),
+    'aa_gpio_change': _return_code('py_aa_gpio_change', 'timeout'),
+    'aa_batch': _batch,
+}
+
+#: Methods without a device handle, executed by the global worker.
+GLOBAL_METHODS = {
+    'aa_find_devices': _find_devices,
+    'aa_find_devices_ext': _find_devices_ext,
+    'aa_open_ext': _open_ext,
+}
+
+class _Protocol(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self._buffer = bytearray()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        sock = transport.get_extra_info('socket')
+        if sock is not None:
+            # responses are written with a single call, don't wait for
+            # more data
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server._connection_made(self)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.server._connection_lost(self)
+
+    def data_received(self, data):
+        buf = self._buffer
+        buf += data
+        pos = 0
+        while len(buf) - pos >= HEADER.size:
+            (tag, length) = HEADER.unpack_from(buf, pos)
+            if tag != TAG:
+                log.warning('bad tag %d, closing connection', tag)
+                self.transport.close()
+                return
+            end = pos + HEADER.size + length
+            if len(buf) < end:
+                break
+            self._request(bytes(buf[pos + HEADER.size:end]))
+            pos = end
+        del buf[:pos]
+
+    def _request(self, body):
+        try:
+            request = json.loads(body.decode('utf-8'))
+        except ValueError:
+            self.send(dict(jsonrpc='2.0', id=None,
+                    error=dict(code=PARSE_ERROR, message='Parse error')))
+            return
+        future = self.server.call(self, request)
+        future.add_done_callback(
+                lambda f: self._respond(request, f))
+
+    def _respond(self, request, future):
+        if future.cancelled():
+            return
+        response = dict(jsonrpc='2.0', id=request.get('id'))
+        exc = future.exception()
+        if exc is None:
+            response['result'] = future.result()
+        elif isinstance(exc, RPCError):
+            response['error'] = dict(code=exc.code, message=str(exc))
+        elif isinstance(exc, (KeyError, TypeError, ValueError)):
+            response['error'] = dict(code=INVALID_PARAMS,
+                    message='%s: %s' % (type(exc).__name__, exc))
+        else:
+            log.error('%s failed: %r', request.get('method'), exc)
+            response['error'] = dict(code=INTERNAL_ERROR, message=str(exc))
+        self.send(response)
+
+    def send(self, response):
+        if self.transport is None:
+            return
+        body = json.dumps(response).encode('utf-8')
+        self.transport.write(HEADER.pack(TAG, len(body)) + body)
+
+class AardvarkServer(object):
+    """Serves the Aardvark API to pyRemoteAardvark clients.
+
+    `api` is the object implementing the ``py_aa_*`` functions, by default
+    the binary API of :mod:`pyaardvark.aardvark` is used.
+
+    Devices opened by a client are closed when its connection is lost.
+    """
+
+    def __init__(self, api=None, loop=None):
+        self.api = api
+        self.loop = loop or asyncio.get_event_loop()
+        self.clients = set()
+        self._global = DeviceWorker(self.loop)
+        # handle -> (worker, client which opened the device)
+        self._devices = {}
+        self._server = None
+
+    def _api(self):
+        return self.api if self.api is not None else aardvark.api
+
+    def start(self, host='127.0.0.1', port=1234):
+        """Start listening. Returns a future, which is done when the server
+        is ready.
+        """
+        future = asyncio.ensure_future(self.loop.create_server(
+                lambda: _Protocol(self), host, port), loop=self.loop)
+
+        def started(f):
+            if f.exception() is None:
+                self._server = f.result()
+        future.add_done_callback(started)
+        return future
+
+    @property
+    def port(self):
+        """Port the server listens on, eg. if it was started with port 0."""
+        return self._server.sockets[0].getsockname()[1]
+
+    def close(self):
+        """Stop listening and close all devices."""
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for client in list(self.clients):
+            if client.transport is not None:
+                client.transport.close()
+        for handle in list(self._devices):
+            self._close_device(handle)
+        self._global.shutdown()
+
+    def stats(self):
+        """Return the counters of the workers as a dictionary with the keys
+        ``global`` and ``devices``, the latter mapping the handles of the
+        open devices to their counters, see :class:`WorkerStats`.
+        """
+        stats = dict(clients=len(self.clients),
+                devices=dict((handle, worker.stats.as_dict())
+                    for (handle, (worker, _)) in self._devices.items()))
+        stats['global'] = self._global.stats.as_dict()
+        return stats
+
+    def _connection_made(self, client):
+        self.clients.add(client)
+
+    def _connection_lost(self, client):
+        self.clients.discard(client)
+        self._global.discard(client)
+        for (handle, (worker, owner)) in list(self._devices.items()):
+            worker.discard(client)
+            if owner is client:
+                log.info('closing device %d of a lost client', handle)
+                api = self._api()
+                worker.submit(None, api.py_aa_close, handle).add_done_callback(
+                        lambda f, handle=handle: self._close_device(handle))
+
+    def _close_device(self, handle):
+        entry = self._devices.pop(handle, None)
+        if entry is not None:
+            entry[0].shutdown()
+
+    def call(self, client, request):
+        """Execute the JSON-RPC `request` of `client` and return a future
+        of the result object.
+        """
+        method = request.get('method')
+        params = request.get('params') or {}
+        if not isinstance(method, string_types) \
+                or not isinstance(params, dict):
+            return self._failed(RPCError(INVALID_REQUEST, 'Invalid request'))
+        (prefix, _, name) = method.partition('.')
+
+        if prefix == 'Server' and name == 'stats':
+            future = asyncio.Future(loop=self.loop)
+            future.set_result(self.stats())
+            return future
+        if prefix != 'Aardvark' or name not in GLOBAL_METHODS \
+                and name not in DEVICE_METHODS:
+            return self._failed(RPCError(METHOD_NOT_FOUND,
+                    'Method not found: %s' % method))
+
+        api = self._api()
+        if name in GLOBAL_METHODS:
+            future = self._global.submit(client, GLOBAL_METHODS[name], api,
+                    params)
+            if name == 'aa_open_ext':
+                future.add_done_callback(
+                        lambda f: self._opened(client, f))
+            return future
+
+        entry = self._devices.get(params.get('Aardvark'))
+        if entry is None:
+            # not opened through this server
+            future = asyncio.Future(loop=self.loop)
+            future.set_result(0 if name == 'aa_unique_id'
+                    else dict(returnCode=ERR_INVALID_HANDLE))
+            return future
+        (worker, _) = entry
+        future = worker.submit(client, DEVICE_METHODS[name], api, params)
+        if name == 'aa_close':
+            handle = params['Aardvark']
+            future.add_done_callback(lambda f: self._close_device(handle))
+        return future
+
+    def _failed(self, exc):
+        future = asyncio.Future(loop=self.loop)
+        future.set_exception(exc)
+        return future
+
+    def _opened(self, client, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        handle = future.result()['Aardvark']
+        if handle > 0:
+            self._devices[handle] = (DeviceWorker(self.loop), client)
@@ -20,4 +20,6 @@ except ImportError:
     __version__ = 'dev'
 
 from .aardvark import find_devices, open, Aardvark
+from .pool import DevicePool
+from .discovery import DeviceIndex
 from .constants import *
@@ -16,10 +16,12 @@
 
 import time
 import array
+import collections
 import logging
 import sys
 
 from .constants import *
+from .buffers import BufferPool, PooledBuffer
 
 if sys.platform.startswith('linux'):
     try:
@@ -47,6 +49,31 @@ if not api:
           
 log = logging.getLogger(__name__)
 
+def enable_instrumentation(instrumentation=None, backend=None):
+    """Record statistics of all calls to the API, see
+    :class:`pyaardvark.instrument.Instrumentation`, and return the
+    instrumentation object.
+
+    The currently active API is wrapped, ie. if the remote API is used, it
+    has to be set up before. `backend` is the name under which the calls are
+    recorded (default: ``'native'`` for the binary library or the class name
+    of the API object).
+    """
+    global api
+    from .instrument import Instrumentation, InstrumentedAPI
+    disable_instrumentation()
+    if instrumentation is None:
+        instrumentation = Instrumentation()
+    api = InstrumentedAPI(api, instrumentation, backend)
+    return instrumentation
+
+def disable_instrumentation():
+    """Call the API directly again."""
+    global api
+    from .instrument import InstrumentedAPI
+    if isinstance(api, InstrumentedAPI):
+        api = api._api
+
 def error_string(error_number):
     for k, v in globals().items():
         if k.startswith('ERR_') and v == error_number:
@@ -54,12 +81,125 @@ def error_string(error_number):
     else:
         return 'ERR_UNKNOWN_ERROR'
 
+def i2c_status_string(status):
+    for k, v in globals().items():
+        if k.startswith('I2C_STATUS_') and v == status:
+            return k
+    else:
+        return 'I2C_STATUS_UNKNOWN'
+
 def _raise_error_if_negative(val):
     if val < 0:
         raise IOError(error_string(val))
 
+def _zeros(length):
+    return array.array('B', b'\x00') * length
+
+def _to_buffer(data):
+    """Return `data` in a form which can be passed to the API. `bytearray`
+    objects and byte arrays (typecode ``'B'``) are returned as is. Buffer
+    objects like `memoryview` and arrays of other types are copied into a
+    `bytearray`, everything else into a new byte array.
+    """
+    if isinstance(data, bytearray):
+        return data
+    if isinstance(data, array.array):
+        if data.typecode == 'B':
+            return data
+        # the API counts bytes, not items
+        return bytearray(data.tostring())
+    if isinstance(data, memoryview):
+        return bytearray(data)
+    return array.array('B', data)
+
+def _writable_buffer(buf):
+    """Return a buffer the API can write into. If `buf` can't be used
+    directly (eg. a `memoryview`), a temporary array is returned and the
+    caller has to copy the data back.
+    """
+    if isinstance(buf, (bytearray, array.array)):
+        return buf
+    return _zeros(len(buf))
+
+BATCH_I2C_WRITE = 'i2c_write'
+BATCH_I2C_READ = 'i2c_read'
+BATCH_I2C_WRITE_READ = 'i2c_write_read'
+BATCH_SPI = 'spi'
+BATCH_DELAY = 'delay'
+BATCH_GPIO_SET = 'gpio_set'
+BATCH_GPIO_GET = 'gpio_get'
+
+#: Result of a single operation of :meth:`Aardvark.batch`. `status` is the
+#: return code of the underlying API call (negative on error, `None` if the
+#: operation was skipped) and `data` the bytes read or `None`.
+BatchResult = collections.namedtuple('BatchResult', 'status data')
+
+def _compile_batch(ops):
+    """Convert the user supplied operations into a list of uniform tuples
+    `(kind, addr, flags, data_out, length)`. All write buffers are built
+    here, so nothing has to be allocated while the batch is running.
+    """
+    compiled = []
+    for op in ops:
+        kind = op[0]
+        if kind == BATCH_I2C_WRITE:
+            flags = op[3] if len(op) > 3 else I2C_NO_FLAGS
+            compiled.append((kind, op[1], flags, _to_buffer(op[2]), 0))
+        elif kind == BATCH_I2C_READ:
+            flags = op[3] if len(op) > 3 else I2C_NO_FLAGS
+            compiled.append((kind, op[1], flags, None, op[2]))
+        elif kind == BATCH_I2C_WRITE_READ:
+            compiled.append((kind, op[1], I2C_NO_FLAGS, _to_buffer(op[2]),
+                    op[3]))
+        elif kind == BATCH_SPI:
+            data = _to_buffer(op[1])
+            compiled.append((kind, None, None, data, len(data)))
+        elif kind == BATCH_DELAY:
+            compiled.append((kind, None, None, None, op[1]))
+        elif kind == BATCH_GPIO_SET:
+            compiled.append((kind, None, op[1], None, 0))
+        elif kind == BATCH_GPIO_GET:
+            compiled.append((kind, None, None, None, 0))
+        else:
+            raise ValueError('unknown batch operation %r' % (kind,))
+    return compiled
+
+
+def _unique_id_str(unique_id):
+    return '%04d-%06d' % (unique_id // 1000000, unique_id % 1000000)
+
+def _find_devices():
+    # first fetch the number of attached devices, so we can create a buffer
+    # with the exact amount of entries. api expects array of u16
+    num_devices = api.py_aa_find_devices(0, array.array('H'))
+    _raise_error_if_negative(num_devices)
+    if num_devices == 0:
+        return array.array('H')
+    devices = array.array('H', (0,) * num_devices)
+
+    num_devices = api.py_aa_find_devices(len(devices), devices)
+    _raise_error_if_negative(num_devices)
+
+    del devices[num_devices:]
+    return devices
+
+def _find_devices_ext():
+    # like _find_devices() but also returns the unique ids of all devices,
+    # without the need to open them
+    num_devices = api.py_aa_find_devices_ext(0, 0, array.array('H'),
+            array.array('I'))
+    _raise_error_if_negative(num_devices)
+    if num_devices == 0:
+        return []
+    devices = array.array('H', (0,) * num_devices)
+    unique_ids = array.array('I', (0,) * num_devices)
+
+    num_devices = api.py_aa_find_devices_ext(len(devices), len(unique_ids),
+            devices, unique_ids)
+    _raise_error_if_negative(num_devices)
+
+    return list(zip(devices, unique_ids))[:num_devices]
 
-        
 def find_devices(filter_in_use=True):
     """Return a list of port numbers which can be used with :func:`open`.
 
@@ -75,17 +215,8 @@ def find_devices(filter_in_use=True):
        machine after you call :func:`find_devices` but before you call
        :func:`open`.
     """
-    
-    # first fetch the number of attached devices, so we can create a buffer
-    # with the exact amount of entries. api expects array of u16
-    num_devices = api.py_aa_find_devices(0, array.array('H'))
-    assert num_devices > 0
-    devices = array.array('H', (0,) * num_devices)
-    
-    num_devices = api.py_aa_find_devices(len(devices), devices)
-    assert num_devices > 0
-    
-    del devices[num_devices:]
+
+    devices = _find_devices()
 
     if filter_in_use:
         devices = [ d for d in devices if not d & PORT_NOT_FREE ]
@@ -108,19 +239,19 @@ def open(port=None, serial_number=None):
     find the number on the device itself or in the in the corresponding USB
     property. The serial number is a string which looks like `NNNN-MMMMMMM`.
 
+    Opening by serial number uses the device index of
+    :mod:`pyaardvark.discovery`, so usually only the matching device is
+    opened.
+
     Raises an :class:`IOError` if the port number (or serial number) does not
     exist, is already connected or an incompatible device is found.
     """
     if port is None and serial_number is None:
         dev = Aardvark(0)
     elif serial_number is not None:
-        for port in find_devices(True):
-            dev = Aardvark(port)
-            if dev.unique_id_str() == serial_number:
-                break
-            dev.close()
-        else:
-            raise IOError(error_string(ERR_UNABLE_TO_OPEN))
+        # imported here, because the discovery module depends on this one
+        from .discovery import default_index
+        dev = default_index.open(serial_number)
     else:
         dev = Aardvark(port)
 
@@ -139,6 +270,22 @@ class Aardvark(object):
         #: underlying API.
         self.handle = ret
 
+        #: :class:`~pyaardvark.buffers.BufferPool` used for I2C slave
+        #: receptions. Its counters show how many buffers were allocated
+        #: and reused.
+        self.i2c_slave_rx_pool = BufferPool(self.BUFFER_SIZE)
+
+        #: :class:`~pyaardvark.buffers.BufferPool` used for SPI slave
+        #: receptions.
+        self.spi_slave_rx_pool = BufferPool(self.BUFFER_SIZE)
+
+        # shadow copy of the adapter configuration, see enable_cache()
+        self._cache = None
+        self._cache_verify = False
+
+        # output values of the GPIO lines, see gpio_update()
+        self._gpio_output = 0
+
         # assign some useful names
         version = dict(
             software = ver[0],
@@ -192,6 +339,62 @@ class Aardvark(object):
         """Close the device."""
         api.py_aa_close(self.handle)
         self.handle = None
+        self.invalidate_cache()
+
+    def enable_cache(self, verify=False):
+        """Enable the write-through cache of the adapter configuration.
+
+        Once enabled, the interface configuration, bitrates, pullups, target
+        power, SPI mode, SS polarity and the GPIO direction and pullups are
+        remembered when they are set or queried. Further queries are
+        answered from the cache and setting a value which is already active
+        won't access the device at all.
+
+        The cache assumes that nobody else changes the configuration of the
+        adapter. Use :meth:`invalidate_cache` if that happened anyway.
+
+        If `verify` is `True`, every access still goes to the device and
+        the result is compared to the cached value. Any mismatch is logged
+        as a warning. This is intended to debug stale caches.
+        """
+        if self._cache is None:
+            self._cache = dict()
+        self._cache_verify = verify
+
+    def disable_cache(self):
+        """Disable the configuration cache and drop its content."""
+        self._cache = None
+        self._cache_verify = False
+
+    def invalidate_cache(self):
+        """Forget all cached values. The next access of each value will be
+        passed to the device again.
+        """
+        if self._cache is not None:
+            self._cache.clear()
+
+    def _cache_contains(self, key, value):
+        # only skip an access if we are not verifying the cache
+        cache = self._cache
+        return (cache is not None and not self._cache_verify
+                and key in cache and cache[key] == value)
+
+    def _cache_update(self, **values):
+        if self._cache is not None:
+            self._cache.update(values)
+
+    def _cached_query(self, key, query):
+        cache = self._cache
+        if cache is None:
+            return query()
+        if key in cache and not self._cache_verify:
+            return cache[key]
+        value = query()
+        if key in cache and cache[key] != value:
+            log.warning('Cached %s (%r) differs from device (%r)',
+                    key, cache[key], value)
+        cache[key] = value
+        return value
 
     def unique_id(self):
         """Return the unique identifier of the device. The identifier is the
@@ -204,16 +407,21 @@ class Aardvark(object):
         """Return the unique identifier. But unlike :func:`unique_id`, the ID
         is returned as a string which has the format NNNN-MMMMMMM.
         """
-        unique_id = self.unique_id()
-        id1 = unique_id / 1000000
-        id2 = unique_id % 1000000
-        return '%04d-%06d' % (id1, id2)
+        return _unique_id_str(self.unique_id())
 
-    def _interface_configuration(self, value):
+    def _configure(self, value):
         ret = api.py_aa_configure(self.handle, value)
         _raise_error_if_negative(ret)
         return ret
 
+    def _interface_configuration(self, value):
+        if value == CONFIG_QUERY:
+            return self._cached_query('config',
+                    lambda: self._configure(CONFIG_QUERY))
+        ret = self._configure(value)
+        self._cache_update(config=ret)
+        return ret
+
     @property
     def enable_i2c(self):
         """Set this to `True` to enable the hardware I2C interface. If set to
@@ -268,14 +476,20 @@ class Aardvark(object):
 
         The power-on default value is 100 kHz.
         """
-        ret = api.py_aa_i2c_bitrate(self.handle, 0)
-        _raise_error_if_negative(ret)
-        return ret
+        return self._cached_query('i2c_bitrate',
+                lambda: self._i2c_bitrate(0))
 
     @i2c_bitrate.setter
     def i2c_bitrate(self, value):
+        if self._cache_contains('i2c_bitrate_request', value):
+            return
+        ret = self._i2c_bitrate(value)
+        self._cache_update(i2c_bitrate_request=value, i2c_bitrate=ret)
+
+    def _i2c_bitrate(self, value):
         ret = api.py_aa_i2c_bitrate(self.handle, value)
         _raise_error_if_negative(ret)
+        return ret
 
     @property
     def i2c_pullups(self):
@@ -285,17 +499,25 @@ class Aardvark(object):
         Raises an :exc:`IOError` if the hardware adapter does not support
         pullup resistors.
         """
-        ret = api.py_aa_i2c_pullup(self.handle, I2C_PULLUP_QUERY)
-        _raise_error_if_negative(ret)
+        return self._cached_query('i2c_pullups',
+                lambda: self._i2c_pullup(I2C_PULLUP_QUERY) == I2C_PULLUP_BOTH)
 
     @i2c_pullups.setter
     def i2c_pullups(self, value):
+        value = bool(value)
+        if self._cache_contains('i2c_pullups', value):
+            return
         if value:
             pullup = I2C_PULLUP_BOTH
         else:
             pullup = I2C_PULLUP_NONE
+        self._i2c_pullup(pullup)
+        self._cache_update(i2c_pullups=value)
+
+    def _i2c_pullup(self, pullup):
         ret = api.py_aa_i2c_pullup(self.handle, pullup)
         _raise_error_if_negative(ret)
+        return ret
 
     @property
     def target_power(self):
@@ -305,18 +527,26 @@ class Aardvark(object):
         Raises an :exc:`IOError` if the hardware adapter does not support
         the switchable power pins.
         """
-        ret = api.py_aa_target_power(self.handle, TARGET_POWER_QUERY)
-        _raise_error_if_negative(ret)
-
+        return self._cached_query('target_power',
+                lambda: self._target_power(TARGET_POWER_QUERY)
+                        == TARGET_POWER_BOTH)
 
     @target_power.setter
     def target_power(self, value):
+        value = bool(value)
+        if self._cache_contains('target_power', value):
+            return
         if value:
             power = TARGET_POWER_BOTH
         else:
             power = TARGET_POWER_NONE
+        self._target_power(power)
+        self._cache_update(target_power=value)
+
+    def _target_power(self, power):
         ret = api.py_aa_target_power(self.handle, power)
         _raise_error_if_negative(ret)
+        return ret
 
     def i2c_master_write(self, i2c_address, data, flags=I2C_NO_FLAGS):
         """Make an I2C write access.
@@ -325,14 +555,35 @@ class Aardvark(object):
         written. The transaction is finished with an I2C stop condition unless
         I2C_NO_STOP is set in the flags.
 
+        Instead of a string, `data` may also be any object supporting the
+        buffer protocol. `bytearray` and `array.array('B')` objects are
+        passed to the API without copying them.
+
         10 bit addresses are supported if the I2C_10_BIT_ADDR flag is set.
         """
 
-        data = array.array('B', data)
+        data = _to_buffer(data)
         ret = api.py_aa_i2c_write(self.handle, i2c_address,
                 flags, len(data), data)
         _raise_error_if_negative(ret)
 
+    def i2c_master_write_ext(self, i2c_address, data, flags=I2C_NO_FLAGS):
+        """Make an I2C write access and return the bus status.
+
+        Works like :meth:`i2c_master_write`, but returns a tuple
+        `(status, num_written)` where `status` is one of the `I2C_STATUS_*`
+        constants. A missing acknowledge of the slave address is reported as
+        `I2C_STATUS_SLA_NACK` instead of an exception, which makes this method
+        suitable for probing devices. An :exc:`IOError` is only raised for
+        adapter errors.
+        """
+
+        data = _to_buffer(data)
+        (status, num_written) = api.py_aa_i2c_write_ext(self.handle,
+                i2c_address, flags, len(data), data)
+        _raise_error_if_negative(status)
+        return status, num_written
+
     def i2c_master_read(self, addr, length, flags=I2C_NO_FLAGS):
         """Make an I2C read access.
 
@@ -344,15 +595,44 @@ class Aardvark(object):
         I2C_NO_STOP flag is set.
         """
 
-        data = array.array('B', (0,) * length)
-        print length
-        ret = api.py_aa_i2c_read(self.handle, addr, flags, length,
-                data)
-        _raise_error_if_negative(ret)
-        print data
+        data = _zeros(length)
+        ret = self.i2c_master_read_into(addr, data, flags)
         del data[ret:]
         return data.tostring()
 
+    def i2c_master_read_into(self, addr, buf, flags=I2C_NO_FLAGS):
+        """Make an I2C read access and store the data in `buf`.
+
+        Works like :meth:`i2c_master_read`, but instead of allocating a new
+        string for every call, `len(buf)` bytes are read into the writable
+        buffer `buf` (eg. a `bytearray`, an `array.array('B')` or a
+        `memoryview` of one of them). The buffer can be reused across calls.
+
+        Returns the number of bytes actually read.
+        """
+
+        data = _writable_buffer(buf)
+        ret = api.py_aa_i2c_read(self.handle, addr, flags, len(buf), data)
+        _raise_error_if_negative(ret)
+        if data is not buf:
+            buf[:ret] = data[:ret].tostring()
+        return ret
+
+    def i2c_master_read_into_ext(self, addr, buf, flags=I2C_NO_FLAGS):
+        """Make an I2C read access into `buf` and return the bus status.
+
+        Like :meth:`i2c_master_read_into`, but returns a tuple
+        `(status, num_read)`. See :meth:`i2c_master_write_ext`.
+        """
+
+        data = _writable_buffer(buf)
+        (status, num_read) = api.py_aa_i2c_read_ext(self.handle, addr, flags,
+                len(buf), data)
+        _raise_error_if_negative(status)
+        if data is not buf:
+            buf[:num_read] = data[:num_read].tostring()
+        return status, num_read
+
     def i2c_master_write_read(self, i2c_address, data, length):
         """Make an I2C write/read access.
 
@@ -369,18 +649,222 @@ class Aardvark(object):
         self.i2c_master_write(i2c_address, data, I2C_NO_STOP)
         return self.i2c_master_read(i2c_address, length)
 
-    def i2c_slave_enable(self, slave_address):
+    def i2c_scan(self, addresses=range(0x08, 0x78), probe='write'):
+        """Probe each of the 7-bit `addresses` (default: all addresses not
+        reserved by the I2C specification) and return a list of the
+        addresses which were acknowledged.
+
+        `probe` selects the transaction used for probing. ``'write'`` issues
+        a zero-length write, which is the fastest probe. Some devices don't
+        acknowledge those, in that case ``'read'`` issues a one-byte read
+        instead. Please note, that a read may have side effects on some
+        devices (eg. clearing interrupt flags).
+
+        Absent devices don't raise an exception, an :exc:`IOError` is only
+        raised for adapter errors or if the bus is in a bad state (eg. a bus
+        error or lost arbitration).
+
+        To scan several adapters at once, use :meth:`DevicePool.run`.
+        """
+        if probe == 'write':
+            data = _zeros(0)
+            probe = api.py_aa_i2c_write_ext
+        elif probe == 'read':
+            data = _zeros(1)
+            probe = api.py_aa_i2c_read_ext
+        else:
+            raise ValueError('unknown probe %r' % (probe,))
+
+        found = []
+        for addr in addresses:
+            (status, _) = probe(self.handle, addr, I2C_NO_FLAGS, len(data),
+                    data)
+            if status == I2C_STATUS_OK:
+                found.append(addr)
+            elif status != I2C_STATUS_SLA_NACK:
+                _raise_error_if_negative(status)
+                raise IOError(i2c_status_string(status))
+        return found
+
+    def batch(self, ops, stop_on_error=True):
+        """Execute a list of operations back-to-back in one call.
+
+        Each operation is a tuple, where the first element selects the type
+        of the operation:
+
+        * ``('i2c_write', addr, data[, flags])``
+        * ``('i2c_read', addr, length[, flags])``
+        * ``('i2c_write_read', addr, data, length)``
+        * ``('spi', data)``
+        * ``('delay', milliseconds)``
+        * ``('gpio_set', value)``
+        * ``('gpio_get',)``, the status is the value of the GPIO lines
+
+        Returns a list with one :data:`BatchResult` per operation. If
+        `stop_on_error` is `True`, the remaining operations are skipped after
+        the first failing one and their status is `None`. In contrast to the
+        single transfer methods, no :exc:`IOError` is raised.
+
+        If the underlying API supports it (eg. the remote API), the whole
+        batch is sent as a single request.
+        """
+        ops = _compile_batch(ops)
+
+        run_batch = getattr(api, 'py_aa_batch', None)
+        if run_batch is not None:
+            results = run_batch(self.handle, ops, stop_on_error)
+            results = [BatchResult(ret, array.array('B', data).tostring()
+                    if data is not None else None) for (ret, data) in results]
+            self._batch_gpio_output(ops, results)
+            return results
+
+        max_length = max([op[4] for op in ops if op[0] != BATCH_DELAY] + [0])
+        data_in = _zeros(max_length)
+
+        results = [BatchResult(None, None)] * len(ops)
+        for i, (kind, addr, flags, data_out, length) in enumerate(ops):
+            data = None
+            if kind == BATCH_I2C_WRITE:
+                ret = api.py_aa_i2c_write(self.handle, addr, flags,
+                        len(data_out), data_out)
+            elif kind == BATCH_I2C_READ:
+                ret = api.py_aa_i2c_read(self.handle, addr, flags, length,
+                        data_in)
+            elif kind == BATCH_I2C_WRITE_READ:
+                ret = api.py_aa_i2c_write(self.handle, addr, I2C_NO_STOP,
+                        len(data_out), data_out)
+                if ret >= 0:
+                    ret = api.py_aa_i2c_read(self.handle, addr, flags, length,
+                            data_in)
+            elif kind == BATCH_SPI:
+                ret = api.py_aa_spi_write(self.handle, len(data_out), data_out,
+                        length, data_in)
+            elif kind == BATCH_DELAY:
+                time.sleep(length / 1000.0)
+                ret = 0
+            elif kind == BATCH_GPIO_SET:
+                ret = api.py_aa_gpio_set(self.handle, flags)
+            elif kind == BATCH_GPIO_GET:
+                ret = api.py_aa_gpio_get(self.handle)
+
+            if ret >= 0 and kind in (BATCH_I2C_READ, BATCH_I2C_WRITE_READ):
+                data = data_in[:ret].tostring()
+            elif ret >= 0 and kind == BATCH_SPI:
+                data = data_in[:length].tostring()
+            results[i] = BatchResult(ret, data)
+
+            if ret < 0 and stop_on_error:
+                break
+
+        self._batch_gpio_output(ops, results)
+        return results
+
+    def _batch_gpio_output(self, ops, results):
+        # keep track of the output values set within a batch
+        for (op, result) in zip(ops, results):
+            if op[0] == BATCH_GPIO_SET and result.status is not None \
+                    and result.status >= 0:
+                self._gpio_output = op[2]
+
+    def gpio_direction(self, outputs):
+        """Configure the GPIO lines given by the bitmask `outputs` as
+        outputs, all other lines become inputs. Use the `GPIO_*` constants
+        to build the mask.
+
+        Only lines whose interface (I2C or SPI) is disabled are affected.
+        """
+        if self._cache_contains('gpio_direction', outputs):
+            return
+        ret = api.py_aa_gpio_direction(self.handle, outputs)
+        _raise_error_if_negative(ret)
+        self._cache_update(gpio_direction=outputs)
+
+    def gpio_pullup(self, mask):
+        """Enable the pullup resistors of the input lines given by the
+        bitmask `mask` and disable all others.
+        """
+        if self._cache_contains('gpio_pullup', mask):
+            return
+        ret = api.py_aa_gpio_pullup(self.handle, mask)
+        _raise_error_if_negative(ret)
+        self._cache_update(gpio_pullup=mask)
+
+    def gpio_get(self):
+        """Return the current value of all GPIO lines as a bitmask."""
+        ret = api.py_aa_gpio_get(self.handle)
+        _raise_error_if_negative(ret)
+        return ret
+
+    def gpio_set(self, value):
+        """Set all output lines at once according to the bitmask `value`."""
+        ret = api.py_aa_gpio_set(self.handle, value)
+        _raise_error_if_negative(ret)
+        self._gpio_output = value
+
+    def gpio_update(self, mask, value):
+        """Change only the output lines given by `mask` to the corresponding
+        bits of `value`, eg. ``gpio_update(GPIO_SS | GPIO_SCK, GPIO_SS)``.
+
+        The other lines keep the value last set with this object, so this
+        takes a single call, too.
+        """
+        self.gpio_set((self._gpio_output & ~mask) | (value & mask))
+
+    def gpio_change(self, timeout_ms):
+        """Wait up to `timeout_ms` milliseconds for a change on any input
+        line and return the value of all lines. If no change occurs, the
+        current value is returned after the timeout.
+        """
+        ret = api.py_aa_gpio_change(self.handle, timeout_ms)
+        _raise_error_if_negative(ret)
+        return ret
+
+    def i2c_slave_enable(self, slave_address, max_tx_bytes=None,
+            max_rx_bytes=None):
         """Enable slave mode.
 
         The device will respond to the specified slave_address if it is
         addressed.
 
+        `max_tx_bytes` and `max_rx_bytes` limit the number of bytes per
+        transmission and reception. Both default to :attr:`BUFFER_SIZE`.
+        The receive buffers used by :meth:`i2c_slave_read` are sized
+        accordingly, so keeping `max_rx_bytes` small saves memory.
+
         You can wait for the data with `poll` and get it with
         `i2c_slave_read`.
         """
+        if max_tx_bytes is None:
+            max_tx_bytes = self.BUFFER_SIZE
+        if max_rx_bytes is None:
+            max_rx_bytes = self.BUFFER_SIZE
         ret = api.py_aa_i2c_slave_enable(self.handle, slave_address,
-                self.BUFFER_SIZE, self.BUFFER_SIZE)
+                max_tx_bytes, max_rx_bytes)
+        _raise_error_if_negative(ret)
+        if self.i2c_slave_rx_pool.size != max_rx_bytes:
+            self.i2c_slave_rx_pool = BufferPool(max_rx_bytes)
+
+    def i2c_slave_disable(self):
+        """Disable slave mode."""
+        ret = api.py_aa_i2c_slave_disable(self.handle)
+        _raise_error_if_negative(ret)
+
+    def i2c_slave_set_response(self, data):
+        """Set the response which is sent if the device is read by an I2C
+        master in slave mode. The response is repeated if the master reads
+        more bytes than given.
+        """
+        data = _to_buffer(data)
+        ret = api.py_aa_i2c_slave_set_response(self.handle, len(data), data)
+        _raise_error_if_negative(ret)
+
+    def i2c_slave_write_stats(self):
+        """Return the number of bytes sent in the last slave transmission,
+        ie. after a `POLL_I2C_WRITE` event.
+        """
+        ret = api.py_aa_i2c_slave_write_stats(self.handle)
         _raise_error_if_negative(ret)
+        return ret
 
     def poll(self, timeout_ms):
         """Wait for an event to occur.
@@ -396,12 +880,72 @@ class Aardvark(object):
 
         The bytes are returns as an string object.
         """
-        data = array.array('B', (0,) * self.BUFFER_SIZE)
-        (ret, slave_addr) = api.py_aa_i2c_slave_read(self.handle, self.BUFFER_SIZE,
-                data)
+        (slave_addr, buf) = self.i2c_slave_read_buffer()
+        with buf:
+            return (slave_addr, buf.tobytes())
+
+    def i2c_slave_read_buffer(self):
+        """Read the bytes from an I2C slave reception into a pooled buffer.
+
+        Returns a tuple `(slave_addr, buf)` where `buf` is a
+        :class:`~pyaardvark.buffers.PooledBuffer`. The received bytes can be
+        accessed through its `view` attribute without any copy. The buffer
+        must be released after use, eg::
+
+          addr, buf = a.i2c_slave_read_buffer()
+          with buf:
+              process(buf.view)
+        """
+        pool = self.i2c_slave_rx_pool
+        data = pool.acquire()
+        try:
+            (ret, slave_addr) = api.py_aa_i2c_slave_read(self.handle,
+                    len(data), data)
+            _raise_error_if_negative(ret)
+        except:
+            pool.release(data)
+            raise
+        return (slave_addr, PooledBuffer(pool, data, ret))
+
+    def i2c_monitor_enable(self):
+        """Activate the I2C monitor.
+
+        Enabling the monitor will disable all other functions of the
+        adapter.
+        """
+        ret = api.py_aa_i2c_monitor_enable(self.handle)
         _raise_error_if_negative(ret)
+
+    def i2c_monitor_disable(self):
+        """Disable the I2C monitor."""
+        ret = api.py_aa_i2c_monitor_disable(self.handle)
+        _raise_error_if_negative(ret)
+
+    def i2c_monitor_read(self):
+        """Retrieve any data fetched by the monitor.
+
+        This function has an integrated timeout. If there is no data
+        available within that time, an empty array is returned. Thus, it is
+        recommended to first check with :meth:`poll` for a `POLL_I2C_MONITOR`
+        event.
+
+        Returns an `array.array('H')` of monitor words. The lower byte of a
+        word is a data byte, `I2C_MONITOR_NACK` marks a not acknowledged byte
+        and `I2C_MONITOR_CMD_START` and `I2C_MONITOR_CMD_STOP` are start and
+        stop conditions.
+        """
+        data = array.array('H', (0,)) * self.BUFFER_SIZE
+        ret = self.i2c_monitor_read_into(data)
         del data[ret:]
-        return (slave_addr, data.tostring())
+        return data
+
+    def i2c_monitor_read_into(self, buf):
+        """Like :meth:`i2c_monitor_read`, but the words are stored into the
+        given `array.array('H')`. Returns the number of words read.
+        """
+        ret = api.py_aa_i2c_monitor_read(self.handle, len(buf), buf)
+        _raise_error_if_negative(ret)
+        return ret
 
     @property
     def spi_bitrate(self):
@@ -412,19 +956,29 @@ class Aardvark(object):
 
         The power-on default value is 1000 kHz.
         """
-        ret = api.py_aa_spi_bitrate(self.handle, 0)
-        _raise_error_if_negative(ret)
-        return ret
+        return self._cached_query('spi_bitrate',
+                lambda: self._spi_bitrate(0))
 
     @spi_bitrate.setter
     def spi_bitrate(self, value):
+        if self._cache_contains('spi_bitrate_request', value):
+            return
+        ret = self._spi_bitrate(value)
+        self._cache_update(spi_bitrate_request=value, spi_bitrate=ret)
+
+    def _spi_bitrate(self, value):
         ret = api.py_aa_spi_bitrate(self.handle, value)
         _raise_error_if_negative(ret)
+        return ret
 
     def spi_configure(self, polarity, phase, bitorder):
         """Configure the SPI interface."""
+        config = (polarity, phase, bitorder)
+        if self._cache_contains('spi_configure', config):
+            return
         ret = api.py_aa_spi_configure(self.handle, polarity, phase, bitorder)
         _raise_error_if_negative(ret)
+        self._cache_update(spi_configure=config)
 
     def spi_configure_mode(self, spi_mode):
         """Configure the SPI interface by the well known SPI modes."""
@@ -439,18 +993,84 @@ class Aardvark(object):
 
     def spi_write(self, data):
         "Write a stream of bytes to a SPI device."""
-        data_out = array.array('B', data)
-        data_in = array.array('B', (0,) * len(data_out))
+        data_out = _to_buffer(data)
+        data_in = _zeros(len(data_out))
+        self.spi_transfer_into(data_out, data_in)
+        return data_in.tostring()
+
+    def spi_transfer_into(self, data_out, data_in):
+        """Write the bytes of `data_out` to a SPI device and store the
+        received bytes in the writable buffer `data_in`.
+
+        Like :meth:`i2c_master_read_into` this method doesn't allocate any
+        memory if `bytearray` or `array.array('B')` objects are used for
+        both buffers. `data_in` should be at least as long as `data_out`.
+
+        Returns the number of bytes received.
+        """
+        data_out = _to_buffer(data_out)
+        data = _writable_buffer(data_in)
         ret = api.py_aa_spi_write(self.handle, len(data_out), data_out,
-                len(data_in), data_in)
+                len(data_in), data)
         _raise_error_if_negative(ret)
-        return data_in.tostring()
+        if data is not data_in:
+            data_in[:ret] = data[:ret].tostring()
+        return ret
+
+    def spi_slave_enable(self):
+        """Enable SPI slave mode.
+
+        You can wait for data with `poll` (`POLL_SPI`) and get it with
+        `spi_slave_read`.
+        """
+        ret = api.py_aa_spi_slave_enable(self.handle)
+        _raise_error_if_negative(ret)
+
+    def spi_slave_disable(self):
+        """Disable SPI slave mode."""
+        ret = api.py_aa_spi_slave_disable(self.handle)
+        _raise_error_if_negative(ret)
+
+    def spi_slave_set_response(self, data):
+        """Set the bytes which are sent to the SPI master in slave mode.
+        The response is repeated if the master clocks more bytes.
+        """
+        data = _to_buffer(data)
+        ret = api.py_aa_spi_slave_set_response(self.handle, len(data), data)
+        _raise_error_if_negative(ret)
+
+    def spi_slave_read(self):
+        """Read the bytes from a SPI slave reception.
+
+        The bytes are returned as a string object.
+        """
+        buf = self.spi_slave_read_buffer()
+        with buf:
+            return buf.tobytes()
+
+    def spi_slave_read_buffer(self):
+        """Like :meth:`spi_slave_read`, but the received bytes are returned
+        as a :class:`~pyaardvark.buffers.PooledBuffer`, which has to be
+        released after use. See :meth:`i2c_slave_read_buffer`.
+        """
+        pool = self.spi_slave_rx_pool
+        data = pool.acquire()
+        try:
+            ret = api.py_aa_spi_slave_read(self.handle, len(data), data)
+            _raise_error_if_negative(ret)
+        except:
+            pool.release(data)
+            raise
+        return PooledBuffer(pool, data, ret)
 
     def spi_ss_polarity(self, polarity):
         """Change the ouput polarity on the SS line.
 
         Please note, that this only affects the master functions.
         """
+        if self._cache_contains('spi_ss_polarity', polarity):
+            return
         ret = api.py_aa_spi_master_ss_polarity(self.handle, polarity)
         _raise_error_if_negative(ret)
+        self._cache_update(spi_ss_polarity=polarity)
   
\ No newline at end of file
@@ -0,0 +1,214 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""asyncio front end for :class:`pyaardvark.Aardvark`.
+
+Every device gets its own worker thread. All calls for one device are
+queued and executed in order by this thread, so transactions are never
+interleaved, while any number of devices can be driven from one event loop.
+
+All methods return futures which can be awaited (or yielded from when using
+trollius on Python 2).
+"""
+
+import collections
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+try:
+    StopAsyncIteration = StopAsyncIteration
+except NameError:
+    StopAsyncIteration = StopIteration
+
+from . import aardvark
+from .constants import *
+
+#: Event returned by :meth:`AsyncAardvark.events`. `events` is the bitfield
+#: returned by :meth:`pyaardvark.Aardvark.poll`. If an I2C slave reception
+#: is part of it, `slave_addr` and `data` hold the received message. For a
+#: SPI slave reception, `data` holds the received bytes and `slave_addr` is
+#: None.
+SlaveEvent = collections.namedtuple('SlaveEvent', 'events slave_addr data')
+
+def _then(loop, future, func):
+    """Return a new future with the result of `func` applied to the result
+    of `future`.
+    """
+    result = asyncio.Future(loop=loop)
+    def done(f):
+        if result.cancelled():
+            return
+        if f.cancelled():
+            result.cancel()
+        elif f.exception() is not None:
+            result.set_exception(f.exception())
+        else:
+            try:
+                result.set_result(func(f.result()))
+            except Exception as e:
+                result.set_exception(e)
+    future.add_done_callback(done)
+    return result
+
+def open(port=None, serial_number=None, loop=None):
+    """Open an Aardvark device in the background.
+
+    Takes the same arguments as :func:`pyaardvark.open` and returns a future
+    which resolves to an :class:`AsyncAardvark` object.
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = loop.run_in_executor(executor, aardvark.open, port,
+            serial_number)
+    def wrap(dev):
+        return AsyncAardvark(dev, loop, executor)
+    result = _then(loop, future, wrap)
+    def cleanup(f):
+        if f.cancelled() or f.exception() is not None:
+            executor.shutdown(wait=False)
+        elif result.cancelled():
+            # nobody is going to use the device
+            executor.submit(f.result().close)
+            executor.shutdown(wait=False)
+    future.add_done_callback(cleanup)
+    return result
+
+
+class AsyncAardvark(object):
+    """Wraps an :class:`pyaardvark.Aardvark` object and provides awaitable
+    versions of its methods.
+
+    Usually, you don't create this object yourself, but use :func:`open`.
+    """
+
+    def __init__(self, device, loop=None, executor=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1)
+        #: The underlying :class:`pyaardvark.Aardvark` object. It must not
+        #: be used directly while there are pending calls.
+        self.device = device
+        self._loop = loop
+        self._executor = executor
+
+    def _call(self, func, *args, **kwargs):
+        if kwargs:
+            func = functools.partial(func, **kwargs)
+        return self._loop.run_in_executor(self._executor, func, *args)
+
+    def close(self):
+        """Close the device after all pending calls are done."""
+        future = self._call(self.device.close)
+        future.add_done_callback(
+                lambda f: self._executor.shutdown(wait=False))
+        return future
+
+    def get(self, name):
+        """Read the attribute `name` (eg. `i2c_bitrate`) of the device."""
+        return self._call(getattr, self.device, name)
+
+    def set(self, name, value):
+        """Set the attribute `name` (eg. `enable_i2c`) of the device."""
+        return self._call(setattr, self.device, name, value)
+
+    def _poll_event(self, timeout_ms):
+        events = self.device.poll(timeout_ms)
+        if events & POLL_I2C_READ:
+            (slave_addr, data) = self.device.i2c_slave_read()
+            return SlaveEvent(events, slave_addr, data)
+        if events & POLL_SPI:
+            return SlaveEvent(events, None, self.device.spi_slave_read())
+        return SlaveEvent(events, None, None)
+
+    def events(self, timeout_ms=100):
+        """Return an asynchronous iterator over slave and poll events.
+
+        The device is polled with the given timeout. Calls which are issued
+        while waiting for an event are executed between two polls. Stop the
+        iteration with the iterator's `stop` method.
+        """
+        return _EventIterator(self, timeout_ms)
+
+
+class _EventIterator(object):
+    def __init__(self, dev, timeout_ms):
+        self._dev = dev
+        self._timeout_ms = timeout_ms
+        self._stopped = False
+
+    def __aiter__(self):
+        return self
+
+    def stop(self):
+        self._stopped = True
+
+    def next_event(self):
+        """Return a future resolving to the next :data:`SlaveEvent`."""
+        loop = self._dev._loop
+        result = asyncio.Future(loop=loop)
+
+        def poll():
+            if self._stopped:
+                result.set_exception(StopAsyncIteration())
+                return
+            future = self._dev._call(self._dev._poll_event, self._timeout_ms)
+            future.add_done_callback(done)
+
+        def done(f):
+            if result.cancelled():
+                return
+            if f.exception() is not None:
+                result.set_exception(f.exception())
+            elif f.result().events == POLL_NO_DATA:
+                poll()
+            else:
+                result.set_result(f.result())
+
+        poll()
+        return result
+
+    __anext__ = next_event
+
+
+def _wrap(name):
+    def method(self, *args, **kwargs):
+        return self._call(getattr(self.device, name), *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = ('Awaitable version of '
+            ':meth:`pyaardvark.Aardvark.%s`.' % name)
+    return method
+
+for _name in ('unique_id', 'unique_id_str', 'enable_cache', 'disable_cache',
+        'invalidate_cache', 'i2c_master_write', 'i2c_master_write_ext',
+        'i2c_master_read', 'i2c_master_read_into', 'i2c_master_read_into_ext',
+        'i2c_master_write_read', 'i2c_scan', 'batch',
+        'i2c_slave_enable', 'i2c_slave_disable', 'i2c_slave_set_response',
+        'i2c_slave_write_stats', 'i2c_slave_read', 'i2c_slave_read_buffer',
+        'i2c_monitor_enable', 'i2c_monitor_disable', 'i2c_monitor_read',
+        'i2c_monitor_read_into', 'poll', 'spi_configure', 'spi_configure_mode', 'spi_write',
+        'spi_transfer_into', 'spi_ss_polarity', 'spi_slave_enable',
+        'spi_slave_disable', 'spi_slave_set_response', 'spi_slave_read',
+        'spi_slave_read_buffer', 'gpio_direction',
+        'gpio_pullup', 'gpio_get', 'gpio_set', 'gpio_update', 'gpio_change'):
+    setattr(AsyncAardvark, _name, _wrap(_name))
+del _name
@@ -0,0 +1,96 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+import threading
+
+class BufferPool(object):
+    """A bounded pool of equally sized `bytearray` objects.
+
+    Buffers are handed out by :meth:`acquire` and given back with
+    :meth:`release`. At most `max_free` released buffers are kept for reuse,
+    all others are left to the garbage collector.
+    """
+
+    def __init__(self, size, max_free=8):
+        #: Size of each buffer in bytes.
+        self.size = size
+        #: Maximum number of free buffers kept in the pool.
+        self.max_free = max_free
+        #: Number of buffers which had to be allocated.
+        self.allocated = 0
+        #: Number of times a buffer was reused instead of being allocated.
+        self.reused = 0
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Return a buffer of :attr:`size` bytes. Its content is undefined."""
+        with self._lock:
+            if self._free:
+                self.reused += 1
+                return self._free.pop()
+            self.allocated += 1
+        return bytearray(self.size)
+
+    def release(self, buf):
+        """Give `buf` back to the pool."""
+        if len(buf) != self.size:
+            return
+        with self._lock:
+            if len(self._free) < self.max_free:
+                self._free.append(buf)
+
+    def stats(self):
+        """Return a dictionary with the allocation counters."""
+        return dict(size=self.size, allocated=self.allocated,
+                reused=self.reused, free=len(self._free))
+
+
+class PooledBuffer(object):
+    """The first `length` bytes of a buffer owned by a :class:`BufferPool`.
+
+    The data can be accessed without copying through :attr:`view`. Once the
+    data isn't needed anymore, :meth:`release` has to be called (or the
+    object be used as a context manager), so the memory can be reused. The
+    view must not be used after that.
+    """
+
+    def __init__(self, pool, buf, length):
+        self._pool = pool
+        self._buf = buf
+        #: A `memoryview` of the valid part of the buffer.
+        self.view = memoryview(buf)[:length]
+
+    def __len__(self):
+        return len(self.view)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.release()
+        return False
+
+    def tobytes(self):
+        """Return a copy of the data as a string."""
+        return self.view.tobytes()
+
+    def release(self):
+        """Return the underlying buffer to its pool."""
+        if self._buf is not None:
+            self.view = None
+            self._pool.release(self._buf)
+            self._buf = None
@@ -19,10 +19,21 @@
 from __future__ import print_function
 import logging
 import argparse
+import shlex
+import sys
+import time
 from functools import partial
 
 #import pyaardvark
 import pyRemoteAardvark as pyaardvark
+from pyaardvark.script import Script, ScriptError, format_expectation
+from pyaardvark import fileformat, transfer
+from pyaardvark.aardvark import i2c_status_string
+
+#: Time in seconds an I2C device may not acknowledge its address during
+#: 'i2c load' and 'i2c dump', eg. while an EEPROM write cycle is in
+#: progress.
+I2C_WRITE_TIMEOUT = 0.1
 
 int_base0 = partial(int, base=0)
 
@@ -59,23 +70,340 @@ def i2c_rd(a, args):
     data = a.i2c_master_read(args.i2c_address, args.num_bytes)
     print(' '.join('%02x' % ord(c) for c in data))
 
-def spi(a, args):
+def _format_scan(found, addresses):
+    lines = ['   ' + ''.join('%3x' % i for i in range(16))]
+    for row in range(0, 0x80, 0x10):
+        cells = []
+        for addr in range(row, row + 0x10):
+            if addr in found:
+                cells.append('%02x' % addr)
+            elif addr in addresses:
+                cells.append('--')
+            else:
+                cells.append('  ')
+        lines.append(('%02x: ' % row + ' '.join(cells)).rstrip())
+    return '\n'.join(lines)
+
+def i2c_scan(a, args):
+    addresses = range(0x08, 0x78)
+
+    def scan_device(a):
+        _i2c_common(a, args)
+        return a.i2c_scan(addresses, args.probe)
+
+    if a is not None:
+        print(_format_scan(scan_device(a), addresses))
+        return
+
+    def scan_pool_device(a):
+        a.target_power = args.enable_target_power
+        return scan_device(a)
+
+    # scan all adapters in parallel
+    with pyaardvark.DevicePool() as pool:
+        results = pool.run(scan_pool_device)
+    for port in sorted(results):
+        print('Device #%d:' % port)
+        print(_format_scan(results[port], addresses))
+
+class _Progress(object):
+    """Reports the progress of a transfer on stderr."""
+
+    def __init__(self, total=None, interval=0.5):
+        self.total = total
+        self.interval = interval
+        self.bytes = 0
+        self.start = self._last = time.time()
+        self._tty = sys.stderr.isatty()
+
+    def _status(self, now):
+        seconds = now - self.start
+        rate = self.bytes / seconds if seconds > 0 else 0.0
+        if self.total:
+            done = '%d/%d bytes (%d%%)' % (self.bytes, self.total,
+                    100 * self.bytes // self.total)
+        else:
+            done = '%d bytes' % self.bytes
+        return '%s, %.1f s, %.0f bytes/s' % (done, seconds, rate)
+
+    def update(self, num_bytes):
+        self.bytes += num_bytes
+        now = time.time()
+        if self._tty and now - self._last >= self.interval:
+            self._last = now
+            sys.stderr.write('\r' + self._status(now))
+            sys.stderr.flush()
+
+    def finish(self):
+        sys.stderr.write(('\r' if self._tty else '')
+                + self._status(time.time()) + '\n')
+        sys.stderr.flush()
+
+def _open_input(filename):
+    if filename == '-':
+        return getattr(sys.stdin, 'buffer', sys.stdin)
+    return open(filename, 'rb')
+
+def _open_output(filename):
+    if filename == '-':
+        return getattr(sys.stdout, 'buffer', sys.stdout)
+    return open(filename, 'wb')
+
+def _close(f):
+    if f not in (sys.stdin, sys.stdout, getattr(sys.stdin, 'buffer', None),
+            getattr(sys.stdout, 'buffer', None)):
+        f.close()
+
+def _i2c_offset(offset, width):
+    return bytearray((offset >> (8 * i)) & 0xff
+            for i in reversed(range(width)))
+
+def i2c_dump(a, args):
+    _i2c_common(a, args)
+    f = _open_output(args.output)
+    try:
+        sink = fileformat.encoder(args.format, f, args.offset or 0)
+        progress = _Progress(args.num_bytes)
+        if args.offset is not None:
+            _i2c_write_polled(a, args.i2c_address,
+                    _i2c_offset(args.offset, args.offset_width),
+                    pyaardvark.I2C_NO_STOP)
+        buf = bytearray(min(args.chunk_size, args.num_bytes))
+        remaining = args.num_bytes
+        while remaining:
+            if remaining < len(buf):
+                buf = bytearray(remaining)
+            ret = a.i2c_master_read_into(args.i2c_address, buf)
+            sink.write(bytes(buf[:ret]))
+            progress.update(ret)
+            remaining -= ret
+            if ret != len(buf):
+                raise IOError('short read, got %d of %d bytes'
+                        % (args.num_bytes - remaining, args.num_bytes))
+        sink.close()
+        progress.finish()
+    finally:
+        _close(f)
+
+def _i2c_write_polled(a, i2c_address, data, flags=pyaardvark.I2C_NO_FLAGS):
+    # retry while the device doesn't acknowledge its address, eg. because
+    # an EEPROM write cycle is in progress
+    deadline = None
+    while True:
+        (status, _) = a.i2c_master_write_ext(i2c_address, data, flags)
+        if status == pyaardvark.I2C_STATUS_OK:
+            return
+        if status != pyaardvark.I2C_STATUS_SLA_NACK:
+            raise IOError(i2c_status_string(status))
+        now = time.time()
+        if deadline is None:
+            deadline = now + I2C_WRITE_TIMEOUT
+        elif now > deadline:
+            raise IOError('device 0x%02x not responding' % i2c_address)
+
+def i2c_load(a, args):
+    _i2c_common(a, args)
+    f = _open_input(args.input)
+    try:
+        source = fileformat.decoder(args.format, f)
+        readinto = transfer.reader(source)
+        progress = _Progress()
+        offset = args.offset
+        size = args.chunk_size
+        buf = bytearray(size)
+        first = True
+        while True:
+            n = readinto(buf)
+            if not n:
+                break
+            if first and getattr(source, 'address', None) is not None:
+                # an Intel HEX file knows where its data belongs
+                if offset is None:
+                    offset = source.address
+                elif offset != source.address:
+                    raise IOError('file starts at 0x%x, not at offset 0x%x'
+                            % (source.address, offset))
+            first = False
+            pos = 0
+            while pos < n:
+                # don't let a write cross a page boundary
+                count = n - pos
+                data = buf[pos:n]
+                if offset is not None:
+                    count = min(count, size - (offset % size))
+                    data = _i2c_offset(offset, args.offset_width) + \
+                            buf[pos:pos + count]
+                    offset += count
+                _i2c_write_polled(a, args.i2c_address, data)
+                progress.update(count)
+                pos += count
+            if n < len(buf):
+                break
+        progress.finish()
+    finally:
+        _close(f)
+
+def _spi_common(a, args):
     a.enable_spi = True
     a.spi_configure_mode(pyaardvark.SPI_MODE_3)
     a.spi_bitrate = args.bitrate
+
+def spi_xfer(a, args):
+    _spi_common(a, args)
+    f_in = _open_input(args.input)
+    f_out = _open_output(args.output)
+    try:
+        source = fileformat.decoder(args.format, f_in)
+        sink = fileformat.encoder(args.output_format or args.format, f_out)
+        progress = _Progress()
+
+        def write(data):
+            sink.write(data)
+            progress.update(len(data))
+        transfer.spi_stream(a, source, write, args.chunk_size)
+        sink.close()
+        progress.finish()
+    finally:
+        _close(f_in)
+        _close(f_out)
+
+def spi(a, args):
+    _spi_common(a, args)
     data = ''.join('%c' % c for c in args.data)
     data = a.spi_write(data)
     print(' '.join('%02x' % ord(c) for c in data))
 
+def _load_script(filename):
+    try:
+        return Script.load(filename)
+    except ScriptError as e:
+        print(e)
+
+def script_run(a, args):
+    script = _load_script(args.script)
+    if script is None:
+        return 1
+    if script.uses_i2c:
+        _i2c_common(a, args)
+    if script.uses_spi:
+        a.enable_spi = True
+        a.spi_configure_mode(pyaardvark.SPI_MODE_3)
+        a.spi_bitrate = args.bitrate
+
+    failed = 0
+    for _ in range(args.repeat):
+        mismatches = script.run(a, args.stop_on_mismatch)
+        for m in mismatches:
+            print('%s:%d: expected %s, got %s' % (args.script, m.line,
+                format_expectation(m.expected, m.mask),
+                ' '.join('%02x' % ord(c) for c in m.actual)))
+        if mismatches:
+            failed += 1
+            if args.stop_on_mismatch:
+                break
+    return 1 if failed else 0
+
+def script_compile(a, args):
+    script = _load_script(args.script)
+    if script is None:
+        return 1
+    script.save(args.output)
+
 def scan(a, args):
-    devices = pyaardvark.find_devices()
+    index = pyaardvark.discovery.default_index
+    index.refresh()
 
-    for port in devices:
-        dev = pyaardvark.open(port)
-        print('Device #%d: %s' % (port, dev.unique_id_str()))
-        dev.close()
+    for dev in index.devices():
+        if not dev.in_use:
+            print('Device #%d: %s' % (dev.port, dev.serial_number))
 
-def main(args=None):
+# options of the main parser, which are inherited by the commands of a batch
+# session
+_GLOBAL_OPTIONS = ('verbose', 'device', 'bitrate', 'enable_i2c_pullups',
+        'enable_target_power')
+
+def _session_lines(f, prompt):
+    while True:
+        if prompt:
+            sys.stdout.write(prompt)
+            sys.stdout.flush()
+        line = f.readline()
+        if not line:
+            break
+        yield line
+
+def batch(a, args):
+    if args.file == '-':
+        f = sys.stdin
+    else:
+        f = open(args.file)
+    prompt = 'aardvark> ' if f.isatty() else None
+
+    # the configuration is only sent to the adapter if it changes
+    a.enable_cache()
+    parser = create_parser()
+    ret = 0
+    try:
+        for line in _session_lines(f, prompt):
+            tokens = shlex.split(line, comments=True)
+            if not tokens:
+                continue
+            if tokens[0] in ('quit', 'exit'):
+                break
+            namespace = argparse.Namespace(**dict((name, getattr(args, name))
+                    for name in _GLOBAL_OPTIONS))
+            try:
+                cmd_args = parser.parse_args(tokens, namespace)
+            except SystemExit:
+                # argparse has already printed the error
+                cmd_args = None
+            if cmd_args is None:
+                status = 1
+            elif cmd_args.func is batch:
+                print('batch sessions can not be nested')
+                status = 1
+            elif cmd_args.device != args.device:
+                print('the device can not be changed within a session')
+                status = 1
+            else:
+                status = run_command(a, cmd_args)
+            sys.stdout.flush()
+            if status:
+                ret = status
+                if args.stop_on_error:
+                    break
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return ret
+
+def run_command(a, args):
+    """Run a single command on the open device `a`. Returns the exit
+    status.
+    """
+    try:
+        if getattr(args, 'open_device', True):
+            a.target_power = args.enable_target_power
+            return args.func(a, args) or 0
+        return args.func(None, args) or 0
+    except IOError as e:
+        print(e)
+        return 1
+
+def _add_transfer_options(subparser, chunk_size, chunk_help=None):
+    subparser.add_argument('-f', '--format', choices=fileformat.FORMATS,
+            default='raw', help='file format (default: raw)')
+    subparser.add_argument('-s', '--offset', type=int_base0,
+            help='address within the device, which is written before the '
+                'data')
+    subparser.add_argument('-w', '--offset-width', type=int, default=1,
+            choices=(1, 2, 3, 4),
+            help='number of bytes of the offset (default: 1)')
+    subparser.add_argument('-c', '--chunk-size', type=int_base0,
+            default=chunk_size, help=chunk_help or
+                'bytes per transaction (default: %(default)s)')
+
+def create_parser():
     parser = argparse.ArgumentParser(
             description='Total Phase I2C/SPI host adapter CLI.')
     parser.add_argument('-v', action='store_true', dest='verbose',
@@ -95,7 +423,23 @@ def main(args=None):
     # scan sub command
     subparser = _sub.add_parser('scan',
             help='Find attached Aardvark devices')
-    subparser.set_defaults(func=scan)
+    subparser.set_defaults(func=scan, open_device=False)
+
+    # spi-xfer subcommand, 'spi' takes the bytes to write as its arguments
+    subparser = _sub.add_parser('spi-xfer',
+            help='SPI transfer streaming from and to files')
+    subparser.add_argument('input', nargs='?', default='-', metavar='FILE',
+            help='data to write (default: stdin)')
+    subparser.add_argument('-o', '--output', default='-',
+            help='file for the received data (default: stdout)')
+    subparser.add_argument('-O', '--output-format', choices=fileformat.FORMATS,
+            help='format of the output file (default: same as the input)')
+    subparser.add_argument('-c', '--chunk-size', type=int_base0,
+            default=transfer.SPI_CHUNK_SIZE,
+            help='bytes per SPI transaction (default: %(default)s)')
+    subparser.add_argument('-f', '--format', choices=fileformat.FORMATS,
+            default='raw', help='file format (default: raw)')
+    subparser.set_defaults(func=spi_xfer)
 
     # spi subcommand
     subparser = _sub.add_parser('spi', help='SPI commands')
@@ -134,6 +478,78 @@ def main(args=None):
             help='byte to write')
     subparser.set_defaults(func=i2c_wrrd)
 
+    # i2c scan
+    subparser = _sub_i2c.add_parser('scan', help='scan the bus for devices')
+    subparser.add_argument('-r', '--read', action='store_const',
+            dest='probe', const='read', default='write',
+            help='probe with a one-byte read instead of a zero-length write')
+    subparser.add_argument('-a', '--all', action='store_false',
+            dest='open_device',
+            help='scan the buses of all attached devices in parallel')
+    subparser.set_defaults(func=i2c_scan)
+
+    # i2c dump
+    subparser = _sub_i2c.add_parser('dump',
+            help='read a large amount of data into a file')
+    subparser.add_argument('i2c_address', type=byte, metavar='ADDR',
+            help='I2C slave address')
+    subparser.add_argument('num_bytes', type=int_base0, metavar='NUM_BYTES',
+            help='number of bytes to read')
+    subparser.add_argument('-o', '--output', default='-',
+            help='output file (default: stdout)')
+    _add_transfer_options(subparser, chunk_size=4096)
+    subparser.set_defaults(func=i2c_dump)
+
+    # i2c load
+    subparser = _sub_i2c.add_parser('load',
+            help='write the data of a file, an Intel HEX file is written at '
+                'its own addresses')
+    subparser.add_argument('i2c_address', type=byte, metavar='ADDR',
+            help='I2C slave address')
+    subparser.add_argument('input', nargs='?', default='-', metavar='FILE',
+            help='input file (default: stdin)')
+    _add_transfer_options(subparser, chunk_size=16,
+            chunk_help='bytes per write transaction, writes are split on '
+                'multiples of it. Must not exceed the page size of an '
+                'EEPROM (default: %(default)s)')
+    subparser.set_defaults(func=i2c_load)
+
+    # script subcommand
+    subparser = _sub.add_parser('script', help='transaction scripts')
+    _sub_script = subparser.add_subparsers()
+
+    # script run
+    subparser = _sub_script.add_parser('run',
+            help='replay a script and check the expectations')
+    subparser.add_argument('script', metavar='SCRIPT',
+            help='script file (text or compiled)')
+    subparser.add_argument('-n', '--repeat', type=int, default=1,
+            help='number of times the script is replayed')
+    subparser.add_argument('-x', '--stop-on-mismatch', action='store_true',
+            help='stop at the first failed expectation')
+    subparser.set_defaults(func=script_run)
+
+    # script compile
+    subparser = _sub_script.add_parser('compile',
+            help='validate a script and save it in binary form')
+    subparser.add_argument('script', metavar='SCRIPT', help='text script')
+    subparser.add_argument('output', metavar='OUTPUT', help='output file')
+    subparser.set_defaults(func=script_compile, open_device=False)
+
+    # batch subcommand
+    subparser = _sub.add_parser('batch',
+            help='run many commands with the device kept open')
+    subparser.add_argument('file', metavar='FILE', nargs='?', default='-',
+            help='file with one command per line, "-" (the default) reads '
+                'from stdin and shows a prompt on a terminal')
+    subparser.add_argument('-x', '--stop-on-error', action='store_true',
+            help='stop at the first failing command')
+    subparser.set_defaults(func=batch)
+
+    return parser
+
+def main(args=None):
+    parser = create_parser()
     args = parser.parse_args(args)
 
     logging.basicConfig()
@@ -141,21 +557,16 @@ def main(args=None):
         logging.getLogger('pyaardvark').setLevel(logging.DEBUG)
 
     a = None
-    ret = 0
     try:
-        if args.func != scan:
+        if getattr(args, 'open_device', True):
             a = pyaardvark.open(args.device)
-            a.target_power = args.enable_target_power
-
-        args.func(a, args)
+        return run_command(a, args)
     except IOError as e:
         print(e)
-        ret = 1
+        return 1
     finally:
         if a is not None:
             a.close()
 
-    return ret
-
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -39,6 +39,15 @@ I2C_NO_STOP = 0x04
 I2C_SIZED_READ = 0x10
 I2C_SIZED_READ_EXTRA1 = 0x20
 
+I2C_STATUS_OK = 0
+I2C_STATUS_BUS_ERROR = 1
+I2C_STATUS_SLA_ACK = 2
+I2C_STATUS_SLA_NACK = 3
+I2C_STATUS_DATA_NACK = 4
+I2C_STATUS_ARB_LOST = 5
+I2C_STATUS_BUS_LOCKED = 6
+I2C_STATUS_LAST_DATA_ACK = 7
+
 I2C_PULLUP_NONE = 0x00
 I2C_PULLUP_BOTH = 0x03
 I2C_PULLUP_QUERY = 0x80
@@ -47,12 +56,25 @@ TARGET_POWER_NONE = 0x00
 TARGET_POWER_BOTH = 0x03
 TARGET_POWER_QUERY = 0x80
 
+GPIO_SCL = 0x01
+GPIO_SDA = 0x02
+GPIO_MISO = 0x04
+GPIO_SCK = 0x08
+GPIO_MOSI = 0x10
+GPIO_SS = 0x20
+GPIO_ALL = 0x3f
+
 POLL_NO_DATA = 0x00
 POLL_I2C_READ = 0x01
 POLL_I2C_WRITE = 0x02
 POLL_SPI = 0x04
 POLL_I2C_MONITOR = 0x08
 
+I2C_MONITOR_DATA = 0x00ff
+I2C_MONITOR_NACK = 0x0100
+I2C_MONITOR_CMD_START = 0xff00
+I2C_MONITOR_CMD_STOP = 0xff01
+
 SPI_POL_RISING_FALLING = 0
 SPI_POL_FALLING_RISING = 1
 SPI_PHASE_SAMPLE_SETUP = 0
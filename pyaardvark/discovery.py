@@ -0,0 +1,206 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Index of the attached devices, which maps port numbers to serial numbers
+and versions.
+
+If the API supports `py_aa_find_devices_ext`, the serial numbers are
+reported together with the port numbers and no device has to be opened.
+Otherwise, only ports which weren't seen before are opened to read their
+serial numbers.
+
+The index can be stored in a file, so other processes can reuse it. The
+:data:`default_index`, which is used by :func:`pyaardvark.open`, uses the
+file given in the ``PYAARDVARK_DEVICE_CACHE`` environment variable.
+"""
+
+import collections
+import json
+import logging
+import os
+import threading
+
+from . import aardvark
+from .constants import *
+
+log = logging.getLogger(__name__)
+
+#: An entry of the :class:`DeviceIndex`. The versions are `None` if the
+#: device wasn't opened yet.
+DeviceInfo = collections.namedtuple('DeviceInfo',
+        'port serial_number in_use firmware_version hardware_revision')
+
+class DeviceIndex(object):
+    """Maps port numbers to serial numbers and versions of the attached
+    devices.
+
+    If `cache_file` is given, the index is loaded from and saved to that
+    file.
+    """
+
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file
+        self._devices = dict()
+        self._in_use = dict()
+        self._lock = threading.RLock()
+        if cache_file is not None:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file) as f:
+                devices = json.load(f)
+        except (IOError, ValueError) as e:
+            log.debug('Could not load device cache %s: %s',
+                    self.cache_file, e)
+            return
+        for (port, info) in devices.items():
+            self._devices[int(port)] = info
+
+    def _save(self):
+        if self.cache_file is None:
+            return
+        tmp = '%s.%d' % (self.cache_file, os.getpid())
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self._devices, f)
+            os.rename(tmp, self.cache_file)
+        except (IOError, OSError) as e:
+            log.warning('Could not save device cache %s: %s',
+                    self.cache_file, e)
+
+    def refresh(self, force=False):
+        """Update the index. Only ports which are new, or all ports if
+        `force` is `True`, are looked up. Returns `True` if the index
+        changed.
+        """
+        with self._lock:
+            if hasattr(aardvark.api, 'py_aa_find_devices_ext'):
+                changed = self._refresh_ext()
+            else:
+                changed = self._refresh_open(force)
+            if changed:
+                self._save()
+            return changed
+
+    def _refresh_ext(self):
+        devices = dict()
+        in_use = dict()
+        for (port, unique_id) in aardvark._find_devices_ext():
+            in_use[port & ~PORT_NOT_FREE] = bool(port & PORT_NOT_FREE)
+            port &= ~PORT_NOT_FREE
+            info = self._devices.get(port)
+            serial_number = aardvark._unique_id_str(unique_id)
+            if info is None or info['serial_number'] != serial_number:
+                info = dict(serial_number=serial_number)
+            devices[port] = info
+        self._in_use = in_use
+        changed = devices != self._devices
+        self._devices = devices
+        return changed
+
+    def _refresh_open(self, force):
+        in_use = dict()
+        for port in aardvark._find_devices():
+            in_use[port & ~PORT_NOT_FREE] = bool(port & PORT_NOT_FREE)
+        self._in_use = in_use
+
+        changed = False
+        for port in list(self._devices):
+            if port not in in_use:
+                del self._devices[port]
+                changed = True
+        for (port, used) in in_use.items():
+            if used or (port in self._devices and not force):
+                continue
+            try:
+                dev = aardvark.Aardvark(port)
+            except IOError as e:
+                log.debug('Could not open port %d: %s', port, e)
+                continue
+            try:
+                info = self._info(dev)
+            finally:
+                dev.close()
+            if self._devices.get(port) != info:
+                self._devices[port] = info
+                changed = True
+        return changed
+
+    def _info(self, dev):
+        return dict(serial_number=dev.unique_id_str(),
+                firmware_version=dev.firmware_version,
+                hardware_revision=dev.hardware_revision)
+
+    def devices(self):
+        """Return a list of :data:`DeviceInfo` tuples, sorted by port."""
+        with self._lock:
+            return [DeviceInfo(port, info.get('serial_number'),
+                    self._in_use.get(port, False),
+                    info.get('firmware_version'),
+                    info.get('hardware_revision'))
+                    for (port, info) in sorted(self._devices.items())]
+
+    def port(self, serial_number):
+        """Return the port of the device with `serial_number` according to
+        the index or `None`.
+        """
+        with self._lock:
+            for (port, info) in self._devices.items():
+                if info.get('serial_number') == serial_number:
+                    return port
+        return None
+
+    def serial_number(self, port):
+        """Return the serial number of the device at `port` according to
+        the index or `None`.
+        """
+        with self._lock:
+            return self._devices.get(port, {}).get('serial_number')
+
+    def open(self, serial_number):
+        """Open the device with the given serial number and return an
+        :class:`pyaardvark.Aardvark` object.
+
+        The index is refreshed, the port is looked up and the serial number
+        of the opened device is verified. If it doesn't match (eg. because
+        the devices were replugged), the whole index is rebuilt once.
+
+        Raises an :class:`IOError` if there is no such device.
+        """
+        for force in (False, True):
+            self.refresh(force)
+            port = self.port(serial_number)
+            if port is None:
+                continue
+            try:
+                dev = aardvark.Aardvark(port)
+            except IOError as e:
+                log.debug('Could not open port %d: %s', port, e)
+                continue
+            info = self._info(dev)
+            if info['serial_number'] == serial_number:
+                with self._lock:
+                    if self._devices.get(port) != info:
+                        self._devices[port] = info
+                        self._save()
+                return dev
+            dev.close()
+        raise IOError(aardvark.error_string(ERR_UNABLE_TO_OPEN))
+
+
+#: The index used by :func:`pyaardvark.open`.
+default_index = DeviceIndex(os.environ.get('PYAARDVARK_DEVICE_CACHE'))
@@ -0,0 +1,189 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Access to 24Cxx compatible I2C EEPROMs."""
+
+import array
+import time
+
+from .constants import *
+from .aardvark import i2c_status_string
+
+#: Size, page size and address width of common parts.
+PARTS = {
+    '24c01': (128, 8, 1),
+    '24c02': (256, 8, 1),
+    '24c04': (512, 16, 1),
+    '24c08': (1024, 16, 1),
+    '24c16': (2048, 16, 1),
+    '24c32': (4096, 32, 2),
+    '24c64': (8192, 32, 2),
+    '24c128': (16384, 64, 2),
+    '24c256': (32768, 64, 2),
+    '24c512': (65536, 128, 2),
+    '24m01': (131072, 256, 2),
+    '24m02': (262144, 256, 2),
+}
+
+#: Largest number of bytes which can be read with a single transaction.
+MAX_READ_SIZE = 65535
+
+class EEPROM(object):
+    """An I2C EEPROM connected to the Aardvark adapter `device`.
+
+    `size` and `page_size` are given in bytes. `address_width` is the number
+    of address bytes sent to the device. If it is not given, it is derived
+    from the size. For parts with more memory than can be addressed with
+    these bytes, the upper address bits are put into the I2C slave address
+    (eg. the 24C16 occupies the slave addresses 0x50 to 0x57).
+
+    The end of an internal write cycle is detected by acknowledge polling,
+    ie. the device is addressed until it responds again. If it doesn't
+    within `write_timeout` seconds an :exc:`IOError` is raised.
+
+    Usually, you'd use :meth:`from_part` to create an instance.
+    """
+
+    def __init__(self, device, size, page_size, address_width=None,
+            i2c_address=0x50, write_timeout=0.1):
+        if address_width is None:
+            address_width = 1 if size <= 2048 else 2
+        self.device = device
+        self.size = size
+        self.page_size = page_size
+        self.address_width = address_width
+        self.i2c_address = i2c_address
+        self.write_timeout = write_timeout
+        self._block_size = 1 << (8 * address_width)
+        # slave address of a write cycle which may still be in progress
+        self._busy = None
+
+    @classmethod
+    def from_part(cls, device, part, i2c_address=0x50, **kwargs):
+        """Create an instance for a part listed in :data:`PARTS`, eg.
+        ``EEPROM.from_part(a, '24c512')``.
+        """
+        (size, page_size, address_width) = PARTS[part.lower()]
+        return cls(device, size, page_size, address_width, i2c_address,
+                **kwargs)
+
+    def __len__(self):
+        return self.size
+
+    def _check_range(self, offset, length):
+        if offset < 0 or length < 0 or offset + length > self.size:
+            raise ValueError('range 0x%x+%d exceeds the size of the EEPROM'
+                    % (offset, length))
+
+    def _address(self, offset):
+        """Return the slave address and the address bytes for `offset`."""
+        (block, offset) = divmod(offset, self._block_size)
+        header = array.array('B', [(offset >> (8 * i)) & 0xff
+                for i in reversed(range(self.address_width))])
+        return self.i2c_address + block, header
+
+    def _poll(self, i2c_address, data):
+        """Write `data` to the device, retrying as long as it doesn't
+        acknowledge its address because a write cycle is in progress.
+        """
+        deadline = None
+        while True:
+            (status, _) = self.device.i2c_master_write_ext(i2c_address, data)
+            if status == I2C_STATUS_OK:
+                return
+            if status != I2C_STATUS_SLA_NACK:
+                raise IOError(i2c_status_string(status))
+            now = time.time()
+            if deadline is None:
+                deadline = now + self.write_timeout
+            elif now > deadline:
+                raise IOError('EEPROM at 0x%02x not responding'
+                        % i2c_address)
+
+    def wait_ready(self):
+        """Wait until a pending write cycle has finished."""
+        if self._busy is not None:
+            self._poll(self._busy, b'')
+            self._busy = None
+
+    def read(self, offset=0, length=None):
+        """Read `length` bytes starting at `offset`. If `length` is not
+        given, everything up to the end of the EEPROM is read.
+        """
+        if length is None:
+            length = self.size - offset
+        buf = bytearray(length)
+        self.read_into(offset, buf)
+        return bytes(buf)
+
+    def read_into(self, offset, buf):
+        """Read `len(buf)` bytes starting at `offset` into the writable
+        buffer `buf`.
+
+        The data is read with as few sequential reads as possible. A new
+        read is only started at a block boundary (for parts which use more
+        than one slave address) or if the transaction limit of the adapter is
+        reached.
+        """
+        length = len(buf)
+        self._check_range(offset, length)
+        self.wait_ready()
+
+        pos = 0
+        while pos < length:
+            n = min(length - pos, MAX_READ_SIZE,
+                    self._block_size - (offset % self._block_size))
+            (i2c_address, header) = self._address(offset)
+            self.device.i2c_master_write(i2c_address, header, I2C_NO_STOP)
+            if n == length:
+                chunk = buf
+            else:
+                chunk = bytearray(n)
+            ret = self.device.i2c_master_read_into(i2c_address, chunk)
+            if ret != n:
+                raise IOError('short read from EEPROM at 0x%02x'
+                        % i2c_address)
+            if chunk is not buf:
+                buf[pos:pos + n] = chunk
+            pos += n
+            offset += n
+
+    def write(self, data, offset=0):
+        """Write `data` starting at `offset`.
+
+        The data is split on page boundaries, so each page is programmed with
+        a single write transaction. Instead of waiting a fixed time for the
+        write cycle to finish, the next page write is simply retried until
+        the device acknowledges it. The method returns after the last write
+        cycle has finished.
+        """
+        data = memoryview(data)
+        length = len(data)
+        self._check_range(offset, length)
+
+        pos = 0
+        while pos < length:
+            n = min(length - pos, self.page_size - (offset % self.page_size))
+            (i2c_address, page) = self._address(offset)
+            page.fromstring(data[pos:pos + n].tobytes())
+            if self._busy is not None and self._busy != i2c_address:
+                self.wait_ready()
+            self._poll(i2c_address, page)
+            self._busy = i2c_address
+            pos += n
+            offset += n
+
+        self.wait_ready()
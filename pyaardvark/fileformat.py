@@ -0,0 +1,216 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Streaming conversion of binary data to and from files.
+
+Three formats are supported: ``raw`` binary, ``hex`` (a hex dump with 16
+bytes per line, each prefixed by its address) and ``ihex`` (Intel HEX).
+Both directions work on a stream of chunks, so the memory used doesn't
+depend on the amount of data. All files have to be opened in binary mode.
+
+The objects returned by :func:`encoder` and :func:`decoder` can be passed
+as sink and source to the functions of :mod:`pyaardvark.transfer`.
+"""
+
+import binascii
+import struct
+
+FORMATS = ('raw', 'hex', 'ihex')
+
+# largest chunk yielded for a gap in an Intel HEX file
+_MAX_FILL = 65536
+
+class RawWriter(object):
+    def __init__(self, f, address=0):
+        self.f = f
+
+    def write(self, data):
+        self.f.write(data)
+
+    def close(self):
+        self.f.flush()
+
+class _LineWriter(object):
+    """Collects the data into lines of `line_size` bytes."""
+    line_size = 16
+
+    def __init__(self, f, address=0):
+        self.f = f
+        self.address = address
+        self._pending = bytearray()
+
+    def write(self, data):
+        pending = self._pending
+        pending += data
+        size = self.line_size
+        pos = 0
+        while len(pending) - pos >= size:
+            self._line(pending[pos:pos + size])
+            pos += size
+        del pending[:pos]
+
+    def _line(self, data):
+        self._emit(data)
+        self.address += len(data)
+
+    def close(self):
+        if self._pending:
+            self._line(self._pending)
+            self._pending = bytearray()
+        self.f.flush()
+
+class HexWriter(_LineWriter):
+    """Writes a hex dump, eg. ``00000010: 00 01 02 03 ...``."""
+
+    def _emit(self, data):
+        self.f.write(('%08x: %s\n' % (self.address,
+                ' '.join('%02x' % b for b in data))).encode('ascii'))
+
+class IntelHexWriter(_LineWriter):
+    """Writes Intel HEX data records. Extended linear address records are
+    inserted as needed, the end of file record is written on
+    :meth:`close`.
+    """
+
+    def __init__(self, f, address=0):
+        super(IntelHexWriter, self).__init__(f, address)
+        self._upper = 0
+
+    def _record(self, kind, address, data):
+        record = bytearray([len(data), (address >> 8) & 0xff,
+                address & 0xff, kind]) + data
+        record.append(-sum(record) & 0xff)
+        self.f.write(b':' + binascii.hexlify(bytes(record)).upper() + b'\n')
+
+    def _line(self, data):
+        # a record must not cross a 64k boundary
+        split = 0x10000 - (self.address & 0xffff)
+        if split < len(data):
+            self._line(data[:split])
+            data = data[split:]
+        upper = self.address >> 16
+        if upper != self._upper:
+            self._record(0x04, 0, bytearray(struct.pack('>H', upper)))
+            self._upper = upper
+        self._record(0x00, self.address & 0xffff, data)
+        self.address += len(data)
+
+    def close(self):
+        super(IntelHexWriter, self).close()
+        self._record(0x01, 0, bytearray())
+        self.f.flush()
+
+def encoder(fmt, f, address=0):
+    """Return a writer object for the format `fmt` writing to the binary
+    file `f`. It has the methods `write(data)` and `close()`, the latter
+    has to be called after the last chunk. `address` is the address of the
+    first byte.
+    """
+    if fmt == 'raw':
+        return RawWriter(f, address)
+    if fmt == 'hex':
+        return HexWriter(f, address)
+    if fmt == 'ihex':
+        return IntelHexWriter(f, address)
+    raise ValueError('unknown format %r' % (fmt,))
+
+def read_hex(f):
+    """Yield the data of a hex dump line by line. Anything up to a colon
+    is treated as the address and ignored, so the output of
+    :class:`HexWriter` and plain hex byte lists are both accepted.
+    """
+    for (lineno, line) in enumerate(f, 1):
+        line = line.split(b'#', 1)[0]
+        line = line.split(b':', 1)[-1]
+        digits = b''.join(line.split())
+        if not digits:
+            continue
+        try:
+            yield binascii.unhexlify(digits)
+        except (TypeError, binascii.Error):
+            raise ValueError('line %d: invalid hex data' % lineno)
+
+class IntelHexReader(object):
+    """Iterates over the data of the Intel HEX file `f` record by record.
+    Gaps between the records are filled with ``0xff``, the records must be
+    in ascending order.
+
+    `address` is the address of the first data record. It is None until
+    the first chunk has been returned.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.address = None
+
+    def __iter__(self):
+        base = 0
+        address = None
+        for (lineno, line) in enumerate(self.f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                if not line.startswith(b':'):
+                    raise ValueError()
+                record = bytearray(binascii.unhexlify(line[1:]))
+            except (TypeError, ValueError, binascii.Error):
+                raise ValueError('line %d: invalid record' % lineno)
+            if len(record) < 5 or len(record) != record[0] + 5:
+                raise ValueError('line %d: bad record length' % lineno)
+            if sum(record) & 0xff:
+                raise ValueError('line %d: bad checksum' % lineno)
+            kind = record[3]
+            data = record[4:-1]
+            if kind == 0x00:
+                start = base + (record[1] << 8 | record[2])
+                if address is None:
+                    self.address = start
+                else:
+                    if start < address:
+                        raise ValueError('line %d: records not in ascending '
+                                'order' % lineno)
+                    while address < start:
+                        n = min(start - address, _MAX_FILL)
+                        yield b'\xff' * n
+                        address += n
+                yield bytes(data)
+                address = start + len(data)
+            elif kind == 0x01:
+                return
+            elif kind == 0x02:
+                base = (data[0] << 8 | data[1]) << 4
+            elif kind == 0x04:
+                base = (data[0] << 8 | data[1]) << 16
+
+def read_intel_hex(f):
+    """Yield the data of an Intel HEX file record by record, see
+    :class:`IntelHexReader`.
+    """
+    return iter(IntelHexReader(f))
+
+def decoder(fmt, f):
+    """Return a source for the format `fmt` reading from the binary file
+    `f`, see :func:`pyaardvark.transfer.reader`. For ``ihex``, this is an
+    :class:`IntelHexReader`, which also tells the start address.
+    """
+    if fmt == 'raw':
+        return f
+    if fmt == 'hex':
+        return read_hex(f)
+    if fmt == 'ihex':
+        return IntelHexReader(f)
+    raise ValueError('unknown format %r' % (fmt,))
@@ -0,0 +1,259 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Statistics of the calls to the binary (or remote) API.
+
+Instrumentation is enabled with
+:func:`pyaardvark.aardvark.enable_instrumentation`, which puts a proxy in
+front of the API. If it is disabled, the API is called directly and there is
+no overhead at all.
+"""
+
+import logging
+import threading
+import time
+import types
+
+log = logging.getLogger(__name__)
+
+def _status_and_bytes(name, ret):
+    """Return the status and the number of bytes moved of the return value
+    `ret` of the API function `name`.
+    """
+    if isinstance(ret, tuple):
+        (status, second) = ret[0], ret[1]
+        if name in _EXT_FUNCTIONS:
+            # (status, num_bytes)
+            return status, second if status >= 0 else 0
+        # (num_bytes, addr) of the slave reads, (handle, version) of
+        # py_aa_open_ext
+        ret = status
+    if not isinstance(ret, int) or ret < 0:
+        return ret, 0
+    if name in _BYTE_FUNCTIONS:
+        return ret, ret * _BYTE_FUNCTIONS[name]
+    return ret, 0
+
+# functions which return a tuple (status, num_bytes)
+_EXT_FUNCTIONS = ('py_aa_i2c_write_ext', 'py_aa_i2c_read_ext')
+
+# functions which return the number of transferred units and the unit size
+_BYTE_FUNCTIONS = {
+    'py_aa_i2c_write': 1,
+    'py_aa_i2c_read': 1,
+    'py_aa_i2c_write_read': 1,
+    'py_aa_i2c_slave_read': 1,
+    'py_aa_i2c_slave_set_response': 1,
+    'py_aa_i2c_monitor_read': 2,
+    'py_aa_spi_write': 1,
+    'py_aa_spi_slave_read': 1,
+    'py_aa_spi_slave_set_response': 1,
+}
+
+class _FunctionStats(object):
+    __slots__ = ('calls', 'errors', 'bytes', 'total_time', 'min_time',
+            'max_time', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = {}
+        self.bytes = 0
+        self.total_time = 0.0
+        self.min_time = None
+        self.max_time = 0.0
+        # histogram[i] counts the calls which took less than 2**i
+        # microseconds (but not less than 2**(i-1))
+        self.histogram = []
+
+    def add(self, seconds, error, num_bytes):
+        self.calls += 1
+        self.bytes += num_bytes
+        self.total_time += seconds
+        if self.min_time is None or seconds < self.min_time:
+            self.min_time = seconds
+        if seconds > self.max_time:
+            self.max_time = seconds
+        if error is not None:
+            self.errors[error] = self.errors.get(error, 0) + 1
+        bucket = int(seconds * 1e6).bit_length()
+        histogram = self.histogram
+        if bucket >= len(histogram):
+            histogram.extend([0] * (bucket + 1 - len(histogram)))
+        histogram[bucket] += 1
+
+    def as_dict(self):
+        return dict(
+                calls=self.calls,
+                errors=dict(self.errors),
+                bytes=self.bytes,
+                total_time=self.total_time,
+                mean_time=self.total_time / self.calls if self.calls else 0.0,
+                min_time=self.min_time or 0.0,
+                max_time=self.max_time,
+                histogram=dict((1 << i, n)
+                    for (i, n) in enumerate(self.histogram) if n),
+        )
+
+class Instrumentation(object):
+    """Collects the statistics of all API calls.
+
+    For each API function the number of calls, the number of bytes moved,
+    the errors (by their `ERR_*` name or the name of the exception raised by
+    the API) and the latency are recorded. The latency histogram uses power
+    of two buckets in microseconds.
+
+    Statistics are kept per backend, so calls to the local USB library and
+    to a :class:`RemoteAardvarkAPI` can be told apart.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._callbacks = []
+        self.started_at = time.time()
+
+    def add_callback(self, callback):
+        """Call `callback(backend, name, seconds, status, num_bytes)` after
+        each API call. It is called in the thread which made the call, so it
+        should be fast.
+        """
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self._callbacks.remove(callback)
+
+    def record(self, backend, name, seconds, status, num_bytes):
+        """Record a single call. `status` is the status returned by the
+        API or the exception raised by it.
+        """
+        error = None
+        if isinstance(status, BaseException):
+            error = type(status).__name__
+        elif isinstance(status, int) and status < 0:
+            from .aardvark import error_string
+            error = error_string(status)
+        with self._lock:
+            stats = self._stats.get((backend, name))
+            if stats is None:
+                stats = self._stats[(backend, name)] = _FunctionStats()
+            stats.add(seconds, error, num_bytes)
+        for callback in self._callbacks:
+            callback(backend, name, seconds, status, num_bytes)
+
+    def snapshot(self, reset=False):
+        """Return the statistics as a dictionary
+        ``{backend: {function: stats}}``, where `stats` is a dictionary with
+        the keys `calls`, `errors`, `bytes`, `total_time`, `mean_time`,
+        `min_time`, `max_time` and `histogram`. Times are given in seconds,
+        the histogram maps the upper bound of each bucket (in microseconds)
+        to the number of calls.
+
+        If `reset` is `True`, all counters are cleared.
+        """
+        with self._lock:
+            items = list(self._stats.items())
+            if reset:
+                self._stats = {}
+                self.started_at = time.time()
+        snapshot = {}
+        for ((backend, name), stats) in items:
+            snapshot.setdefault(backend, {})[name] = stats.as_dict()
+        return snapshot
+
+    def reset(self):
+        self.snapshot(reset=True)
+
+def format_snapshot(snapshot):
+    """Format a snapshot as a single line, eg. for logging."""
+    parts = []
+    for backend in sorted(snapshot):
+        for (name, stats) in sorted(snapshot[backend].items()):
+            errors = sum(stats['errors'].values())
+            parts.append('%s:%s calls=%d bytes=%d errors=%d mean=%.1fus'
+                    % (backend, name.replace('py_aa_', ''), stats['calls'],
+                    stats['bytes'], errors, stats['mean_time'] * 1e6))
+    return '; '.join(parts)
+
+class PeriodicExporter(threading.Thread):
+    """Pass a snapshot of `instrumentation` to `export` every `interval`
+    seconds. By default, a single line is logged. If `reset` is set, the
+    counters are cleared after each export, so every snapshot covers only
+    the last interval.
+    """
+
+    def __init__(self, instrumentation, interval=10.0, export=None,
+            reset=False):
+        super(PeriodicExporter, self).__init__(name='aardvark-exporter')
+        self.daemon = True
+        self.instrumentation = instrumentation
+        self.interval = interval
+        self.export = export or self._log
+        self.reset = reset
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def _log(snapshot):
+        if snapshot:
+            log.info('%s', format_snapshot(snapshot))
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.export(self.instrumentation.snapshot(self.reset))
+
+    def stop(self):
+        """Stop the exporter. A final snapshot is exported."""
+        self._stopped.set()
+        self.join()
+        self.export(self.instrumentation.snapshot(self.reset))
+
+def _backend_name(api):
+    if isinstance(api, types.ModuleType):
+        return 'native'
+    return type(api).__name__
+
+class InstrumentedAPI(object):
+    """Proxy for the API object `api`, which reports every call of a
+    ``py_aa_*`` function to `instrumentation`.
+    """
+
+    def __init__(self, api, instrumentation, backend=None):
+        self._api = api
+        self._instrumentation = instrumentation
+        self._backend = backend or _backend_name(api)
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if not name.startswith('py_aa_') or not callable(attr):
+            return attr
+        record = self._instrumentation.record
+        backend = self._backend
+        clock = time.time
+
+        def wrapper(*args):
+            start = clock()
+            try:
+                ret = attr(*args)
+            except BaseException as e:
+                record(backend, name, clock() - start, e, 0)
+                raise
+            seconds = clock() - start
+            (status, num_bytes) = _status_and_bytes(name, ret)
+            record(backend, name, seconds, status, num_bytes)
+            return ret
+        wrapper.__name__ = name
+        # cache the wrapper, so __getattr__ is only called once per function
+        setattr(self, name, wrapper)
+        return wrapper
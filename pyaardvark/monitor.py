@@ -0,0 +1,277 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Passive I2C bus monitor.
+
+The monitor words are kept in a fixed size `array.array('H')` ring buffer
+and can optionally be streamed to a capture file. A capture file consists
+of an eight byte header followed by the monitor words as little endian
+unsigned 16 bit integers, so it can be memory-mapped with
+:func:`load_capture`.
+
+If NumPy is available, :func:`decode` works on whole arrays instead of
+single words.
+"""
+
+import array
+import collections
+import logging
+import sys
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .constants import *
+
+log = logging.getLogger(__name__)
+
+#: Header of a capture file.
+FILE_MAGIC = b'AAMON\x00\x01\x00'
+
+#: A decoded I2C transaction. `addr` is the 7 bit slave address, `read` is
+#: `True` for read transfers and `data` the transferred bytes (without the
+#: address byte). `nacks` has one boolean per byte including the address
+#: byte. `stop` is `False` if the transaction ended with a repeated start
+#: or the end of the capture.
+MonitorTransaction = collections.namedtuple('MonitorTransaction',
+        'addr read data nacks stop')
+
+def _transaction(data, nacks, stop):
+    return MonitorTransaction(data[0] >> 1, bool(data[0] & 1),
+            bytes(bytearray(data[1:])), list(nacks), stop)
+
+def _decode_python(words):
+    transactions = []
+    data = None
+    for word in words:
+        if word == I2C_MONITOR_CMD_START:
+            if data:
+                transactions.append(_transaction(data, nacks, False))
+            data = []
+            nacks = []
+        elif word == I2C_MONITOR_CMD_STOP:
+            if data:
+                transactions.append(_transaction(data, nacks, True))
+            data = None
+        elif data is not None:
+            data.append(word & I2C_MONITOR_DATA)
+            nacks.append(bool(word & I2C_MONITOR_NACK))
+    if data:
+        transactions.append(_transaction(data, nacks, False))
+    return transactions
+
+def _decode_numpy(words):
+    words = numpy.asarray(words, dtype=numpy.uint16)
+    is_start = words == I2C_MONITOR_CMD_START
+    is_stop = words == I2C_MONITOR_CMD_STOP
+    starts = numpy.flatnonzero(is_start)
+    if not len(starts):
+        return []
+
+    # every word gets the number of the transaction it belongs to, words
+    # before the first start condition get -1
+    segment = numpy.cumsum(is_start) - 1
+    # stop conditions seen since the start of the transaction
+    stops = numpy.cumsum(is_stop)
+    stops_in_segment = stops - stops[starts][numpy.maximum(segment, 0)]
+
+    valid = ((words & 0xff00) != 0xff00) & (segment >= 0) \
+            & (stops_in_segment == 0)
+    index = numpy.flatnonzero(valid)
+    values = (words[index] & I2C_MONITOR_DATA).astype(numpy.uint8)
+    nacks = (words[index] & I2C_MONITOR_NACK) != 0
+    bounds = numpy.searchsorted(segment[index], numpy.arange(len(starts) + 1))
+
+    ends = numpy.append(starts[1:] - 1, len(words) - 1)
+    stopped = stops[ends] - stops[starts] > 0
+
+    transactions = []
+    for i in range(len(starts)):
+        (lo, hi) = bounds[i], bounds[i + 1]
+        if lo == hi:
+            continue
+        data = values[lo:hi]
+        transactions.append(MonitorTransaction(int(data[0]) >> 1,
+                bool(data[0] & 1), data[1:].tostring(),
+                nacks[lo:hi].tolist(), bool(stopped[i])))
+    return transactions
+
+def decode(words):
+    """Decode a sequence of monitor words into a list of
+    :data:`MonitorTransaction` records.
+
+    `words` may be an `array.array('H')`, a NumPy array (eg. from
+    :func:`load_capture`) or any other sequence of integers. Data before
+    the first start condition is ignored. 10 bit addressing is not decoded.
+    """
+    if numpy is not None:
+        return _decode_numpy(words)
+    return _decode_python(words)
+
+def _check_magic(f):
+    if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+        raise ValueError('%s is not a monitor capture file' % f.name)
+
+def load_capture(filename):
+    """Memory-map a capture file and return its words as a read-only NumPy
+    array. Requires NumPy, see :func:`iter_capture` otherwise.
+    """
+    if numpy is None:
+        raise RuntimeError('load_capture() requires NumPy')
+    with open(filename, 'rb') as f:
+        _check_magic(f)
+    return numpy.memmap(filename, dtype='<u2', mode='r',
+            offset=len(FILE_MAGIC))
+
+def iter_capture(filename, chunk_words=65536):
+    """Yield the words of a capture file as `array.array('H')` chunks of at
+    most `chunk_words` words.
+    """
+    with open(filename, 'rb') as f:
+        _check_magic(f)
+        while True:
+            chunk = array.array('H')
+            chunk.fromstring(f.read(chunk_words * 2))
+            if not chunk:
+                break
+            if sys.byteorder == 'big':
+                chunk.byteswap()
+            yield chunk
+
+
+class I2CMonitor(object):
+    """Captures the monitor words of a device in a background thread.
+
+    The last `capacity` words are kept in memory, see :meth:`snapshot`. If
+    `filename` is given, all words are additionally streamed to that file.
+    Memory usage is therefore bounded regardless of the length of the
+    capture::
+
+      with I2CMonitor(a, filename='bus.cap') as mon:
+          time.sleep(60)
+      print decode(mon.snapshot())
+
+    While the monitor is running, the device must not be used otherwise.
+    """
+
+    def __init__(self, device, capacity=1 << 20, filename=None,
+            chunk_words=4096, poll_timeout_ms=10):
+        self.device = device
+        self.filename = filename
+        self.poll_timeout_ms = poll_timeout_ms
+        self._ring = array.array('H', (0,)) * capacity
+        self._chunk = array.array('H', (0,)) * chunk_words
+        self._total = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.stop()
+        return False
+
+    def start(self):
+        """Enable the monitor and start capturing."""
+        if self.filename is not None:
+            self._file = open(self.filename, 'wb')
+            self._file.write(FILE_MAGIC)
+        self.device.i2c_monitor_enable()
+        self._running = True
+        self._thread = threading.Thread(target=self._capture,
+                name='aardvark-i2c-monitor')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop capturing and disable the monitor. Does nothing if the
+        monitor isn't running.
+        """
+        if self._thread is None:
+            return
+        (thread, self._thread) = (self._thread, None)
+        self._running = False
+        thread.join()
+        self.device.i2c_monitor_disable()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _store(self, chunk, count):
+        if self._file is not None:
+            words = chunk[:count]
+            if sys.byteorder == 'big':
+                words.byteswap()
+            words.tofile(self._file)
+
+        ring = self._ring
+        capacity = len(ring)
+        with self._lock:
+            if count > capacity:
+                self._total += count - capacity
+                chunk = chunk[count - capacity:count]
+                count = capacity
+            pos = self._total % capacity
+            first = min(count, capacity - pos)
+            ring[pos:pos + first] = chunk[:first]
+            if first < count:
+                ring[:count - first] = chunk[first:count]
+            self._total += count
+
+    def _capture(self):
+        dev = self.device
+        while self._running:
+            try:
+                if not dev.poll(self.poll_timeout_ms) & POLL_I2C_MONITOR:
+                    continue
+                count = dev.i2c_monitor_read_into(self._chunk)
+            except IOError as e:
+                log.error('Reading monitor data failed: %s', e)
+                time.sleep(self.poll_timeout_ms / 1000.0)
+                continue
+            if count:
+                self._store(self._chunk, count)
+
+    def snapshot(self):
+        """Return the words in the ring buffer, oldest first, as an
+        `array.array('H')`.
+        """
+        with self._lock:
+            capacity = len(self._ring)
+            if self._total <= capacity:
+                return self._ring[:self._total]
+            pos = self._total % capacity
+            return self._ring[pos:] + self._ring[:pos]
+
+    def transactions(self):
+        """Decode the words in the ring buffer, see :func:`decode`."""
+        return decode(self.snapshot())
+
+    def stats(self):
+        """Return a dictionary with the number of captured `words` and the
+        number of words which were `overwritten` in the ring buffer.
+        """
+        with self._lock:
+            return dict(words=self._total,
+                    overwritten=max(0, self._total - len(self._ring)))
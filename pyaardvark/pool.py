@@ -0,0 +1,210 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from . import aardvark
+
+log = logging.getLogger(__name__)
+
+class DeviceFuture(Future):
+    """A :class:`concurrent.futures.Future` which additionally records
+    when the work item was queued, started and finished.
+    """
+
+    def __init__(self, key):
+        Future.__init__(self)
+        #: Port number or serial number of the device.
+        self.key = key
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def queue_time(self):
+        """Seconds the work item waited for the device."""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.queued_at
+
+    @property
+    def run_time(self):
+        """Seconds the work item was running on the device."""
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+class _DeviceWorker(threading.Thread):
+    def __init__(self, key, device):
+        threading.Thread.__init__(self, name='aardvark-%s' % (key,))
+        self.daemon = True
+        self.key = key
+        self.device = device
+        self.queue = queue.Queue()
+        self.started_at = time.time()
+        self.calls = 0
+        self.errors = 0
+        self.busy_time = 0.0
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            (future, func, args, kwargs) = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            future.started_at = time.time()
+            try:
+                result = func(self.device, *args, **kwargs)
+                error = None
+            except BaseException as e:
+                error = e
+            future.finished_at = time.time()
+            self.calls += 1
+            self.busy_time += future.finished_at - future.started_at
+            if error is not None:
+                self.errors += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        elapsed = time.time() - self.started_at
+        return dict(
+                calls=self.calls,
+                errors=self.errors,
+                queue_depth=self.queue.qsize(),
+                busy_time=self.busy_time,
+                utilization=self.busy_time / elapsed if elapsed else 0.0,
+                calls_per_second=self.calls / elapsed if elapsed else 0.0,
+        )
+
+
+class DevicePool(object):
+    """A set of Aardvark devices, each driven by its own worker thread.
+
+    The devices are selected either by their `ports` or by their
+    `serial_numbers`. If neither is given, all free devices returned by
+    :func:`pyaardvark.find_devices` are used. The port numbers or serial
+    numbers are used as keys for all results.
+
+    Work is passed as a callable which takes the
+    :class:`pyaardvark.Aardvark` object as its first argument::
+
+      with pyaardvark.DevicePool() as pool:
+          futures = pool.map(lambda a: a.i2c_master_read(0x50, 16))
+          for port, future in futures.items():
+              print port, future.result(), future.run_time
+
+    Work items for the same device are executed in order, work items for
+    different devices in parallel.
+    """
+
+    def __init__(self, ports=None, serial_numbers=None):
+        if serial_numbers is not None:
+            keys = list(serial_numbers)
+            opener = lambda sn: aardvark.open(serial_number=sn)
+        else:
+            if ports is None:
+                ports = aardvark.find_devices()
+            keys = list(ports)
+            opener = aardvark.open
+
+        self._workers = dict()
+        try:
+            for key in keys:
+                worker = _DeviceWorker(key, opener(key))
+                self._workers[key] = worker
+                worker.start()
+        except:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self._workers)
+
+    def keys(self):
+        """Return the keys of all devices in the pool."""
+        return list(self._workers.keys())
+
+    def device(self, key):
+        """Return the :class:`pyaardvark.Aardvark` object for `key`. It must
+        not be used while there is pending work for it.
+        """
+        return self._workers[key].device
+
+    def submit(self, key, func, *args, **kwargs):
+        """Schedule `func(device, *args, **kwargs)` on the device `key` and
+        return a :class:`DeviceFuture`.
+        """
+        future = DeviceFuture(key)
+        self._workers[key].queue.put((future, func, args, kwargs))
+        return future
+
+    def map(self, func, *args, **kwargs):
+        """Schedule `func(device, *args, **kwargs)` on every device. Returns
+        a dictionary which maps the device keys to :class:`DeviceFuture`
+        objects.
+        """
+        return dict((key, self.submit(key, func, *args, **kwargs))
+                for key in self._workers)
+
+    def run(self, func, *args, **kwargs):
+        """Like :meth:`map`, but waits until all devices are done and
+        returns a dictionary of the results. The first error is raised.
+        """
+        futures = self.map(func, *args, **kwargs)
+        return dict((key, f.result()) for (key, f) in futures.items())
+
+    def stats(self):
+        """Return a dictionary with the statistics of each device.
+
+        For each device the number of `calls` and `errors`, the current
+        `queue_depth`, the accumulated `busy_time`, the `utilization` of
+        the worker (busy time over wall time) and the `calls_per_second`
+        are reported. A high utilization with a low call rate points to a
+        slow bus, a low utilization with a deep queue to the Python side.
+        """
+        return dict((key, w.stats()) for (key, w) in self._workers.items())
+
+    def close(self):
+        """Wait for all pending work and close the devices."""
+        for worker in self._workers.values():
+            worker.queue.put(None)
+        for worker in self._workers.values():
+            worker.join()
+            try:
+                worker.device.close()
+            except IOError as e:
+                log.warning('Closing device %s failed: %s', worker.key, e)
+        self._workers.clear()
@@ -0,0 +1,247 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Register based I2C devices."""
+
+import array
+import collections
+import numbers
+
+class Register(collections.namedtuple('Register',
+        'name address volatile fields')):
+    """Description of a single register.
+
+    `fields` maps field names to `(shift, width)` tuples. Volatile registers
+    (eg. status registers) are never cached.
+    """
+    def __new__(cls, name, address, volatile=False, fields=None):
+        return super(Register, cls).__new__(cls, name, address, volatile,
+                fields or {})
+
+def _runs(addresses):
+    """Split the sorted `addresses` into runs of consecutive addresses."""
+    run = []
+    for addr in addresses:
+        if run and addr != run[-1] + 1:
+            yield run
+            run = []
+        run.append(addr)
+    if run:
+        yield run
+
+class RegisterMap(object):
+    """The registers of the I2C device `i2c_address` on the Aardvark adapter
+    `device`.
+
+    `registers` is a list of :class:`Register` descriptions. Registers can
+    also be accessed by their address, undeclared ones are treated as
+    non-volatile. Registers are `register_size` bytes wide and are selected
+    by sending `address_width` address bytes first. Multi-byte values are
+    transferred with the byte order `byteorder` (``'big'`` or
+    ``'little'``). The device has to increment its register pointer on each
+    access, so consecutive registers can be accessed with a single
+    transaction.
+
+    The values of non-volatile registers are cached. Writes to them are
+    deferred and sent to the device by :meth:`flush`, where dirty registers
+    with consecutive addresses are merged into a single write transaction.
+    Writes to volatile registers (eg. command registers) are sent at once,
+    after the pending writes. Pending writes are always flushed before the
+    device is read, so the order of accesses is preserved. Used as a context
+    manager, the map is flushed on exit.
+    """
+
+    def __init__(self, device, i2c_address, registers=(), address_width=1,
+            register_size=1, byteorder='big'):
+        self.device = device
+        self.i2c_address = i2c_address
+        self.address_width = address_width
+        self.register_size = register_size
+        self.byteorder = byteorder
+        self.registers = collections.OrderedDict(
+                (r.name, r) for r in registers)
+        self._volatile = set(r.address for r in registers if r.volatile)
+        self._cache = {}
+        self._dirty = {}
+        self._stats = collections.Counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        if type is None:
+            self.flush()
+
+    def address(self, register):
+        """Return the address of `register`, which is either the name of a
+        declared register or an address.
+        """
+        if isinstance(register, numbers.Integral):
+            return register
+        return self.registers[register].address
+
+    def _field(self, register, field):
+        if isinstance(register, numbers.Integral):
+            raise KeyError('register 0x%x has no fields' % register)
+        return self.registers[register].fields[field]
+
+    def _header(self, addr):
+        return array.array('B', [(addr >> (8 * i)) & 0xff
+                for i in reversed(range(self.address_width))])
+
+    def _decode(self, data, count):
+        size = self.register_size
+        values = []
+        for i in range(count):
+            word = bytearray(data[i * size:(i + 1) * size])
+            if self.byteorder == 'little':
+                word.reverse()
+            value = 0
+            for b in word:
+                value = (value << 8) | b
+            values.append(value)
+        return values
+
+    def _encode(self, values):
+        size = self.register_size
+        data = array.array('B')
+        for value in values:
+            word = [(value >> (8 * i)) & 0xff for i in range(size)]
+            if self.byteorder == 'big':
+                word.reverse()
+            data.extend(word)
+        return data
+
+    def _cacheable(self, addr):
+        return addr not in self._volatile
+
+    def read_block(self, register, count):
+        """Read `count` consecutive registers starting at `register` with a
+        single transaction and return their values as a list.
+        """
+        self.flush()
+        addr = self.address(register)
+        data = self.device.i2c_master_write_read(self.i2c_address,
+                self._header(addr), count * self.register_size)
+        if len(data) != count * self.register_size:
+            raise IOError('short read from register 0x%x' % addr)
+        values = self._decode(data, count)
+        self._stats['read_transactions'] += 1
+        self._stats['registers_read'] += count
+        for (i, value) in enumerate(values):
+            if self._cacheable(addr + i):
+                self._cache[addr + i] = value
+        return values
+
+    def read(self, register):
+        """Return the value of `register`. Non-volatile registers are only
+        read from the device on the first access.
+        """
+        addr = self.address(register)
+        if addr in self._dirty and self._cacheable(addr):
+            self._stats['hits'] += 1
+            return self._dirty[addr]
+        if addr in self._cache:
+            self._stats['hits'] += 1
+            return self._cache[addr]
+        self._stats['misses'] += 1
+        return self.read_block(addr, 1)[0]
+
+    def prefetch(self, registers=None):
+        """Fill the cache with the values of the given registers (default:
+        all declared non-volatile registers). Consecutive registers are read
+        with a single transaction.
+        """
+        if registers is None:
+            registers = [r.address for r in self.registers.values()
+                    if not r.volatile]
+        addresses = sorted(set(self.address(r) for r in registers))
+        for run in _runs(addresses):
+            self.read_block(run[0], len(run))
+
+    def write(self, register, value):
+        """Set `register` to `value`. The write is deferred until the next
+        :meth:`flush`, unless the register is volatile.
+        """
+        addr = self.address(register)
+        if value < 0 or value >> (8 * self.register_size):
+            raise ValueError('value 0x%x out of range' % value)
+        if self._cacheable(addr):
+            self._dirty[addr] = value
+        else:
+            # every write counts, eg. a reset followed by a start command
+            self.flush()
+            self._write_run(addr, [value])
+
+    def _write_run(self, addr, values):
+        data = self._header(addr)
+        data.extend(self._encode(values))
+        self.device.i2c_master_write(self.i2c_address, data)
+        self._stats['write_transactions'] += 1
+        self._stats['registers_written'] += len(values)
+        for (i, value) in enumerate(values):
+            if self._cacheable(addr + i):
+                self._cache[addr + i] = value
+            else:
+                self._cache.pop(addr + i, None)
+
+    def read_field(self, register, field):
+        """Return the value of `field` of `register`."""
+        (shift, width) = self._field(register, field)
+        return (self.read(register) >> shift) & ((1 << width) - 1)
+
+    def update(self, register, **fields):
+        """Change the given fields of `register` and leave the other bits
+        untouched, eg. ``regs.update('CTRL', EN=1, MODE=3)``. If the register
+        value is cached, no read access is necessary.
+        """
+        value = self.read(register)
+        for (field, field_value) in fields.items():
+            (shift, width) = self._field(register, field)
+            mask = ((1 << width) - 1) << shift
+            value = (value & ~mask) | ((field_value << shift) & mask)
+        self.write(register, value)
+
+    def flush(self):
+        """Write all dirty registers to the device. Each run of consecutive
+        addresses is written with a single transaction. If a write fails,
+        the registers not written yet stay pending.
+        """
+        for run in list(_runs(sorted(self._dirty))):
+            self._write_run(run[0], [self._dirty[addr] for addr in run])
+            for addr in run:
+                del self._dirty[addr]
+
+    def discard(self):
+        """Drop all pending writes."""
+        self._dirty.clear()
+
+    def invalidate(self):
+        """Clear the cache, eg. after a reset of the device."""
+        self._cache.clear()
+
+    def stats(self):
+        """Return a dictionary with the number of cache `hits` and `misses`,
+        the number of read and write transactions and registers, and the
+        number of write transactions saved by merging consecutive registers
+        (`coalesced`).
+        """
+        stats = dict((k, self._stats[k]) for k in ('hits', 'misses',
+                'read_transactions', 'registers_read',
+                'write_transactions', 'registers_written'))
+        stats['coalesced'] = (stats['registers_written']
+                - stats['write_transactions'])
+        return stats
@@ -0,0 +1,418 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Transaction scripts.
+
+A script is a fixed sequence of I2C, SPI and GPIO operations, which is
+parsed and validated once and can then be replayed on any number of
+adapters. The text format has one operation per line and uses the syntax
+of the command line tool::
+
+  # comments start with a hash
+  i2c bitrate 400
+  i2c wr 0x50 0x00 0x10 0xaa
+  i2c rd 0x50 2 expect 0x12 x
+  i2c wrrd 0x50 2 0x00 0x10 expect 0xaa 0xbb
+  spi bitrate 1000
+  spi mode 3
+  spi 0x9f 0 0 0 expect x 0xef 0x40 0x18
+  gpio dir 0x03
+  gpio set 0x01
+  gpio get expect 0x04/0x04
+  delay 10
+
+Numbers may be given in any base Python understands. The optional
+expectation of a read lists one entry per byte received: a value, ``x``
+(don't care) or ``value/mask`` to compare only some of the bits. The
+expectation of a SPI transfer may be shorter than the transfer.
+
+:meth:`Script.save` writes a compact binary form, which is loaded without
+any parsing.
+"""
+
+import array
+import collections
+import struct
+import time
+
+from .aardvark import (BATCH_I2C_WRITE, BATCH_I2C_READ, BATCH_I2C_WRITE_READ,
+        BATCH_SPI, BATCH_DELAY, BATCH_GPIO_SET, BATCH_GPIO_GET)
+from .constants import *
+
+OP_I2C_BITRATE = 'i2c_bitrate'
+OP_SPI_BITRATE = 'spi_bitrate'
+OP_SPI_MODE = 'spi_mode'
+OP_GPIO_DIRECTION = 'gpio_direction'
+
+#: A failed expectation. `line` is the line number within the script
+#: source, `expected` and `mask` are the expected bytes and their bit masks,
+#: `actual` are the bytes received.
+Mismatch = collections.namedtuple('Mismatch', 'line expected mask actual')
+
+class ScriptError(ValueError):
+    """Raised if a script can't be parsed."""
+
+    def __init__(self, msg, line=None, source='<script>'):
+        if line is not None:
+            msg = '%s:%d: %s' % (source, line, msg)
+        super(ScriptError, self).__init__(msg)
+        self.line = line
+
+def format_expectation(expected, mask):
+    """Format an expectation, masked out bytes are shown as ``xx``."""
+    parts = []
+    for (v, m) in zip(bytearray(expected), bytearray(mask)):
+        if m == 0xff:
+            parts.append('%02x' % v)
+        elif m == 0:
+            parts.append('xx')
+        else:
+            parts.append('%02x/%02x' % (v, m))
+    return ' '.join(parts)
+
+def _number(token, maximum, what):
+    try:
+        value = int(token, 0)
+    except ValueError:
+        raise ScriptError('%s "%s" is not a number' % (what, token))
+    if not 0 <= value <= maximum:
+        raise ScriptError('%s %d is not in range 0..%d'
+                % (what, value, maximum))
+    return value
+
+def _bytes(tokens):
+    return array.array('B', [_number(t, 0xff, 'byte') for t in tokens])
+
+def _expectation(tokens):
+    expected = array.array('B')
+    mask = array.array('B')
+    for token in tokens:
+        if token.lower() in ('x', 'xx'):
+            (v, m) = (0, 0)
+        elif '/' in token:
+            (v, m) = token.split('/', 1)
+            m = _number(m, 0xff, 'mask')
+            v = _number(v, 0xff, 'byte') & m
+        else:
+            (v, m) = (_number(token, 0xff, 'byte'), 0xff)
+        expected.append(v)
+        mask.append(m)
+    return expected, mask
+
+# commands consisting of two words, all others take their arguments after
+# the first word
+_TWO_WORD_COMMANDS = ('i2c', 'gpio', 'spi bitrate', 'spi mode')
+
+# commands which read data and may have an expectation
+_READ_COMMANDS = ('i2c rd', 'i2c wrrd', 'spi', 'gpio get')
+
+def _parse_op(tokens, line):
+    expected = mask = None
+    if 'expect' in tokens:
+        i = tokens.index('expect')
+        (expected, mask) = _expectation(tokens[i+1:])
+        tokens = tokens[:i]
+        if not expected:
+            raise ScriptError('empty expectation')
+
+    name = tokens[0].lower()
+    if name in _TWO_WORD_COMMANDS \
+            or ' '.join(tokens[:2]).lower() in _TWO_WORD_COMMANDS:
+        name = ' '.join(tokens[:2]).lower()
+        args = tokens[2:]
+    else:
+        args = tokens[1:]
+    if expected is not None and name not in _READ_COMMANDS:
+        raise ScriptError('"%s" does not read anything' % name)
+
+    def num_args(n, at_least=False):
+        if len(args) < n or not at_least and len(args) > n:
+            raise ScriptError('"%s" takes %s%d argument(s)'
+                    % (name, 'at least ' if at_least else '', n))
+
+    if name == 'i2c wr':
+        num_args(2, at_least=True)
+        return _Op(BATCH_I2C_WRITE, line,
+                addr=_number(args[0], 0x7f, 'address'),
+                data_out=_bytes(args[1:]))
+    if name in ('i2c rd', 'i2c wrrd'):
+        if name == 'i2c rd':
+            num_args(2)
+        else:
+            num_args(3, at_least=True)
+        length = _number(args[1], 0xffff, 'length')
+        if not length:
+            raise ScriptError('length must not be zero')
+        if expected is not None and len(expected) != length:
+            raise ScriptError('expected %d bytes, but %d are read'
+                    % (len(expected), length))
+        return _Op(BATCH_I2C_READ if name == 'i2c rd'
+                else BATCH_I2C_WRITE_READ, line,
+                addr=_number(args[0], 0x7f, 'address'), value=length,
+                data_out=_bytes(args[2:]) if name == 'i2c wrrd' else None,
+                expected=expected, mask=mask)
+    if name == 'spi':
+        num_args(1, at_least=True)
+        data = _bytes(args)
+        if expected is not None and len(expected) > len(data):
+            raise ScriptError('expected %d bytes, but only %d are '
+                    'transferred' % (len(expected), len(data)))
+        return _Op(BATCH_SPI, line, data_out=data, expected=expected,
+                mask=mask)
+    if name in ('i2c bitrate', 'spi bitrate'):
+        num_args(1)
+        return _Op(OP_I2C_BITRATE if name == 'i2c bitrate'
+                else OP_SPI_BITRATE, line,
+                value=_number(args[0], 0xffff, 'bitrate'))
+    if name == 'spi mode':
+        num_args(1)
+        mode = _number(args[0], 3, 'mode')
+        if mode not in (SPI_MODE_0, SPI_MODE_3):
+            raise ScriptError('SPI mode %d is not supported' % mode)
+        return _Op(OP_SPI_MODE, line, value=mode)
+    if name in ('gpio dir', 'gpio set'):
+        num_args(1)
+        return _Op(OP_GPIO_DIRECTION if name == 'gpio dir'
+                else BATCH_GPIO_SET, line,
+                value=_number(args[0], GPIO_ALL, 'GPIO mask'))
+    if name == 'gpio get':
+        num_args(0)
+        if expected is not None and len(expected) != 1:
+            raise ScriptError('expected %d values, but 1 is read'
+                    % len(expected))
+        return _Op(BATCH_GPIO_GET, line, expected=expected, mask=mask)
+    if name == 'delay':
+        num_args(1)
+        return _Op(BATCH_DELAY, line,
+                value=_number(args[0], 0xffffffff, 'delay'))
+    raise ScriptError('unknown command "%s"' % name)
+
+class _Op(object):
+    """A single compiled operation. All buffers are allocated here, so
+    replaying it doesn't allocate any memory.
+    """
+    __slots__ = ('kind', 'line', 'addr', 'value', 'data_out', 'data_in',
+            'expected', 'mask', 'checks')
+
+    def __init__(self, kind, line, addr=0, value=0, data_out=None,
+            expected=None, mask=None):
+        self.kind = kind
+        self.line = line
+        self.addr = addr
+        self.value = value
+        self.data_out = data_out
+        self.expected = expected
+        self.mask = mask
+        self.data_in = None
+        if kind in (BATCH_I2C_READ, BATCH_I2C_WRITE_READ):
+            self.data_in = array.array('B', b'\x00') * value
+        elif kind == BATCH_SPI:
+            self.data_in = array.array('B', b'\x00') * len(data_out)
+        elif kind == BATCH_GPIO_GET:
+            self.data_in = array.array('B', b'\x00')
+        # If all bits of all received bytes are expected, the buffers are
+        # compared as a whole. Otherwise `checks` lists the bytes to compare
+        # as (index, mask, value) tuples.
+        self.checks = None
+        if expected is not None and (len(expected) != len(self.data_in)
+                or mask.count(0xff) != len(mask)):
+            self.checks = [(i, m, v) for (i, (m, v))
+                    in enumerate(zip(mask, expected)) if m]
+
+# kinds of operations in the binary format, the index is the type code
+_KINDS = (BATCH_I2C_WRITE, BATCH_I2C_READ, BATCH_I2C_WRITE_READ, BATCH_SPI,
+        BATCH_DELAY, BATCH_GPIO_SET, BATCH_GPIO_GET, OP_GPIO_DIRECTION,
+        OP_I2C_BITRATE, OP_SPI_BITRATE, OP_SPI_MODE)
+
+_HEADER = struct.Struct('>5sI')
+# kind, line, address, value, length of data_out, length of expected, masked
+_RECORD = struct.Struct('>BIBIHHB')
+
+class Script(object):
+    """A parsed and validated script. Use :meth:`parse` or :meth:`load` to
+    create one and :meth:`run` to replay it.
+    """
+
+    MAGIC = b'AAVS\x01'
+
+    def __init__(self, ops=(), source='<script>'):
+        self.ops = list(ops)
+        self.source = source
+
+    def __len__(self):
+        return len(self.ops)
+
+    @property
+    def uses_i2c(self):
+        return any(op.kind in (BATCH_I2C_WRITE, BATCH_I2C_READ,
+                BATCH_I2C_WRITE_READ) for op in self.ops)
+
+    @property
+    def uses_spi(self):
+        return any(op.kind == BATCH_SPI for op in self.ops)
+
+    @classmethod
+    def parse(cls, text, source='<script>'):
+        """Parse and validate the text form of a script. A
+        :exc:`ScriptError` is raised for the first invalid line.
+        """
+        ops = []
+        for (line, text_line) in enumerate(text.splitlines(), 1):
+            tokens = text_line.split('#', 1)[0].split()
+            if not tokens:
+                continue
+            try:
+                ops.append(_parse_op(tokens, line))
+            except ScriptError as e:
+                raise ScriptError(str(e), line, source)
+        return cls(ops, source)
+
+    @classmethod
+    def from_bytes(cls, data, source='<script>'):
+        """Load the binary form of a script."""
+        data = bytes(data)
+        if not data.startswith(cls.MAGIC):
+            raise ScriptError('%s: not a compiled script' % source)
+        (_, count) = _HEADER.unpack_from(data)
+        pos = _HEADER.size
+        ops = []
+        try:
+            for _ in range(count):
+                (kind, line, addr, value, num_out, num_expected, masked) = \
+                        _RECORD.unpack_from(data, pos)
+                pos += _RECORD.size
+                data_out = expected = mask = None
+                if num_out:
+                    data_out = array.array('B', data[pos:pos + num_out])
+                    pos += num_out
+                if num_expected:
+                    expected = array.array('B',
+                            data[pos:pos + num_expected])
+                    pos += num_expected
+                    if masked:
+                        mask = array.array('B', data[pos:pos + num_expected])
+                        pos += num_expected
+                    else:
+                        mask = array.array('B', b'\xff') * num_expected
+                ops.append(_Op(_KINDS[kind], line, addr, value, data_out,
+                        expected, mask))
+        except (struct.error, IndexError):
+            raise ScriptError('%s: corrupt compiled script' % source)
+        return cls(ops, source)
+
+    def to_bytes(self):
+        """Return the binary form of the script."""
+        parts = [_HEADER.pack(self.MAGIC, len(self.ops))]
+        for op in self.ops:
+            data_out = op.data_out.tostring() if op.data_out is not None \
+                    else b''
+            expected = op.expected.tostring() if op.expected is not None \
+                    else b''
+            masked = op.mask is not None \
+                    and op.mask.count(0xff) != len(op.mask)
+            parts.append(_RECORD.pack(_KINDS.index(op.kind), op.line,
+                    op.addr, op.value, len(data_out), len(expected), masked))
+            parts += [data_out, expected]
+            if masked:
+                parts.append(op.mask.tostring())
+        return b''.join(parts)
+
+    @classmethod
+    def load(cls, filename):
+        """Load a script from a file in either text or binary form."""
+        with open(filename, 'rb') as f:
+            data = f.read()
+        if data.startswith(cls.MAGIC):
+            return cls.from_bytes(data, filename)
+        return cls.parse(data.decode('utf-8'), filename)
+
+    def save(self, filename):
+        """Save the binary form of the script."""
+        with open(filename, 'wb') as f:
+            f.write(self.to_bytes())
+
+    def run(self, device, stop_on_mismatch=False):
+        """Replay the script on the :class:`~pyaardvark.Aardvark` object
+        `device` and return a list of :data:`Mismatch` tuples, one for each
+        failed expectation.
+
+        The interfaces used by the script are enabled first. If the adapter
+        reports an error, an :exc:`IOError` including the script line is
+        raised.
+        """
+        if self.uses_i2c:
+            device.enable_i2c = True
+        if self.uses_spi:
+            device.enable_spi = True
+
+        i2c_write = device.i2c_master_write
+        i2c_read_into = device.i2c_master_read_into
+        spi_transfer_into = device.spi_transfer_into
+        mismatches = []
+        op = None
+        try:
+            for op in self.ops:
+                kind = op.kind
+                data_in = op.data_in
+                if kind == BATCH_I2C_WRITE:
+                    i2c_write(op.addr, op.data_out)
+                    continue
+                elif kind == BATCH_I2C_READ:
+                    num_read = i2c_read_into(op.addr, data_in)
+                elif kind == BATCH_I2C_WRITE_READ:
+                    i2c_write(op.addr, op.data_out, I2C_NO_STOP)
+                    num_read = i2c_read_into(op.addr, data_in)
+                elif kind == BATCH_SPI:
+                    num_read = spi_transfer_into(op.data_out, data_in)
+                elif kind == BATCH_GPIO_GET:
+                    data_in[0] = device.gpio_get()
+                    num_read = 1
+                elif kind == BATCH_GPIO_SET:
+                    device.gpio_set(op.value)
+                    continue
+                elif kind == BATCH_DELAY:
+                    time.sleep(op.value / 1000.0)
+                    continue
+                elif kind == OP_GPIO_DIRECTION:
+                    device.gpio_direction(op.value)
+                    continue
+                elif kind == OP_I2C_BITRATE:
+                    device.i2c_bitrate = op.value
+                    continue
+                elif kind == OP_SPI_BITRATE:
+                    device.spi_bitrate = op.value
+                    continue
+                elif kind == OP_SPI_MODE:
+                    device.spi_configure_mode(op.value)
+                    continue
+
+                expected = op.expected
+                if expected is None:
+                    continue
+                checks = op.checks
+                if num_read == len(data_in):
+                    if checks is None:
+                        if data_in == expected:
+                            continue
+                    elif all(data_in[i] & m == v for (i, m, v) in checks):
+                        continue
+                mismatches.append(Mismatch(op.line, expected.tostring(),
+                        op.mask.tostring(), data_in[:num_read].tostring()))
+                if stop_on_mismatch:
+                    break
+        except IOError as e:
+            raise IOError('%s:%d: %s' % (self.source, op.line, e))
+        return mismatches
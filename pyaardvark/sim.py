@@ -0,0 +1,726 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""A simulated Aardvark backend.
+
+:class:`SimulatedAPI` implements the functions of the binary API in pure
+Python. Virtual targets are attached to the I2C bus and the SPI bus of each
+simulated adapter::
+
+  from pyaardvark import sim
+  api = sim.install(sim.SimulatedAPI(num_devices=2))
+  api.attach_i2c(0, sim.EEPROMTarget(0x50, size=65536, page_size=128))
+  api.attach_spi(0, sim.SPIFlashTarget(size=1 << 20))
+
+  a = pyaardvark.open(0)
+  ...
+  sim.uninstall()
+
+Each adapter has a simulated clock, which is advanced by the duration of
+every transaction according to a :class:`TimingModel`. Time dependent
+behaviour of the targets (eg. write cycles of an EEPROM) is based on this
+clock, so a simulation is deterministic and runs as fast as possible. If
+the model is created with `realtime=True`, the transactions also take that
+long in real time.
+
+The I2C bus monitor is not simulated.
+"""
+
+import array
+import collections
+import threading
+import time
+
+from .constants import *
+
+#: Version tuple returned by :meth:`SimulatedAPI.py_aa_open_ext`.
+VERSION = (0x0500, 0x0300, 0x0300, 0x0500, 0x0300, 0x0500)
+
+_previous_api = []
+
+def install(api=None):
+    """Use `api` (default: a new :class:`SimulatedAPI`) as the API of
+    :mod:`pyaardvark.aardvark` and return it.
+    """
+    from . import aardvark
+    if api is None:
+        api = SimulatedAPI()
+    _previous_api.append(aardvark.api)
+    aardvark.api = api
+    return api
+
+def uninstall():
+    """Restore the API which was active before :func:`install`."""
+    from . import aardvark
+    aardvark.api = _previous_api.pop()
+
+def _tobytes(data, length):
+    if isinstance(data, array.array):
+        return data[:length].tostring()
+    return bytes(data[:length])
+
+def _store(buf, data):
+    """Copy `data` into the beginning of `buf`."""
+    if isinstance(buf, array.array):
+        buf[:len(data)] = array.array('B', data)
+    else:
+        buf[:len(data)] = data
+
+class TimingModel(object):
+    """Calculates the duration of transactions.
+
+    Every API call costs `usb_latency` seconds. On the I2C bus, each byte
+    (including the address byte) takes 9 clock cycles plus 2 cycles for the
+    start and stop condition. On the SPI bus, each byte takes 8 cycles.
+
+    If `realtime` is `True`, the calls actually sleep for the calculated
+    duration.
+    """
+
+    def __init__(self, usb_latency=0.0, realtime=False):
+        self.usb_latency = usb_latency
+        self.realtime = realtime
+
+    def i2c(self, bitrate_khz, num_bytes):
+        return self.usb_latency + (9 * (num_bytes + 1) + 2) \
+                / (bitrate_khz * 1000.0)
+
+    def spi(self, bitrate_khz, num_bytes):
+        return self.usb_latency + 8 * num_bytes / (bitrate_khz * 1000.0)
+
+class I2CTarget(object):
+    """Base class of the virtual I2C devices.
+
+    `addresses` lists the 7-bit slave addresses the device responds to.
+    :meth:`write` and :meth:`read` are called for each transaction with the
+    slave address and the simulated time `now`. A return value of `None`
+    (or `False` for writes) means that the device doesn't acknowledge its
+    address.
+    """
+    addresses = ()
+
+    def write(self, addr, data, now):
+        return False
+
+    def read(self, addr, length, now):
+        return None
+
+class EEPROMTarget(I2CTarget):
+    """A 24Cxx compatible EEPROM.
+
+    Parts with more memory than can be addressed by the `address_width`
+    address bytes occupy multiple slave addresses. After a page write, the
+    device doesn't respond for `write_time` seconds.
+    """
+
+    def __init__(self, address=0x50, size=256, page_size=8,
+            address_width=None, write_time=0.005):
+        if address_width is None:
+            address_width = 1 if size <= 2048 else 2
+        self.base = address
+        self.size = size
+        self.page_size = page_size
+        self.address_width = address_width
+        self.write_time = write_time
+        self.block_size = 1 << (8 * address_width)
+        self.addresses = range(address,
+                address + max(1, size // self.block_size))
+        self.mem = bytearray(b'\xff' * size)
+        self.pointer = 0
+        self.busy_until = 0.0
+
+    def write(self, addr, data, now):
+        if now < self.busy_until:
+            return False
+        aw = self.address_width
+        if len(data) < aw:
+            # ACK polling
+            return True
+        offset = 0
+        for b in bytearray(data[:aw]):
+            offset = (offset << 8) | b
+        pointer = ((addr - self.base) * self.block_size + offset) % self.size
+        payload = data[aw:]
+        if payload:
+            page = self.page_size
+            start = pointer - pointer % page
+            if len(payload) > page:
+                # only the last bytes remain in the page buffer
+                shift = len(payload) - page
+                payload = payload[shift:]
+                pointer = start + (pointer - start + shift) % page
+            n = min(len(payload), start + page - pointer)
+            self.mem[pointer:pointer + n] = payload[:n]
+            self.mem[start:start + len(payload) - n] = payload[n:]
+            pointer = start + (pointer - start + len(payload)) % page
+            self.busy_until = now + self.write_time
+        self.pointer = pointer
+        return True
+
+    def read(self, addr, length, now):
+        if now < self.busy_until:
+            return None
+        pointer = self.pointer
+        if pointer + length <= self.size:
+            data = self.mem[pointer:pointer + length]
+        else:
+            # the address counter rolls over
+            data = (self.mem * (length // self.size + 2))[
+                    pointer:pointer + length]
+        self.pointer = (pointer + length) % self.size
+        return data
+
+class RegisterFileTarget(I2CTarget):
+    """A register based device, eg. a sensor.
+
+    The register pointer is set by the first `address_width` bytes of a
+    write and incremented on each access. `on_read` maps register numbers
+    to functions, which are called to update the register before it is read
+    (eg. to simulate a measurement).
+    """
+
+    def __init__(self, address, size=256, address_width=1, on_read=None):
+        self.addresses = (address,)
+        self.size = size
+        self.address_width = address_width
+        self.regs = bytearray(size)
+        self.on_read = on_read or {}
+        self.pointer = 0
+
+    def write(self, addr, data, now):
+        aw = self.address_width
+        if len(data) < aw:
+            return True
+        pointer = 0
+        for b in bytearray(data[:aw]):
+            pointer = (pointer << 8) | b
+        payload = data[aw:]
+        pointer %= self.size
+        end = pointer + len(payload)
+        if end > self.size:
+            raise ValueError('write beyond the last register')
+        self.regs[pointer:end] = payload
+        self.pointer = end % self.size
+        return True
+
+    def read(self, addr, length, now):
+        pointer = self.pointer
+        end = pointer + length
+        if end > self.size:
+            raise ValueError('read beyond the last register')
+        for (reg, func) in self.on_read.items():
+            if pointer <= reg < end:
+                self.regs[reg] = func() & 0xff
+        self.pointer = end % self.size
+        return self.regs[pointer:end]
+
+class SPIFlashTarget(object):
+    """A SPI NOR flash supporting the common command set (JEDEC ID, READ,
+    FAST_READ, page program, 4K/32K/64K and chip erase).
+    """
+
+    def __init__(self, size=1 << 20, jedec_id=None, page_size=256,
+            program_time=0.0007, erase_time=0.05, chip_erase_time=2.0):
+        if jedec_id is None:
+            jedec_id = (0xef, 0x40, size.bit_length() - 1)
+        self.size = size
+        self.jedec_id = bytearray(jedec_id)
+        self.page_size = page_size
+        self.program_time = program_time
+        self.erase_time = erase_time
+        self.chip_erase_time = chip_erase_time
+        self.mem = bytearray(b'\xff' * size)
+        self.write_enabled = False
+        self.busy_until = 0.0
+
+    _ERASE_SIZES = {0x20: 4096, 0x52: 32768, 0xd8: 65536}
+
+    def transfer(self, data, now):
+        """Return the response to the SPI transaction `data`."""
+        n = len(data)
+        cmd = bytearray(data[:1])[0]
+        response = bytearray(n)
+        busy = now < self.busy_until
+
+        if cmd == 0x05:
+            response[1:] = bytearray([0x01 if busy else 0x00]) * (n - 1)
+            return response
+        if cmd == 0x9f:
+            response[1:4] = self.jedec_id
+            return response[:n]
+        if busy:
+            # all other commands are ignored while busy
+            return response
+
+        header = bytearray(data[:4])
+        addr = (header[1] << 16 | header[2] << 8 | header[3]) \
+                if n >= 4 else 0
+        addr %= self.size
+        if cmd == 0x06:
+            self.write_enabled = True
+        elif cmd == 0x04:
+            self.write_enabled = False
+        elif cmd in (0x03, 0x0b):
+            start = 4 if cmd == 0x03 else 5
+            length = max(0, n - start)
+            if addr + length <= self.size:
+                response[start:] = self.mem[addr:addr + length]
+            else:
+                # the address counter rolls over
+                response[start:] = (self.mem * (length // self.size + 2))[
+                        addr:addr + length]
+        elif cmd == 0x02 and self.write_enabled:
+            page_start = addr - addr % self.page_size
+            payload = bytearray(data[4:])[-self.page_size:]
+            for (i, b) in enumerate(payload):
+                j = page_start + (addr - page_start + i) % self.page_size
+                self.mem[j] &= b
+            self._start_write(now, self.program_time)
+        elif cmd in self._ERASE_SIZES and self.write_enabled:
+            size = self._ERASE_SIZES[cmd]
+            start = addr - addr % size
+            self.mem[start:start + size] = b'\xff' * size
+            self._start_write(now, self.erase_time)
+        elif cmd in (0xc7, 0x60) and self.write_enabled:
+            self.mem[:] = b'\xff' * self.size
+            self._start_write(now, self.chip_erase_time)
+        return response
+
+    def _start_write(self, now, duration):
+        self.write_enabled = False
+        self.busy_until = now + duration
+
+class SimulatedPort(object):
+    """State of a single simulated adapter."""
+
+    def __init__(self, port, unique_id):
+        self.port = port
+        self.unique_id = unique_id
+        self.handle = None
+        self.clock = 0.0
+        self.i2c_targets = {}
+        self.spi_target = None
+        self.reset()
+
+    def reset(self):
+        self.config = CONFIG_SPI_I2C
+        self.target_power = TARGET_POWER_NONE
+        self.i2c_pullup = I2C_PULLUP_NONE
+        self.i2c_bitrate = 100
+        self.spi_bitrate = 1000
+        self.i2c_slave_addr = None
+        self.i2c_slave_response = b''
+        self.i2c_slave_rx = collections.deque()
+        self.i2c_slave_tx = collections.deque()
+        self.spi_slave_enabled = False
+        self.spi_slave_response = b''
+        self.spi_slave_rx = collections.deque()
+        self.gpio_direction = 0
+        self.gpio_output = 0
+        self.gpio_input = 0
+
+class SimulatedAPI(object):
+    """Pure Python implementation of the `py_aa_*` functions with
+    `num_devices` simulated adapters.
+
+    Targets are attached with :meth:`attach_i2c` and :meth:`attach_spi`.
+    Traffic from a foreign bus master to an adapter in slave mode is
+    simulated with :meth:`master_write`, :meth:`master_read` and
+    :meth:`spi_master_transfer`.
+    """
+
+    def __init__(self, num_devices=1, timing=None,
+            first_unique_id=2237000000):
+        self.timing = timing or TimingModel()
+        self.ports = [SimulatedPort(i, first_unique_id + i)
+                for i in range(num_devices)]
+        self._handles = {}
+        self._next_handle = 1
+        self._event = threading.Condition()
+
+    # simulation interface
+
+    def attach_i2c(self, port, target):
+        """Connect the :class:`I2CTarget` `target` to the I2C bus of the
+        adapter `port`.
+        """
+        for addr in target.addresses:
+            self.ports[port].i2c_targets[addr] = target
+        return target
+
+    def attach_spi(self, port, target):
+        """Connect `target` to the SPI bus of the adapter `port`. A SPI
+        target has a method `transfer(data, now)` returning the bytes sent
+        back.
+        """
+        self.ports[port].spi_target = target
+        return target
+
+    def master_write(self, port, data, addr=None):
+        """Simulate a write of an external I2C master to the adapter
+        `port` in slave mode.
+        """
+        p = self.ports[port]
+        if addr is None:
+            addr = p.i2c_slave_addr
+        if p.i2c_slave_addr is None or addr != p.i2c_slave_addr:
+            return False
+        with self._event:
+            p.i2c_slave_rx.append((addr, bytes(data)))
+            self._event.notify_all()
+        return True
+
+    def master_read(self, port, length):
+        """Simulate a read of `length` bytes by an external I2C master from
+        the adapter `port` in slave mode. Returns the bytes sent.
+        """
+        p = self.ports[port]
+        if p.i2c_slave_addr is None:
+            return None
+        response = p.i2c_slave_response or b'\x00'
+        data = (response * (length // len(response) + 1))[:length]
+        with self._event:
+            p.i2c_slave_tx.append(length)
+            self._event.notify_all()
+        return data
+
+    def spi_master_transfer(self, port, data):
+        """Simulate a transfer of an external SPI master to the adapter
+        `port` in slave mode. Returns the bytes sent by the adapter.
+        """
+        p = self.ports[port]
+        if not p.spi_slave_enabled:
+            return None
+        response = p.spi_slave_response or b'\x00'
+        with self._event:
+            p.spi_slave_rx.append(bytes(data))
+            self._event.notify_all()
+        return (response * (len(data) // len(response) + 1))[:len(data)]
+
+    def set_gpio_inputs(self, port, value):
+        """Set the level of the GPIO lines driven by the outside world."""
+        with self._event:
+            self.ports[port].gpio_input = value
+            self._event.notify_all()
+
+    def _advance(self, p, seconds):
+        p.clock += seconds
+        if self.timing.realtime:
+            time.sleep(seconds)
+
+    # device management
+
+    def py_aa_find_devices(self, num_devices, devices):
+        for (i, p) in enumerate(self.ports[:num_devices]):
+            devices[i] = p.port | (PORT_NOT_FREE if p.handle else 0)
+        return len(self.ports)
+
+    def py_aa_find_devices_ext(self, num_devices, num_ids, devices, ids):
+        for (i, p) in enumerate(self.ports[:num_devices]):
+            devices[i] = p.port | (PORT_NOT_FREE if p.handle else 0)
+        for (i, p) in enumerate(self.ports[:num_ids]):
+            ids[i] = p.unique_id
+        return len(self.ports)
+
+    def py_aa_open_ext(self, port):
+        if not 0 <= port < len(self.ports) or self.ports[port].handle:
+            return ERR_UNABLE_TO_OPEN, (0,) * 6
+        p = self.ports[port]
+        p.reset()
+        p.handle = self._next_handle
+        self._next_handle += 1
+        self._handles[p.handle] = p
+        return p.handle, VERSION
+
+    def py_aa_close(self, handle):
+        p = self._handles.pop(handle, None)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        p.handle = None
+        return 1
+
+    def py_aa_unique_id(self, handle):
+        p = self._handles.get(handle)
+        return p.unique_id if p else 0
+
+    def py_aa_sleep_ms(self, milliseconds):
+        time.sleep(milliseconds / 1000.0)
+        return milliseconds
+
+    # configuration
+
+    def py_aa_configure(self, handle, config):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        if config != CONFIG_QUERY:
+            p.config = config
+        return p.config
+
+    def py_aa_target_power(self, handle, power):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        if power != TARGET_POWER_QUERY:
+            p.target_power = power
+        return p.target_power
+
+    def py_aa_i2c_pullup(self, handle, pullup):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        if pullup != I2C_PULLUP_QUERY:
+            p.i2c_pullup = pullup
+        return p.i2c_pullup
+
+    def py_aa_i2c_bitrate(self, handle, bitrate):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        if bitrate:
+            p.i2c_bitrate = max(1, min(bitrate, 800))
+        return p.i2c_bitrate
+
+    def py_aa_spi_bitrate(self, handle, bitrate):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        if bitrate:
+            p.spi_bitrate = max(125, min(bitrate, 8000))
+        return p.spi_bitrate
+
+    def py_aa_spi_configure(self, handle, polarity, phase, bitorder):
+        return 0 if handle in self._handles else ERR_INVALID_HANDLE
+
+    def py_aa_spi_master_ss_polarity(self, handle, polarity):
+        return 0 if handle in self._handles else ERR_INVALID_HANDLE
+
+    # I2C master
+
+    def _i2c_port(self, handle):
+        p = self._handles.get(handle)
+        if p is None:
+            return None, ERR_INVALID_HANDLE
+        if not p.config & CONFIG_GPIO_I2C:
+            return None, ERR_I2C_NOT_ENABLED
+        return p, 0
+
+    def _i2c_write(self, handle, addr, num_bytes, data):
+        (p, err) = self._i2c_port(handle)
+        if p is None:
+            return err, 0
+        self._advance(p, self.timing.i2c(p.i2c_bitrate, num_bytes))
+        target = p.i2c_targets.get(addr)
+        if target is None or not target.write(addr,
+                _tobytes(data, num_bytes), p.clock):
+            return I2C_STATUS_SLA_NACK, 0
+        return I2C_STATUS_OK, num_bytes
+
+    def _i2c_read(self, handle, addr, num_bytes, data):
+        (p, err) = self._i2c_port(handle)
+        if p is None:
+            return err, 0
+        self._advance(p, self.timing.i2c(p.i2c_bitrate, num_bytes))
+        target = p.i2c_targets.get(addr)
+        response = target.read(addr, num_bytes, p.clock) \
+                if target is not None else None
+        if response is None:
+            return I2C_STATUS_SLA_NACK, 0
+        _store(data, response)
+        return I2C_STATUS_OK, len(response)
+
+    def py_aa_i2c_write_ext(self, handle, addr, flags, num_bytes, data):
+        return self._i2c_write(handle, addr, num_bytes, data)
+
+    def py_aa_i2c_read_ext(self, handle, addr, flags, num_bytes, data):
+        return self._i2c_read(handle, addr, num_bytes, data)
+
+    def py_aa_i2c_write(self, handle, addr, flags, num_bytes, data):
+        (status, n) = self._i2c_write(handle, addr, num_bytes, data)
+        if status < 0:
+            return status
+        return n if status == I2C_STATUS_OK else ERR_I2C_WRITE_ERROR
+
+    def py_aa_i2c_read(self, handle, addr, flags, num_bytes, data):
+        (status, n) = self._i2c_read(handle, addr, num_bytes, data)
+        if status < 0:
+            return status
+        return n if status == I2C_STATUS_OK else ERR_I2C_READ_ERROR
+
+    # SPI master
+
+    def py_aa_spi_write(self, handle, num_out, data_out, num_in, data_in):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        if not p.config & CONFIG_SPI_GPIO:
+            return ERR_SPI_NOT_ENABLED
+        self._advance(p, self.timing.spi(p.spi_bitrate, num_out))
+        target = p.spi_target
+        if target is None:
+            # nobody drives MISO
+            response = b'\xff' * num_out
+        else:
+            response = target.transfer(_tobytes(data_out, num_out), p.clock)
+        _store(data_in, response[:num_in])
+        return num_out
+
+    # slave mode
+
+    def py_aa_i2c_slave_enable(self, handle, addr, max_tx_bytes,
+            max_rx_bytes):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        p.i2c_slave_addr = addr
+        return 0
+
+    def py_aa_i2c_slave_disable(self, handle):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        p.i2c_slave_addr = None
+        return 0
+
+    def py_aa_i2c_slave_set_response(self, handle, num_bytes, data):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        p.i2c_slave_response = _tobytes(data, num_bytes)
+        return num_bytes
+
+    def py_aa_i2c_slave_read(self, handle, num_bytes, data):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE, 0
+        if not p.i2c_slave_rx:
+            return ERR_I2C_SLAVE_TIMEOUT, 0
+        (addr, received) = p.i2c_slave_rx.popleft()
+        received = received[:num_bytes]
+        _store(data, received)
+        return len(received), addr
+
+    def py_aa_i2c_slave_write_stats(self, handle):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        if not p.i2c_slave_tx:
+            return ERR_I2C_SLAVE_TIMEOUT
+        return p.i2c_slave_tx.popleft()
+
+    def py_aa_spi_slave_enable(self, handle):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        p.spi_slave_enabled = True
+        return 0
+
+    def py_aa_spi_slave_disable(self, handle):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        p.spi_slave_enabled = False
+        return 0
+
+    def py_aa_spi_slave_set_response(self, handle, num_bytes, data):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        p.spi_slave_response = _tobytes(data, num_bytes)
+        return num_bytes
+
+    def py_aa_spi_slave_read(self, handle, num_bytes, data):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        if not p.spi_slave_rx:
+            return ERR_SPI_SLAVE_TIMEOUT
+        received = p.spi_slave_rx.popleft()[:num_bytes]
+        _store(data, received)
+        return len(received)
+
+    def _pending(self, p):
+        events = POLL_NO_DATA
+        if p.i2c_slave_rx:
+            events |= POLL_I2C_READ
+        if p.i2c_slave_tx:
+            events |= POLL_I2C_WRITE
+        if p.spi_slave_rx:
+            events |= POLL_SPI
+        return events
+
+    def py_aa_async_poll(self, handle, timeout):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        events = self._pending(p)
+        if events or timeout == 0:
+            return events
+        # wait in real time for one of the simulation methods to be called
+        deadline = None if timeout < 0 else time.time() + timeout / 1000.0
+        with self._event:
+            while True:
+                events = self._pending(p)
+                if events:
+                    return events
+                remaining = None if deadline is None \
+                        else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return POLL_NO_DATA
+                self._event.wait(remaining)
+
+    # GPIO
+
+    def _gpio_value(self, p):
+        return (p.gpio_output & p.gpio_direction) \
+                | (p.gpio_input & ~p.gpio_direction & GPIO_ALL)
+
+    def py_aa_gpio_direction(self, handle, direction_mask):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        p.gpio_direction = direction_mask
+        return 0
+
+    def py_aa_gpio_pullup(self, handle, pullup_mask):
+        return 0 if handle in self._handles else ERR_INVALID_HANDLE
+
+    def py_aa_gpio_get(self, handle):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        return self._gpio_value(p)
+
+    def py_aa_gpio_set(self, handle, value):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        p.gpio_output = value
+        return 0
+
+    def py_aa_gpio_change(self, handle, timeout):
+        p = self._handles.get(handle)
+        if p is None:
+            return ERR_INVALID_HANDLE
+        value = self._gpio_value(p)
+        deadline = time.time() + timeout / 1000.0
+        with self._event:
+            while self._gpio_value(p) == value:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._event.wait(remaining)
+            return self._gpio_value(p)
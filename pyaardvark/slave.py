@@ -0,0 +1,328 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Background capture of slave mode events."""
+
+import collections
+import logging
+import threading
+import time
+
+from . import aardvark
+from .buffers import PooledBuffer
+from .constants import *
+
+log = logging.getLogger(__name__)
+
+#: A captured slave event. For `POLL_I2C_READ` events, `data` contains the
+#: received bytes. For `POLL_I2C_WRITE` events, `data` is `None` and
+#: `length` is the number of bytes sent to the master.
+SlaveMessage = collections.namedtuple('SlaveMessage',
+        'timestamp event slave_addr data length')
+
+#: A SPI slave reception captured by :class:`SPISlaveReceiver`. `device` is
+#: the key of the receiving device and `buf` a
+#: :class:`~pyaardvark.buffers.PooledBuffer` with the received bytes, which
+#: has to be released by the consumer.
+SPISlaveMessage = collections.namedtuple('SPISlaveMessage',
+        'timestamp device buf')
+
+class _RingBuffer(object):
+    """A bounded FIFO. If it is full, the oldest entry is dropped."""
+
+    def __init__(self, maxlen, on_drop=None):
+        self._queue = collections.deque()
+        self._maxlen = maxlen
+        self._on_drop = on_drop
+        self._cond = threading.Condition()
+        self.overruns = 0
+        self.closed = False
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, item):
+        with self._cond:
+            if len(self._queue) >= self._maxlen:
+                dropped = self._queue.popleft()
+                self.overruns += 1
+                if self._on_drop is not None:
+                    self._on_drop(dropped)
+            self._queue.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Return the oldest entry. Returns `None` if there is none within
+        `timeout` seconds or if the buffer was closed and is empty.
+        """
+        with self._cond:
+            if timeout is not None:
+                deadline = time.time() + timeout
+            while not self._queue and not self.closed:
+                if timeout is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            if self._queue:
+                return self._queue.popleft()
+            return None
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class _Capture(object):
+    # common part of the capture engines: a ring buffer which is filled by
+    # a capture thread and consumed by iteration or a dispatcher thread.
+    # The capture thread calls _capture_once() of the subclass until the
+    # capture is stopped.
+
+    def __init__(self, maxlen, callback, on_drop=None):
+        self.callback = callback
+        self._ring = _RingBuffer(maxlen, on_drop)
+        self._running = False
+        self._threads = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.stop()
+        return False
+
+    def __iter__(self):
+        """Yield the captured records until the capture is stopped and all
+        records are consumed.
+        """
+        while True:
+            msg = self._ring.get()
+            if msg is None:
+                return
+            yield msg
+
+    def get(self, timeout=None):
+        """Return the next record or `None` if there is none within
+        `timeout` seconds.
+        """
+        return self._ring.get(timeout)
+
+    def start(self):
+        """Start the capture thread (and the callback thread)."""
+        self._running = True
+        self._threads = [threading.Thread(target=self._capture,
+                name='aardvark-capture')]
+        if self.callback is not None:
+            self._threads.append(threading.Thread(target=self._dispatch,
+                name='aardvark-dispatch'))
+        for t in self._threads:
+            t.daemon = True
+            t.start()
+
+    def stop(self):
+        """Stop the capture. Records already captured can still be
+        consumed. If there is a callback, it is called for all of them
+        before this method returns. Does nothing if the capture isn't
+        running.
+        """
+        if not self._threads:
+            return
+        (threads, self._threads) = (self._threads, [])
+        self._running = False
+        threads[0].join()
+        self._ring.close()
+        for t in threads[1:]:
+            t.join()
+
+    def _dispatch(self):
+        for msg in self:
+            try:
+                self.callback(msg)
+            except Exception:
+                log.exception('Capture callback failed')
+
+    def _capture(self):
+        while self._running:
+            self._capture_once()
+
+
+class I2CSlaveCapture(_Capture):
+    """Captures I2C slave events of a device in a background thread.
+
+    The device has to be in slave mode already, see
+    :meth:`pyaardvark.Aardvark.i2c_slave_enable`. While the capture is
+    running, the device must not be used otherwise.
+
+    Events are stored as :data:`SlaveMessage` records in a ring buffer of
+    `maxlen` entries. If the consumer doesn't keep up, the oldest records
+    are dropped and counted as overruns. The records can either be consumed
+    by iterating over this object or by passing a `callback`, which is
+    called from a separate thread for every record. Either way, a slow
+    consumer never delays the draining of the device::
+
+      with I2CSlaveCapture(a) as capture:
+          for msg in capture:
+              print msg.slave_addr, repr(msg.data)
+    """
+
+    def __init__(self, device, maxlen=1024, callback=None,
+            poll_timeout_ms=10):
+        _Capture.__init__(self, maxlen, callback)
+        self.device = device
+        self.poll_timeout_ms = poll_timeout_ms
+        self._counters = dict(reads=0, writes=0, rx_bytes=0, tx_bytes=0,
+                dropped_excess_bytes=0, errors=0)
+
+    def stats(self):
+        """Return a dictionary with the counters of the capture.
+
+        Besides the number of `reads` and `writes` and the bytes
+        transferred, `overruns` counts the records dropped because the
+        ring buffer was full and `dropped_excess_bytes` the receptions
+        which didn't fit into the receive buffer of the device.
+        """
+        stats = dict(self._counters)
+        stats['overruns'] = self._ring.overruns
+        stats['pending'] = len(self._ring)
+        return stats
+
+    def _capture_once(self):
+        dev = self.device
+        api = aardvark.api
+        pool = dev.i2c_slave_rx_pool
+        counters = self._counters
+        try:
+            events = dev.poll(self.poll_timeout_ms)
+        except IOError as e:
+            log.error('Polling device failed: %s', e)
+            counters['errors'] += 1
+            time.sleep(self.poll_timeout_ms / 1000.0)
+            return
+
+        if events & POLL_I2C_READ:
+            buf = pool.acquire()
+            (ret, slave_addr) = api.py_aa_i2c_slave_read(dev.handle,
+                    len(buf), buf)
+            timestamp = time.time()
+            if ret >= 0:
+                counters['reads'] += 1
+                counters['rx_bytes'] += ret
+                self._ring.put(SlaveMessage(timestamp, POLL_I2C_READ,
+                        slave_addr, bytes(buf[:ret]), ret))
+            elif ret == ERR_I2C_DROPPED_EXCESS_BYTES:
+                counters['dropped_excess_bytes'] += 1
+            else:
+                log.error('Slave read failed: %s',
+                        aardvark.error_string(ret))
+                counters['errors'] += 1
+            pool.release(buf)
+
+        if events & POLL_I2C_WRITE:
+            ret = api.py_aa_i2c_slave_write_stats(dev.handle)
+            timestamp = time.time()
+            if ret >= 0:
+                counters['writes'] += 1
+                counters['tx_bytes'] += ret
+                self._ring.put(SlaveMessage(timestamp, POLL_I2C_WRITE,
+                        None, None, ret))
+            else:
+                log.error('Slave write stats failed: %s',
+                        aardvark.error_string(ret))
+                counters['errors'] += 1
+
+
+class SPISlaveReceiver(_Capture):
+    """Drains SPI slave receptions of one or more devices in a single
+    background thread.
+
+    `devices` is either a list of :class:`pyaardvark.Aardvark` objects or a
+    dictionary which maps arbitrary keys to them. The keys (or list
+    indices) are reported in the `device` field of each
+    :data:`SPISlaveMessage`. The devices have to be in SPI slave mode
+    already and must not be used otherwise while the receiver is running.
+
+    All devices are polled in turn without blocking. Only if none of them
+    had data, the thread sleeps for `idle_sleep` seconds. The received
+    data is stored in pooled buffers, which have to be released by the
+    consumer::
+
+      with SPISlaveReceiver([a, b]) as rx:
+          for msg in rx:
+              with msg.buf:
+                  handle(msg.device, msg.buf.view)
+
+    Like :class:`I2CSlaveCapture`, the records are kept in a ring buffer of
+    `maxlen` entries and can also be consumed by a `callback`. Records
+    dropped on an overrun are released automatically.
+    """
+
+    def __init__(self, devices, maxlen=1024, callback=None, idle_sleep=0.001):
+        _Capture.__init__(self, maxlen, callback,
+                on_drop=lambda msg: msg.buf.release())
+        if not isinstance(devices, dict):
+            devices = dict(enumerate(devices))
+        self.devices = devices
+        self.idle_sleep = idle_sleep
+        self._counters = dict((key, dict(reads=0, rx_bytes=0,
+                dropped_excess_bytes=0, errors=0)) for key in devices)
+
+    def stats(self):
+        """Return a dictionary with the counters of each device and the
+        total number of `overruns` of the ring buffer.
+        """
+        stats = dict((key, dict(c)) for (key, c) in self._counters.items())
+        return dict(devices=stats, overruns=self._ring.overruns,
+                pending=len(self._ring))
+
+    def _capture_once(self):
+        api = aardvark.api
+        devices = list(self.devices.items())
+        idle = True
+        for (key, dev) in devices:
+            counters = self._counters[key]
+            try:
+                if not dev.poll(0) & POLL_SPI:
+                    continue
+            except IOError as e:
+                log.error('Polling device %s failed: %s', key, e)
+                counters['errors'] += 1
+                continue
+
+            idle = False
+            pool = dev.spi_slave_rx_pool
+            buf = pool.acquire()
+            ret = api.py_aa_spi_slave_read(dev.handle, len(buf), buf)
+            timestamp = time.time()
+            if ret >= 0:
+                counters['reads'] += 1
+                counters['rx_bytes'] += ret
+                self._ring.put(SPISlaveMessage(timestamp, key,
+                        PooledBuffer(pool, buf, ret)))
+                continue
+            if ret == ERR_SPI_DROPPED_EXCESS_BYTES:
+                counters['dropped_excess_bytes'] += 1
+            else:
+                log.error('SPI slave read on device %s failed: %s', key,
+                        aardvark.error_string(ret))
+                counters['errors'] += 1
+            pool.release(buf)
+        if idle:
+            time.sleep(self.idle_sleep)
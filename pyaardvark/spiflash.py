@@ -0,0 +1,319 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Access to SPI NOR flash devices."""
+
+import collections
+import time
+
+from .constants import *
+from .transfer import reader, writer, _stats, SPI_CHUNK_SIZE
+
+CMD_WRITE_ENABLE = 0x06
+CMD_READ_STATUS = 0x05
+CMD_READ_JEDEC_ID = 0x9f
+CMD_FAST_READ = 0x0b
+CMD_PAGE_PROGRAM = 0x02
+CMD_SECTOR_ERASE = 0x20
+CMD_BLOCK_ERASE_32K = 0x52
+CMD_BLOCK_ERASE_64K = 0xd8
+CMD_CHIP_ERASE = 0xc7
+
+STATUS_WIP = 0x01
+
+#: Erase commands sorted by the size of the erased region, largest first.
+ERASE_COMMANDS = (
+    (65536, CMD_BLOCK_ERASE_64K),
+    (32768, CMD_BLOCK_ERASE_32K),
+    (4096, CMD_SECTOR_ERASE),
+)
+
+#: JEDEC manufacturer, memory type and capacity code of a device.
+JedecId = collections.namedtuple('JedecId', 'manufacturer type capacity')
+
+def erase_plan(offset, length, erase_commands=ERASE_COMMANDS):
+    """Return a list of `(command, address, size)` tuples which erase the
+    region starting at `offset` with as few commands as possible.
+
+    The region is extended to the boundaries of the smallest erasable unit.
+    """
+    granularity = erase_commands[-1][0]
+    start = offset - offset % granularity
+    end = offset + length
+    end += -end % granularity
+
+    plan = []
+    addr = start
+    while addr < end:
+        for (size, cmd) in erase_commands:
+            if addr % size == 0 and addr + size <= end:
+                break
+        plan.append((cmd, addr, size))
+        addr += size
+    return plan
+
+class SPIFlash(object):
+    """A SPI NOR flash connected to the Aardvark adapter `device`.
+
+    The SPI interface has to be enabled and configured (mode 0 or 3) by the
+    caller. If `size` is not given, it is derived from the capacity code of
+    the JEDEC ID. Only 3-byte addressing is supported, ie. devices up to
+    16 MiB.
+
+    All long running operations account the time they take in the
+    :attr:`timings` dictionary, which maps the phase (``'erase'``,
+    ``'program'``, ``'read'`` and ``'verify'``) to the seconds spent.
+    """
+
+    def __init__(self, device, size=None, page_size=256,
+            erase_commands=ERASE_COMMANDS, timeout=60):
+        self.device = device
+        self.page_size = page_size
+        self.erase_commands = erase_commands
+        self.timeout = timeout
+        self.timings = collections.defaultdict(float)
+        self._buffers = (0, None, None)
+        self._status_buffers = (bytearray([CMD_READ_STATUS, 0]), bytearray(2))
+
+        device.spi_ss_polarity(SPI_SS_ACTIVE_LOW)
+        if size is None:
+            size = 1 << self.jedec_id().capacity
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def _bulk_buffers(self, length):
+        """Return a pair of buffers for a transfer of `length` bytes. They
+        are reused as long as the length doesn't change, so bulk transfers
+        don't allocate any memory.
+        """
+        if self._buffers[0] != length:
+            self._buffers = (length, bytearray(length), bytearray(length))
+        return self._buffers[1:]
+
+    def _header(self, cmd, addr=None, dummy=0):
+        header = bytearray([cmd])
+        if addr is not None:
+            header += bytearray([(addr >> 16) & 0xff, (addr >> 8) & 0xff,
+                    addr & 0xff])
+        return header + bytearray(dummy)
+
+    def _command(self, cmd, addr=None, length=0):
+        header = self._header(cmd, addr)
+        data_in = bytearray(len(header) + length)
+        self.device.spi_transfer_into(header + bytearray(length), data_in)
+        return data_in[len(header):]
+
+    def _account(self, phase, start):
+        self.timings[phase] += time.time() - start
+
+    def jedec_id(self):
+        """Return the :data:`JedecId` of the device."""
+        return JedecId(*self._command(CMD_READ_JEDEC_ID, length=3))
+
+    def read_status(self):
+        """Return the status register."""
+        return self._command(CMD_READ_STATUS, length=1)[0]
+
+    def wait_ready(self):
+        """Poll the status register until the write in progress bit is
+        cleared.
+        """
+        (data_out, data_in) = self._status_buffers
+        deadline = None
+        while True:
+            self.device.spi_transfer_into(data_out, data_in)
+            if not data_in[1] & STATUS_WIP:
+                return
+            now = time.time()
+            if deadline is None:
+                deadline = now + self.timeout
+            elif now > deadline:
+                raise IOError('SPI flash busy timeout')
+
+    def write_enable(self):
+        self._command(CMD_WRITE_ENABLE)
+
+    def _check_range(self, offset, length):
+        if offset < 0 or length < 0 or offset + length > self.size:
+            raise ValueError('range 0x%x+%d exceeds the size of the flash'
+                    % (offset, length))
+
+    def _fast_read(self, offset, buf):
+        length = len(buf)
+        max_chunk = SPI_CHUNK_SIZE - 5
+        pos = 0
+        while pos < length:
+            n = min(length - pos, max_chunk)
+            (data_out, data_in) = self._bulk_buffers(5 + n)
+            data_out[:5] = self._header(CMD_FAST_READ, offset + pos, dummy=1)
+            self.device.spi_transfer_into(data_out, data_in)
+            buf[pos:pos + n] = memoryview(data_in)[5:]
+            pos += n
+
+    def read_into(self, offset, buf):
+        """Read `len(buf)` bytes starting at `offset` into `buf` using the
+        FAST_READ command. Each transaction transfers as much data as the
+        adapter allows.
+        """
+        self._check_range(offset, len(buf))
+        start = time.time()
+        self._fast_read(offset, buf)
+        self._account('read', start)
+
+    def read(self, offset=0, length=None):
+        """Read `length` bytes starting at `offset`. If `length` is not
+        given, everything up to the end of the flash is read.
+        """
+        if length is None:
+            length = self.size - offset
+        buf = bytearray(length)
+        self.read_into(offset, buf)
+        return bytes(buf)
+
+    def erase(self, offset, length):
+        """Erase the region starting at `offset`. The largest erase commands
+        covering the region are used, see :func:`erase_plan`. A region
+        spanning the whole device is erased with a single chip erase.
+
+        If the region doesn't start or end on a sector boundary, the data
+        of the partially erased sectors outside of the region is read
+        before and programmed again afterwards.
+        """
+        self._check_range(offset, length)
+        if offset == 0 and length == self.size:
+            return self.erase_chip()
+        if length == 0:
+            return
+        granularity = self.erase_commands[-1][0]
+        end = offset + length
+        head_offset = offset - offset % granularity
+        head = bytearray(offset - head_offset)
+        tail = bytearray(-end % granularity)
+        self.read_into(head_offset, head)
+        self.read_into(end, tail)
+
+        start = time.time()
+        for (cmd, addr, _) in erase_plan(offset, length, self.erase_commands):
+            self.write_enable()
+            self._command(cmd, addr)
+            self.wait_ready()
+        self._account('erase', start)
+
+        # erased bytes don't have to be programmed
+        if head.strip(b'\xff'):
+            self.program(head, head_offset)
+        if tail.strip(b'\xff'):
+            self.program(tail, end)
+
+    def erase_chip(self):
+        start = time.time()
+        self.write_enable()
+        self._command(CMD_CHIP_ERASE)
+        self.wait_ready()
+        self._account('erase', start)
+
+    def program(self, data, offset=0):
+        """Program `data` starting at `offset`. The region has to be erased
+        before. The data is split on page boundaries.
+        """
+        data = memoryview(data)
+        length = len(data)
+        self._check_range(offset, length)
+        start = time.time()
+        pos = 0
+        while pos < length:
+            n = min(length - pos, self.page_size - (offset % self.page_size))
+            (data_out, data_in) = self._bulk_buffers(4 + n)
+            data_out[:4] = self._header(CMD_PAGE_PROGRAM, offset)
+            data_out[4:] = data[pos:pos + n].tobytes()
+            self.write_enable()
+            self.device.spi_transfer_into(data_out, data_in)
+            self.wait_ready()
+            pos += n
+            offset += n
+        self._account('program', start)
+
+    def dump(self, sink, offset=0, length=None, chunk_size=SPI_CHUNK_SIZE - 5):
+        """Read the flash and write the data to `sink`, which may be any
+        sink supported by :func:`pyaardvark.transfer.writer`.
+
+        Returns a :data:`pyaardvark.transfer.TransferStats` tuple.
+        """
+        if length is None:
+            length = self.size - offset
+        self._check_range(offset, length)
+        write = writer(sink)
+        buf = bytearray(chunk_size)
+        start = time.time()
+        chunks = 0
+        pos = 0
+        while pos < length:
+            n = min(length - pos, chunk_size)
+            if n < chunk_size:
+                buf = bytearray(n)
+            self.read_into(offset + pos, buf)
+            write(bytes(buf))
+            pos += n
+            chunks += 1
+        return _stats(length, chunks, time.time() - start)
+
+    def flash(self, source, offset=0, erase=True, verify=False,
+            block_size=65536):
+        """Program all data from `source` starting at `offset`. `source` may
+        be anything supported by :func:`pyaardvark.transfer.reader`.
+
+        The data is read in blocks aligned to `block_size`. If `erase` is
+        set, each block is erased right before it is programmed, so the
+        amount of data doesn't have to be known in advance. Data outside
+        of the programmed region is preserved, see :meth:`erase`. With `verify`,
+        every block is read back and compared.
+
+        Returns a :data:`pyaardvark.transfer.TransferStats` tuple.
+        """
+        readinto = reader(source)
+        buf = bytearray(block_size)
+        verify_buf = None
+        start = time.time()
+        total = 0
+        chunks = 0
+        while True:
+            n = block_size - (offset % block_size)
+            if len(buf) != n:
+                buf = bytearray(n)
+            n = readinto(buf)
+            if n == 0:
+                break
+            data = memoryview(buf)[:n]
+            if erase:
+                self.erase(offset, n)
+            self.program(data, offset)
+            if verify:
+                verify_start = time.time()
+                if verify_buf is None or len(verify_buf) != n:
+                    verify_buf = bytearray(n)
+                self._fast_read(offset, verify_buf)
+                if verify_buf != data:
+                    raise IOError('SPI flash verify error in block at 0x%x'
+                            % offset)
+                self._account('verify', verify_start)
+            offset += n
+            total += n
+            chunks += 1
+            if n < len(buf):
+                break
+        return _stats(total, chunks, time.time() - start)
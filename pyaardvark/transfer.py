@@ -0,0 +1,172 @@
+# Copyright (c) 2014  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Chunked transfers of large amounts of data."""
+
+import collections
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+#: Default chunk size for SPI transfers. This is the largest transfer the
+#: adapter supports with a single call.
+SPI_CHUNK_SIZE = 65535
+
+#: Statistics of a transfer.
+TransferStats = collections.namedtuple('TransferStats',
+        'bytes chunks seconds bytes_per_second')
+
+def _stats(num_bytes, chunks, seconds):
+    rate = num_bytes / seconds if seconds > 0 else 0.0
+    return TransferStats(num_bytes, chunks, seconds, rate)
+
+def reader(source):
+    """Return a function `readinto(buf)`, which fills `buf` with the next
+    bytes of `source` and returns the number of bytes stored. Less than
+    `len(buf)` bytes are only returned at the end of the data.
+
+    `source` may be a file-like object, an object supporting the buffer
+    protocol (eg. a string or `bytearray`) or an iterable of strings.
+    """
+    if hasattr(source, 'readinto'):
+        def readinto(buf):
+            view = memoryview(buf)
+            n = 0
+            while n < len(buf):
+                ret = source.readinto(view[n:])
+                if not ret:
+                    break
+                n += ret
+            return n
+        return readinto
+
+    if hasattr(source, 'read'):
+        def readinto(buf):
+            data = source.read(len(buf))
+            buf[:len(data)] = data
+            return len(data)
+        return readinto
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        chunks = iter([source])
+    else:
+        chunks = iter(source)
+    state = dict(pending=memoryview(b''))
+    def readinto(buf):
+        pending = state['pending']
+        n = 0
+        while n < len(buf):
+            if not len(pending):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending = memoryview(chunk)
+                continue
+            k = min(len(buf) - n, len(pending))
+            buf[n:n + k] = pending[:k]
+            pending = pending[k:]
+            n += k
+        state['pending'] = pending
+        return n
+    return readinto
+
+def writer(sink):
+    """Return a function `write(data)` for `sink`, which is either a
+    file-like object, a callable or `None` to discard the data.
+    """
+    if sink is None:
+        return lambda data: None
+    if hasattr(sink, 'write'):
+        return sink.write
+    return sink
+
+def _prefetch(readinto, filled, free):
+    # runs in its own thread and fills the buffers from the source while
+    # the previous chunk is transferred
+    try:
+        while True:
+            buf = free.get()
+            if buf is None:
+                return
+            n = readinto(buf)
+            filled.put((buf, n))
+            if n < len(buf):
+                return
+    except BaseException as e:
+        filled.put((e, 0))
+
+def spi_stream(device, source, sink=None, chunk_size=SPI_CHUNK_SIZE):
+    """Write all data from `source` to the SPI bus of `device` and pass the
+    received bytes to `sink`. Returns a :data:`TransferStats` tuple.
+
+    See :func:`reader` and :func:`writer` for the supported source and sink
+    types.
+
+    The data is transferred in chunks of `chunk_size` bytes using two
+    alternating buffers. While one chunk is transferred, the next one is
+    read from the source by a helper thread, so at most two chunks are held
+    in memory regardless of the amount of data.
+
+    Please note, that each chunk is a separate SPI transaction, ie. the SS
+    line is deasserted between two chunks.
+    """
+    readinto = reader(source)
+    write = writer(sink)
+
+    buffers = [bytearray(chunk_size), bytearray(chunk_size)]
+    data_in = bytearray(chunk_size)
+    filled = queue.Queue()
+    free = queue.Queue()
+    for buf in buffers:
+        free.put(buf)
+
+    thread = threading.Thread(target=_prefetch,
+            args=(readinto, filled, free),
+            name='aardvark-spi-prefetch')
+    thread.daemon = True
+
+    total = 0
+    chunks = 0
+    start = time.time()
+    thread.start()
+    try:
+        while True:
+            (buf, n) = filled.get()
+            if isinstance(buf, BaseException):
+                raise buf
+            if n == 0:
+                break
+            if n < chunk_size:
+                # the last chunk is shorter, so the transfer length has to
+                # be adjusted
+                buf = buf[:n]
+                data_in = data_in[:n]
+            device.spi_transfer_into(buf, data_in)
+            free.put(buf)
+            write(bytes(data_in))
+            total += n
+            chunks += 1
+            if n < chunk_size:
+                break
+    finally:
+        # stop the prefetch thread if it is still waiting for a buffer
+        free.put(None)
+
+    return _stats(total, chunks, time.time() - start)
@@ -48,8 +48,17 @@ setup(name = name,
         entry_points = {
             'console_scripts': [
                 'aardvark = pyaardvark.cli_tool:main',
+                'aardvark-server = pyRemoteAardvarkServer.__main__:main',
             ]
         },
+        install_requires = [
+            'futures; python_version < "3"',
+        ],
+        extras_require = {
+            'asyncio': [
+                'trollius; python_version < "3"',
+            ],
+        },
         test_suite = 'tests',
         include_package_data = True,
 )
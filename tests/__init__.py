@@ -0,0 +1,22 @@
+import sys
+from pyaardvark import aardvark
+
+# pyRemoteAardvark replaces the API of pyaardvark on import, which happens
+# when nose collects it. The tests mock the binary library, so use it while
+# they run.
+_api = None
+
+def _native_api():
+    for (name, module) in sys.modules.items():
+        if (module is not None and name.startswith('pyaardvark.ext.')
+                and name.endswith('.aardvark')):
+            return module
+    return aardvark.api
+
+def setup():
+    global _api
+    _api = aardvark.api
+    aardvark.api = _native_api()
+
+def teardown():
+    aardvark.api = _api
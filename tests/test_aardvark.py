@@ -65,6 +65,14 @@ def test_open_serial_number(api):
             devs[i] = dev
         return len(devices)
 
+    def find_devices_ext(_num, _num_ids, devs, ids):
+        for i, dev in enumerate(devices.keys()):
+            if _num <= i:
+                break
+            devs[i] = dev
+            ids[i] = devices[dev]
+        return len(devices)
+
     def open(handle):
         return (handle, (0,) * 6)
 
@@ -72,6 +80,7 @@ def test_open_serial_number(api):
         return devices[handle]
 
     api.py_aa_find_devices.side_effect = find_devices
+    api.py_aa_find_devices_ext.side_effect = find_devices_ext
     api.py_aa_open_ext.side_effect = open
     api.py_aa_unique_id.side_effect = unique_id
 
@@ -83,6 +92,15 @@ def test_open_serial_number(api):
 
     assert_raises(IOError, pyaardvark.open, serial_number='7777-888888')
 
+    # only the matching devices were opened
+    api.py_aa_open_ext.assert_has_calls([call(42), call(4711)])
+    eq_(api.py_aa_open_ext.call_count, 2)
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+def test_find_devices_no_devices(api):
+    api.py_aa_find_devices.return_value = 0
+    eq_(pyaardvark.find_devices(), [])
+
 @patch('pyaardvark.aardvark.api', autospec=True)
 def test_open_versions(api):
     api.py_aa_open_ext.return_value = (1, (0x101, 0x202, 0x303, 0, 0, 0))
@@ -246,6 +264,82 @@ class TestAardvark(object):
         api.py_aa_target_power.return_value = -1
         self.a.target_power = 0
 
+    def test_i2c_pullups_query(self, api):
+        api.py_aa_i2c_pullup.return_value = pyaardvark.I2C_PULLUP_BOTH
+        eq_(self.a.i2c_pullups, True)
+        api.py_aa_i2c_pullup.return_value = pyaardvark.I2C_PULLUP_NONE
+        eq_(self.a.i2c_pullups, False)
+
+    def test_cache_setters(self, api):
+        api.py_aa_i2c_bitrate.return_value = 100
+        api.py_aa_i2c_pullup.return_value = 0
+        api.py_aa_target_power.return_value = 0
+        api.py_aa_spi_configure.return_value = 0
+        api.py_aa_spi_master_ss_polarity.return_value = 0
+        self.a.enable_cache()
+        for _ in range(2):
+            self.a.i2c_bitrate = 100
+            self.a.i2c_pullups = True
+            self.a.target_power = False
+            self.a.spi_configure(1, 1, 0)
+            self.a.spi_ss_polarity(0)
+        eq_(api.py_aa_i2c_bitrate.call_count, 1)
+        eq_(api.py_aa_i2c_pullup.call_count, 1)
+        eq_(api.py_aa_target_power.call_count, 1)
+        eq_(api.py_aa_spi_configure.call_count, 1)
+        eq_(api.py_aa_spi_master_ss_polarity.call_count, 1)
+
+        # getters are answered from the cache
+        eq_(self.a.i2c_bitrate, 100)
+        eq_(self.a.i2c_pullups, True)
+        eq_(self.a.target_power, False)
+        eq_(api.py_aa_i2c_bitrate.call_count, 1)
+
+        self.a.i2c_bitrate = 400
+        api.py_aa_i2c_bitrate.assert_called_with(self.a.handle, 400)
+
+    def test_cache_enable_i2c(self, api):
+        api.py_aa_configure.side_effect = lambda handle, value: (
+                CONFIG_SPI_GPIO if value == CONFIG_QUERY else value)
+        self.a.enable_cache()
+        self.a.enable_i2c = True
+        self.a.enable_i2c = True
+        eq_(self.a.enable_i2c, True)
+        api.py_aa_configure.assert_has_calls([
+            call(self.a.handle, CONFIG_QUERY),
+            call(self.a.handle, CONFIG_SPI_I2C),
+        ])
+        eq_(api.py_aa_configure.call_count, 2)
+
+    def test_cache_invalidate(self, api):
+        api.py_aa_spi_bitrate.return_value = 1000
+        self.a.enable_cache()
+        eq_(self.a.spi_bitrate, 1000)
+        eq_(self.a.spi_bitrate, 1000)
+        eq_(api.py_aa_spi_bitrate.call_count, 1)
+        self.a.invalidate_cache()
+        eq_(self.a.spi_bitrate, 1000)
+        eq_(api.py_aa_spi_bitrate.call_count, 2)
+
+    def test_cache_disabled(self, api):
+        api.py_aa_spi_bitrate.return_value = 1000
+        self.a.enable_cache()
+        self.a.disable_cache()
+        self.a.spi_bitrate = 1000
+        self.a.spi_bitrate = 1000
+        eq_(api.py_aa_spi_bitrate.call_count, 2)
+
+    @patch('pyaardvark.aardvark.log', autospec=True)
+    def test_cache_verify(self, log, api):
+        api.py_aa_i2c_bitrate.return_value = 100
+        self.a.enable_cache(verify=True)
+        self.a.i2c_bitrate = 100
+        self.a.i2c_bitrate = 100
+        eq_(api.py_aa_i2c_bitrate.call_count, 2)
+        api.py_aa_i2c_bitrate.return_value = 400
+        eq_(self.a.i2c_bitrate, 400)
+        eq_(log.warning.call_count, 1)
+
     def test_i2c_master_write(self, api):
         addr = 0x50
         data = b'\x01\x02\x03'
@@ -292,6 +386,108 @@ class TestAardvark(object):
         api.py_aa_i2c_read.return_value = -1
         self.a.i2c_master_read(0, 0)
 
+    def test_i2c_master_write_bytearray(self, api):
+        api.py_aa_i2c_write.return_value = 0
+        data = bytearray(b'\x01\x02\x03')
+        self.a.i2c_master_write(0x50, data)
+        args = api.py_aa_i2c_write.call_args[0]
+        eq_(args[3], 3)
+        assert args[4] is data
+
+    def test_i2c_master_write_memoryview(self, api):
+        api.py_aa_i2c_write.return_value = 0
+        self.a.i2c_master_write(0x50, memoryview(b'\x01\x02'))
+        api.py_aa_i2c_write.assert_called_once_with(self.a.handle, 0x50,
+                pyaardvark.I2C_NO_FLAGS, 2, bytearray(b'\x01\x02'))
+
+    def test_i2c_master_write_array(self, api):
+        api.py_aa_i2c_write.return_value = 0
+        data = array.array('B', b'\x01\x02')
+        self.a.i2c_master_write(0x50, data)
+        assert api.py_aa_i2c_write.call_args[0][4] is data
+        data = array.array('H', [0x0102, 0x0304])
+        self.a.i2c_master_write(0x50, data)
+        args = api.py_aa_i2c_write.call_args[0]
+        eq_(args[3], 4)
+        eq_(args[4], bytearray(data.tostring()))
+
+    def test_i2c_master_read_into(self, api):
+        def i2c_master_read(_handle, _addr, _flags, length, data):
+            for i in range(length - 1):
+                data[i] = i + 1
+            return length - 1
+
+        api.py_aa_i2c_read.side_effect = i2c_master_read
+        buf = bytearray(4)
+        eq_(self.a.i2c_master_read_into(0x50, buf), 3)
+        assert api.py_aa_i2c_read.call_args[0][4] is buf
+        eq_(buf, bytearray(b'\x01\x02\x03\x00'))
+
+    def test_i2c_master_read_into_memoryview(self, api):
+        def i2c_master_read(_handle, _addr, _flags, length, data):
+            for i in range(length):
+                data[i] = i + 1
+            return length
+
+        api.py_aa_i2c_read.side_effect = i2c_master_read
+        buf = bytearray(4)
+        eq_(self.a.i2c_master_read_into(0x50, memoryview(buf)[1:3]), 2)
+        eq_(buf, bytearray(b'\x00\x01\x02\x00'))
+
+    @raises(IOError)
+    def test_i2c_master_read_into_error(self, api):
+        api.py_aa_i2c_read.return_value = -1
+        self.a.i2c_master_read_into(0, bytearray(1))
+
+    def test_i2c_master_write_ext(self, api):
+        api.py_aa_i2c_write_ext.return_value = (I2C_STATUS_SLA_NACK, 0)
+        eq_(self.a.i2c_master_write_ext(0x50, b''),
+                (I2C_STATUS_SLA_NACK, 0))
+        api.py_aa_i2c_write_ext.assert_called_once_with(self.a.handle, 0x50,
+                pyaardvark.I2C_NO_FLAGS, 0, array.array('B'))
+
+    @raises(IOError)
+    def test_i2c_master_write_ext_error(self, api):
+        api.py_aa_i2c_write_ext.return_value = (-1, 0)
+        self.a.i2c_master_write_ext(0x50, b'\x00')
+
+    def test_i2c_master_read_into_ext(self, api):
+        def i2c_master_read_ext(_handle, _addr, _flags, length, data):
+            data[0] = 0x42
+            return I2C_STATUS_DATA_NACK, 1
+
+        api.py_aa_i2c_read_ext.side_effect = i2c_master_read_ext
+        buf = bytearray(2)
+        eq_(self.a.i2c_master_read_into_ext(0x50, buf),
+                (I2C_STATUS_DATA_NACK, 1))
+        eq_(buf, bytearray(b'\x42\x00'))
+
+    def test_i2c_scan(self, api):
+        api.py_aa_i2c_write_ext.side_effect = lambda _h, addr, _f, _n, _d: \
+                (I2C_STATUS_OK if addr in (0x20, 0x50) else
+                 I2C_STATUS_SLA_NACK, 0)
+        eq_(self.a.i2c_scan(), [0x20, 0x50])
+        eq_(api.py_aa_i2c_write_ext.call_count, 112)
+        eq_(api.py_aa_i2c_write_ext.call_args[0][3], 0)
+
+    def test_i2c_scan_read(self, api):
+        api.py_aa_i2c_read_ext.return_value = (I2C_STATUS_OK, 1)
+        eq_(self.a.i2c_scan([0x50, 0x51], probe='read'), [0x50, 0x51])
+        eq_(api.py_aa_i2c_read_ext.call_args[0][3], 1)
+
+    @raises(IOError)
+    def test_i2c_scan_bus_error(self, api):
+        api.py_aa_i2c_write_ext.return_value = (I2C_STATUS_BUS_LOCKED, 0)
+        self.a.i2c_scan()
+
+    @raises(ValueError)
+    def test_i2c_scan_invalid_probe(self, api):
+        self.a.i2c_scan(probe='foo')
+
+    def test_i2c_status_string(self, api):
+        eq_(pyaardvark.aardvark.i2c_status_string(I2C_STATUS_SLA_NACK),
+                'I2C_STATUS_SLA_NACK')
+
     def test_i2c_master_write_read(self, api):
         def i2c_master_read(_handle, _addr, _flags, length, data):
             eq_(data, array.array('B', (0,) * length))
@@ -327,6 +523,93 @@ class TestAardvark(object):
         api.py_aa_i2c_read.return_value = 1
         self.a.i2c_master_write_read(0, '', 0)
 
+    def test_i2c_slave_enable(self, api):
+        api.py_aa_i2c_slave_enable.return_value = 0
+        self.a.i2c_slave_enable(0x50)
+        api.py_aa_i2c_slave_enable.assert_called_once_with(self.a.handle,
+                0x50, self.a.BUFFER_SIZE, self.a.BUFFER_SIZE)
+
+    def test_i2c_slave_enable_max_bytes(self, api):
+        api.py_aa_i2c_slave_enable.return_value = 0
+        self.a.i2c_slave_enable(0x50, 16, 32)
+        api.py_aa_i2c_slave_enable.assert_called_once_with(self.a.handle,
+                0x50, 16, 32)
+        eq_(self.a.i2c_slave_rx_pool.size, 32)
+
+    @raises(IOError)
+    def test_i2c_slave_enable_error(self, api):
+        api.py_aa_i2c_slave_enable.return_value = -1
+        self.a.i2c_slave_enable(0x50)
+
+    def test_i2c_slave_disable(self, api):
+        api.py_aa_i2c_slave_disable.return_value = 0
+        self.a.i2c_slave_disable()
+        api.py_aa_i2c_slave_disable.assert_called_once_with(self.a.handle)
+
+    def test_i2c_slave_set_response(self, api):
+        api.py_aa_i2c_slave_set_response.return_value = 2
+        self.a.i2c_slave_set_response(b'\x01\x02')
+        api.py_aa_i2c_slave_set_response.assert_called_once_with(
+                self.a.handle, 2, array.array('B', b'\x01\x02'))
+
+    def test_i2c_slave_write_stats(self, api):
+        api.py_aa_i2c_slave_write_stats.return_value = 3
+        eq_(self.a.i2c_slave_write_stats(), 3)
+
+    @raises(IOError)
+    def test_i2c_slave_write_stats_error(self, api):
+        api.py_aa_i2c_slave_write_stats.return_value = -1
+        self.a.i2c_slave_write_stats()
+
+    def test_i2c_slave_read(self, api):
+        def i2c_slave_read(_handle, length, data):
+            data[:3] = b'\x01\x02\x03'
+            return (3, 0x50)
+
+        api.py_aa_i2c_slave_enable.return_value = 0
+        api.py_aa_i2c_slave_read.side_effect = i2c_slave_read
+        self.a.i2c_slave_enable(0x50, max_rx_bytes=8)
+        eq_(self.a.i2c_slave_read(), (0x50, b'\x01\x02\x03'))
+        eq_(self.a.i2c_slave_read(), (0x50, b'\x01\x02\x03'))
+        api.py_aa_i2c_slave_read.assert_called_with(self.a.handle, 8, ANY)
+        eq_(self.a.i2c_slave_rx_pool.allocated, 1)
+        eq_(self.a.i2c_slave_rx_pool.reused, 1)
+
+    def test_i2c_slave_read_buffer(self, api):
+        api.py_aa_i2c_slave_read.return_value = (2, 0x50)
+        (addr, buf) = self.a.i2c_slave_read_buffer()
+        eq_(addr, 0x50)
+        eq_(len(buf.view), 2)
+        buf.release()
+        eq_(self.a.i2c_slave_rx_pool.stats()['free'], 1)
+
+    @raises(IOError)
+    def test_i2c_slave_read_error(self, api):
+        api.py_aa_i2c_slave_read.return_value = (-1, 0)
+        try:
+            self.a.i2c_slave_read()
+        finally:
+            eq_(self.a.i2c_slave_rx_pool.stats()['free'], 1)
+
+    def test_i2c_monitor_enable(self, api):
+        api.py_aa_i2c_monitor_enable.return_value = 0
+        self.a.i2c_monitor_enable()
+        api.py_aa_i2c_monitor_enable.assert_called_once_with(self.a.handle)
+
+    @raises(IOError)
+    def test_i2c_monitor_disable_error(self, api):
+        api.py_aa_i2c_monitor_disable.return_value = -1
+        self.a.i2c_monitor_disable()
+
+    def test_i2c_monitor_read(self, api):
+        def i2c_monitor_read(_handle, length, data):
+            data[0] = pyaardvark.I2C_MONITOR_CMD_START
+            data[1] = 0xa0
+            return 2
+        api.py_aa_i2c_monitor_read.side_effect = i2c_monitor_read
+        eq_(self.a.i2c_monitor_read(),
+                array.array('H', [pyaardvark.I2C_MONITOR_CMD_START, 0xa0]))
+
     def test_spi_bitrate(self, api):
         api.py_aa_spi_bitrate.return_value = 1000
         self.a.spi_bitrate = 4711
@@ -371,6 +654,36 @@ class TestAardvark(object):
     def test_spi_configure_mode_unknown_mode(self, api):
         self.a.spi_configure_mode(1)
 
+    def test_spi_slave_enable(self, api):
+        api.py_aa_spi_slave_enable.return_value = 0
+        self.a.spi_slave_enable()
+        api.py_aa_spi_slave_enable.assert_called_once_with(self.a.handle)
+
+    @raises(IOError)
+    def test_spi_slave_disable_error(self, api):
+        api.py_aa_spi_slave_disable.return_value = -1
+        self.a.spi_slave_disable()
+
+    def test_spi_slave_set_response(self, api):
+        api.py_aa_spi_slave_set_response.return_value = 1
+        self.a.spi_slave_set_response(b'\xff')
+        api.py_aa_spi_slave_set_response.assert_called_once_with(
+                self.a.handle, 1, array.array('B', b'\xff'))
+
+    def test_spi_slave_read(self, api):
+        def spi_slave_read(_handle, length, data):
+            data[:2] = b'\x01\x02'
+            return 2
+        api.py_aa_spi_slave_read.side_effect = spi_slave_read
+        eq_(self.a.spi_slave_read(), b'\x01\x02')
+        eq_(self.a.spi_slave_read(), b'\x01\x02')
+        eq_(self.a.spi_slave_rx_pool.reused, 1)
+
+    @raises(IOError)
+    def test_spi_slave_read_error(self, api):
+        api.py_aa_spi_slave_read.return_value = -1
+        self.a.spi_slave_read()
+
     def test_spi_ss_polarity(self, api):
         api.py_aa_spi_master_ss_polarity.return_value = 0
         self.a.spi_ss_polarity(42)
@@ -394,10 +707,128 @@ class TestAardvark(object):
         api.py_aa_spi_write.assert_called_once_with(self.a.handle, len(data),
                 array.array('B', data), len(data), ANY)
 
+    def test_spi_transfer_into(self, api):
+        def spi_write(_handle, len_tx, tx, len_rx, rx):
+            for i, v in enumerate(reversed(tx)):
+                rx[i] = v
+            return len_tx
+        api.py_aa_spi_write.side_effect = spi_write
+        data_out = bytearray(b'\x01\x02\x03')
+        data_in = bytearray(3)
+        eq_(self.a.spi_transfer_into(data_out, data_in), 3)
+        eq_(data_in, bytearray(b'\x03\x02\x01'))
+        api.py_aa_spi_write.assert_called_once_with(self.a.handle, 3,
+                data_out, 3, data_in)
+
     @raises(IOError)
     def test_spi_spi_write_error(self, api):
         api.py_aa_spi_write.return_value = -1
         self.a.spi_write('')
 
+    def test_batch(self, api):
+        def i2c_read(_handle, _addr, _flags, length, data):
+            for i in range(length):
+                data[i] = i
+            return length
+        def spi_write(_handle, len_tx, tx, len_rx, rx):
+            for i, v in enumerate(reversed(tx)):
+                rx[i] = v
+            return len_tx
+        api.py_aa_i2c_write.return_value = 1
+        api.py_aa_i2c_read.side_effect = i2c_read
+        api.py_aa_spi_write.side_effect = spi_write
+
+        results = self.a.batch([
+            ('i2c_write', 0x50, b'\x01'),
+            ('i2c_read', 0x50, 2, pyaardvark.I2C_NO_STOP),
+            ('i2c_write_read', 0x51, b'\x02', 3),
+            ('delay', 0),
+            ('spi', b'\x01\x02'),
+        ])
+        eq_(results, [
+            (1, None),
+            (2, b'\x00\x01'),
+            (3, b'\x00\x01\x02'),
+            (0, None),
+            (2, b'\x02\x01'),
+        ])
+        api.py_aa_i2c_write.assert_has_calls([
+            call(self.a.handle, 0x50, pyaardvark.I2C_NO_FLAGS, 1,
+                    array.array('B', b'\x01')),
+            call(self.a.handle, 0x51, pyaardvark.I2C_NO_STOP, 1,
+                    array.array('B', b'\x02')),
+        ])
+        api.py_aa_i2c_read.assert_has_calls([
+            call(self.a.handle, 0x50, pyaardvark.I2C_NO_STOP, 2, ANY),
+            call(self.a.handle, 0x51, pyaardvark.I2C_NO_FLAGS, 3, ANY),
+        ])
+
+    def test_batch_stop_on_error(self, api):
+        api.py_aa_i2c_write.side_effect = [1, -1, 1]
+        ops = [('i2c_write', 0x50, b'\x00')] * 3
+        results = self.a.batch(ops)
+        eq_(results, [(1, None), (-1, None), (None, None)])
+        eq_(api.py_aa_i2c_write.call_count, 2)
+
+    def test_batch_continue_on_error(self, api):
+        api.py_aa_i2c_write.side_effect = [1, -1, 1]
+        ops = [('i2c_write', 0x50, b'\x00')] * 3
+        results = self.a.batch(ops, stop_on_error=False)
+        eq_(results, [(1, None), (-1, None), (1, None)])
+
+    @raises(ValueError)
+    def test_batch_unknown_op(self, api):
+        self.a.batch([('foo',)])
+
+    def test_batch_gpio(self, api):
+        api.py_aa_gpio_set.return_value = 0
+        api.py_aa_gpio_get.return_value = GPIO_MISO
+        results = self.a.batch([('gpio_set', GPIO_SS), ('gpio_get',)])
+        eq_(results, [(0, None), (GPIO_MISO, None)])
+        api.py_aa_gpio_set.assert_called_once_with(self.a.handle, GPIO_SS)
+        self.a.gpio_update(GPIO_SCK, GPIO_SCK)
+        api.py_aa_gpio_set.assert_called_with(self.a.handle,
+                GPIO_SS | GPIO_SCK)
+
+    def test_gpio_direction(self, api):
+        api.py_aa_gpio_direction.return_value = 0
+        self.a.enable_cache()
+        self.a.gpio_direction(GPIO_SS | GPIO_SCK)
+        self.a.gpio_direction(GPIO_SS | GPIO_SCK)
+        api.py_aa_gpio_direction.assert_called_once_with(self.a.handle,
+                GPIO_SS | GPIO_SCK)
+
+    @raises(IOError)
+    def test_gpio_direction_error(self, api):
+        api.py_aa_gpio_direction.return_value = -1
+        self.a.gpio_direction(GPIO_ALL)
+
+    def test_gpio_pullup(self, api):
+        api.py_aa_gpio_pullup.return_value = 0
+        self.a.gpio_pullup(GPIO_MISO)
+        api.py_aa_gpio_pullup.assert_called_once_with(self.a.handle,
+                GPIO_MISO)
+
+    def test_gpio_get(self, api):
+        api.py_aa_gpio_get.return_value = GPIO_SDA | GPIO_SCL
+        eq_(self.a.gpio_get(), GPIO_SDA | GPIO_SCL)
+
+    @raises(IOError)
+    def test_gpio_get_error(self, api):
+        api.py_aa_gpio_get.return_value = -1
+        self.a.gpio_get()
+
+    def test_gpio_update(self, api):
+        api.py_aa_gpio_set.return_value = 0
+        self.a.gpio_set(GPIO_SS | GPIO_MOSI)
+        self.a.gpio_update(GPIO_SS | GPIO_SCK, GPIO_SCK)
+        api.py_aa_gpio_set.assert_called_with(self.a.handle,
+                GPIO_MOSI | GPIO_SCK)
+
+    def test_gpio_change(self, api):
+        api.py_aa_gpio_change.return_value = GPIO_SDA
+        eq_(self.a.gpio_change(100), GPIO_SDA)
+        api.py_aa_gpio_change.assert_called_once_with(self.a.handle, 100)
+
 if __name__ == '__main__':
     nose.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+import inspect
+import threading
+import nose
+from mock import patch
+import pyaardvark
+from pyaardvark.constants import *
+from nose.tools import eq_, raises
+
+try:
+    from pyaardvark import aio
+except ImportError:
+    raise nose.SkipTest('asyncio not available')
+
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+class TestAsyncAardvark(object):
+    def setup(self):
+        self.loop = aio.asyncio.new_event_loop()
+
+    def teardown(self):
+        self.loop.close()
+
+    def run(self, future):
+        return self.loop.run_until_complete(future)
+
+    def open(self, api):
+        api.py_aa_open_ext.return_value = (1, (0,) * 6)
+        return self.run(aio.open(loop=self.loop))
+
+    def test_open_close(self, api):
+        a = self.open(api)
+        eq_(a.device.handle, 1)
+        self.run(a.close())
+        api.py_aa_close.assert_called_once_with(1)
+
+    @raises(IOError)
+    def test_open_error(self, api):
+        api.py_aa_open_ext.return_value = (-1, (0,) * 6)
+        self.run(aio.open(loop=self.loop))
+
+    def test_open_cancelled(self, api):
+        release = threading.Event()
+        def open_ext(port):
+            release.wait()
+            return (1, (0,) * 6)
+        api.py_aa_open_ext.side_effect = open_ext
+        future = aio.open(loop=self.loop)
+        future.cancel()
+        release.set()
+        for _ in range(100):
+            if api.py_aa_close.called:
+                break
+            self.run(aio.asyncio.sleep(0.01, loop=self.loop))
+        api.py_aa_close.assert_called_once_with(1)
+
+    def test_calls_are_serialized(self, api):
+        order = []
+        def i2c_write(_handle, addr, _flags, _length, _data):
+            order.append(addr)
+            return 0
+        api.py_aa_i2c_write.side_effect = i2c_write
+        a = self.open(api)
+        futures = [a.i2c_master_write(addr, b'\x00') for addr in range(16)]
+        for future in futures:
+            self.run(future)
+        eq_(order, list(range(16)))
+
+    def test_read(self, api):
+        api.py_aa_i2c_read.return_value = 0
+        a = self.open(api)
+        eq_(self.run(a.i2c_master_read(0x50, 0)), b'')
+
+    @raises(IOError)
+    def test_read_error(self, api):
+        api.py_aa_i2c_read.return_value = -1
+        a = self.open(api)
+        self.run(a.i2c_master_read(0x50, 1))
+
+    def test_get_set(self, api):
+        api.py_aa_i2c_bitrate.return_value = 400
+        a = self.open(api)
+        self.run(a.set('i2c_bitrate', 400))
+        eq_(self.run(a.get('i2c_bitrate')), 400)
+
+    def test_slave_set_response(self, api):
+        api.py_aa_i2c_slave_set_response.return_value = 2
+        a = self.open(api)
+        self.run(a.i2c_slave_set_response(b'\x12\x34'))
+        eq_(api.py_aa_i2c_slave_set_response.call_args[0][:2], (1, 2))
+
+    def test_events(self, api):
+        def i2c_slave_read(_handle, length, data):
+            data[0] = 0x42
+            return (1, 0x50)
+        def spi_slave_read(_handle, length, data):
+            data[0] = 0x55
+            return 1
+        api.py_aa_async_poll.side_effect = [POLL_NO_DATA, POLL_NO_DATA,
+                POLL_I2C_READ, POLL_I2C_WRITE, POLL_SPI]
+        api.py_aa_i2c_slave_read.side_effect = i2c_slave_read
+        api.py_aa_spi_slave_read.side_effect = spi_slave_read
+        a = self.open(api)
+        events = a.events(timeout_ms=10)
+        eq_(self.run(events.next_event()),
+                (POLL_I2C_READ, 0x50, b'\x42'))
+        eq_(self.run(events.next_event()), (POLL_I2C_WRITE, None, None))
+        eq_(self.run(events.next_event()), (POLL_SPI, None, b'\x55'))
+        events.stop()
+        try:
+            self.run(events.next_event())
+        except aio.StopAsyncIteration:
+            pass
+        else:
+            assert False
+
+def test_all_methods_wrapped():
+    def methods(cls):
+        return set(name for (name, _) in inspect.getmembers(cls,
+            inspect.ismethod) if not name.startswith('_'))
+    eq_(methods(pyaardvark.Aardvark) - methods(aio.AsyncAardvark), set())
+
+if __name__ == '__main__':
+    nose.main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+import nose
+from pyaardvark.buffers import BufferPool, PooledBuffer
+from nose.tools import eq_
+
+
+def test_pool_reuse():
+    pool = BufferPool(16)
+    buf = pool.acquire()
+    eq_(len(buf), 16)
+    pool.release(buf)
+    assert pool.acquire() is buf
+    eq_(pool.allocated, 1)
+    eq_(pool.reused, 1)
+
+def test_pool_max_free():
+    pool = BufferPool(4, max_free=1)
+    bufs = [pool.acquire() for _ in range(3)]
+    for buf in bufs:
+        pool.release(buf)
+    eq_(pool.stats(), dict(size=4, allocated=3, reused=0, free=1))
+
+def test_pool_release_wrong_size():
+    pool = BufferPool(4)
+    pool.release(bytearray(8))
+    eq_(pool.stats()['free'], 0)
+
+def test_pooled_buffer():
+    pool = BufferPool(4)
+    data = pool.acquire()
+    data[:] = b'abcd'
+    with PooledBuffer(pool, data, 2) as buf:
+        eq_(len(buf), 2)
+        eq_(buf.tobytes(), b'ab')
+    eq_(buf.view, None)
+    assert pool.acquire() is data
+
+if __name__ == '__main__':
+    nose.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import tempfile
+import nose
+from mock import patch, Mock
+import pyaardvark
+from pyaardvark.constants import *
+from pyaardvark.discovery import DeviceIndex
+from nose.tools import eq_, raises
+
+# port -> unique id
+DEVICES = {
+    1: 1234567890,
+    2: 1111222222,
+    3 | PORT_NOT_FREE: 3333444444,
+}
+
+def find_devices(num, devs):
+    for i, port in enumerate(sorted(DEVICES)[:num]):
+        devs[i] = port
+    return len(DEVICES)
+
+def find_devices_ext(num, num_ids, devs, ids):
+    for i, port in enumerate(sorted(DEVICES)[:num]):
+        devs[i] = port
+        ids[i] = DEVICES[port]
+    return len(DEVICES)
+
+def _api():
+    # an API without py_aa_find_devices_ext, like the remote one
+    api = Mock(spec=['py_aa_find_devices', 'py_aa_open_ext',
+        'py_aa_unique_id', 'py_aa_close'])
+    api.py_aa_find_devices.side_effect = find_devices
+    api.py_aa_open_ext.side_effect = lambda port: (port, (0x100, 0x200,
+        0x300, 0, 0, 0))
+    api.py_aa_unique_id.side_effect = lambda handle: DEVICES[handle]
+    return api
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+def test_refresh_ext(api):
+    api.py_aa_find_devices_ext.side_effect = find_devices_ext
+    index = DeviceIndex()
+    eq_(index.refresh(), True)
+    eq_(index.refresh(), False)
+    eq_(index.port('1111-222222'), 2)
+    eq_(index.serial_number(3), '3333-444444')
+    eq_([d.in_use for d in index.devices()], [False, False, True])
+    eq_(api.py_aa_open_ext.call_count, 0)
+
+def test_refresh_open():
+    api = _api()
+    with patch('pyaardvark.aardvark.api', api):
+        index = DeviceIndex()
+        eq_(index.refresh(), True)
+        eq_(api.py_aa_open_ext.call_count, 2)
+        eq_(index.devices()[0],
+                (1, '1234-567890', False, '2.00', '3.00'))
+        # in use devices are not opened
+        eq_(index.serial_number(3), None)
+
+        # nothing changed, nothing is opened
+        eq_(index.refresh(), False)
+        eq_(api.py_aa_open_ext.call_count, 2)
+
+        eq_(index.refresh(force=True), False)
+        eq_(api.py_aa_open_ext.call_count, 4)
+
+def test_open():
+    api = _api()
+    with patch('pyaardvark.aardvark.api', api):
+        index = DeviceIndex()
+        index.refresh()
+        dev = index.open('1111-222222')
+        eq_(dev.handle, 2)
+
+@raises(IOError)
+def test_open_unknown():
+    with patch('pyaardvark.aardvark.api', _api()):
+        DeviceIndex().open('7777-888888')
+
+class TestCacheFile(object):
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmpdir, 'devices.json')
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_persist(self):
+        api = _api()
+        with patch('pyaardvark.aardvark.api', api):
+            DeviceIndex(self.cache_file).refresh()
+            eq_(api.py_aa_open_ext.call_count, 2)
+
+            # a second index doesn't need to open any device
+            index = DeviceIndex(self.cache_file)
+            eq_(index.refresh(), False)
+            eq_(index.port('1234-567890'), 1)
+            eq_(api.py_aa_open_ext.call_count, 2)
+
+    def test_stale_cache(self):
+        with open(self.cache_file, 'w') as f:
+            json.dump({'1': {'serial_number': '1111-222222'},
+                '2': {'serial_number': '1234-567890'}}, f)
+        api = _api()
+        with patch('pyaardvark.aardvark.api', api):
+            index = DeviceIndex(self.cache_file)
+            dev = index.open('1111-222222')
+            eq_(dev.handle, 2)
+            eq_(index.port('1234-567890'), 1)
+
+    def test_invalid_cache(self):
+        with open(self.cache_file, 'w') as f:
+            f.write('garbage')
+        eq_(DeviceIndex(self.cache_file).devices(), [])
+
+if __name__ == '__main__':
+    nose.main()
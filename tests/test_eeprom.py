@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import nose
+from mock import patch
+import pyaardvark
+from pyaardvark.constants import *
+from pyaardvark.eeprom import EEPROM
+from nose.tools import eq_, raises
+
+
+class FakeEEPROM(object):
+    """Emulates a 24Cxx device behind the mocked API. Every write cycle
+    keeps the device busy for `busy_polls` transactions.
+    """
+    def __init__(self, api, size, address_width, busy_polls=2):
+        self.mem = bytearray(size)
+        self.address_width = address_width
+        self.busy_polls = busy_polls
+        self.busy = 0
+        self.pointer = 0
+        self.writes = []
+        api.py_aa_i2c_write_ext.side_effect = self.write_ext
+        api.py_aa_i2c_write.side_effect = self.write
+        api.py_aa_i2c_read.side_effect = self.read
+
+    def _set_pointer(self, addr, data):
+        block = addr - 0x50
+        offset = 0
+        for b in data[:self.address_width]:
+            offset = (offset << 8) | b
+        self.pointer = (block << (8 * self.address_width)) + offset
+
+    def write_ext(self, handle, addr, flags, length, data):
+        if self.busy:
+            self.busy -= 1
+            return I2C_STATUS_SLA_NACK, 0
+        if length:
+            self._set_pointer(addr, data)
+            payload = data[self.address_width:length]
+            self.writes.append((self.pointer, len(payload)))
+            self.mem[self.pointer:self.pointer + len(payload)] = \
+                    payload.tostring()
+            self.busy = self.busy_polls
+        return I2C_STATUS_OK, length
+
+    def write(self, handle, addr, flags, length, data):
+        assert self.busy == 0
+        self._set_pointer(addr, data)
+        return length
+
+    def read(self, handle, addr, flags, length, data):
+        data[:length] = self.mem[self.pointer:self.pointer + length]
+        self.pointer += length
+        return length
+
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+class TestEEPROM(object):
+    def setup(self):
+        with patch('pyaardvark.aardvark.api', autospec=True) as api:
+            api.py_aa_open_ext.return_value = (1, (0,) * 6)
+            self.a = pyaardvark.open()
+
+    def test_write_page_split(self, api):
+        dev = FakeEEPROM(api, 8192, 2)
+        e = EEPROM.from_part(self.a, '24c64')
+        e.write(bytearray(range(70)), 30)
+        eq_(dev.writes, [(30, 2), (32, 32), (64, 32), (96, 4)])
+        eq_(dev.mem[30:100], bytearray(range(70)))
+        eq_(dev.busy, 0)
+
+    def test_read(self, api):
+        dev = FakeEEPROM(api, 8192, 2)
+        dev.mem[:] = bytearray(i & 0xff for i in range(8192))
+        e = EEPROM.from_part(self.a, '24c64')
+        eq_(e.read(0x1ff0, 4), b'\xf0\xf1\xf2\xf3')
+        eq_(len(e.read()), 8192)
+        eq_(api.py_aa_i2c_read.call_count, 2)
+
+    def test_read_large(self, api):
+        dev = FakeEEPROM(api, 131072, 2)
+        dev.mem[:] = bytearray(i & 0xff for i in range(131072))
+        e = EEPROM.from_part(self.a, '24m01')
+        eq_(e.read(), bytes(dev.mem))
+        # two blocks, each needs two reads
+        eq_(api.py_aa_i2c_read.call_count, 4)
+
+    def test_block_address(self, api):
+        dev = FakeEEPROM(api, 2048, 1)
+        e = EEPROM.from_part(self.a, '24c16')
+        e.write(b'\x11\x22', 0xff)
+        eq_(dev.writes, [(0xff, 1), (0x100, 1)])
+        eq_(api.py_aa_i2c_write_ext.call_args_list[-1][0][1], 0x51)
+        eq_(e.read(0xff, 2), b'\x11\x22')
+
+    @raises(IOError)
+    def test_write_timeout(self, api):
+        api.py_aa_i2c_write_ext.return_value = (I2C_STATUS_SLA_NACK, 0)
+        EEPROM(self.a, 256, 8, write_timeout=0.01).write(b'\x00')
+
+    @raises(IOError)
+    def test_bus_error(self, api):
+        api.py_aa_i2c_write_ext.return_value = (I2C_STATUS_BUS_ERROR, 0)
+        EEPROM(self.a, 256, 8).write(b'\x00')
+
+    @raises(ValueError)
+    def test_range(self, api):
+        EEPROM(self.a, 256, 8).read(250, 8)
+
+if __name__ == '__main__':
+    nose.main()
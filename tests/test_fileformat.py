@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+import io
+import nose
+from pyaardvark import fileformat, transfer
+from nose.tools import eq_, raises
+
+
+DATA = bytes(bytearray(range(256))) * 3
+
+def _encode(fmt, chunks, address=0):
+    f = io.BytesIO()
+    sink = fileformat.encoder(fmt, f, address)
+    for chunk in chunks:
+        sink.write(chunk)
+    sink.close()
+    return f.getvalue()
+
+def _decode(fmt, data):
+    return b''.join(fileformat.decoder(fmt, io.BytesIO(data)))
+
+def test_raw():
+    eq_(_encode('raw', [DATA[:10], DATA[10:]]), DATA)
+    eq_(fileformat.decoder('raw', io.BytesIO(DATA)).read(), DATA)
+
+def test_hex():
+    data = _encode('hex', [DATA[:7], DATA[7:20]], address=0x100)
+    eq_(data, b'00000100: 00 01 02 03 04 05 06 07 08 09 0a 0b 0c 0d 0e 0f\n'
+            b'00000110: 10 11 12 13\n')
+    eq_(_decode('hex', data), DATA[:20])
+
+def test_hex_plain():
+    eq_(_decode('hex', b'# comment\n00 01\n\nff FE\n'), b'\x00\x01\xff\xfe')
+
+@raises(ValueError)
+def test_hex_invalid():
+    _decode('hex', b'00 0g\n')
+
+def test_intel_hex():
+    data = _encode('ihex', [DATA[:3], DATA[3:18]])
+    eq_(data, b':10000000000102030405060708090A0B0C0D0E0F78\n'
+            b':020010001011CD\n'
+            b':00000001FF\n')
+    eq_(_decode('ihex', data), DATA[:18])
+
+def test_intel_hex_extended_address():
+    data = _encode('ihex', [DATA[:24]], address=0xfff8)
+    lines = data.splitlines()
+    eq_(lines[0], b':08FFF8000001020304050607E5')
+    eq_(lines[1], b':020000040001F9')
+    eq_(lines[2][:9], b':08000000')
+    eq_(_decode('ihex', data), DATA[:24])
+
+def test_intel_hex_gap():
+    data = b':020000000102FB\n:0100040003F8\n:00000001FF\n'
+    eq_(_decode('ihex', data), b'\x01\x02\xff\xff\x03')
+
+def test_intel_hex_address():
+    data = _encode('ihex', [DATA[:4]], address=0x12340)
+    source = fileformat.decoder('ihex', io.BytesIO(data))
+    eq_(source.address, None)
+    readinto = transfer.reader(source)
+    buf = bytearray(2)
+    eq_(readinto(buf), 2)
+    eq_(source.address, 0x12340)
+
+@raises(ValueError)
+def test_intel_hex_checksum():
+    _decode('ihex', b':0100000001FF\n')
+
+@raises(ValueError)
+def test_intel_hex_descending():
+    _decode('ihex', b':0100040003F8\n:0100000001FE\n')
+
+def test_transfer_source():
+    data = _encode('ihex', [DATA])
+    readinto = transfer.reader(fileformat.decoder('ihex', io.BytesIO(data)))
+    buf = bytearray(1000)
+    eq_(readinto(buf), len(DATA))
+    eq_(bytes(buf[:len(DATA)]), DATA)
+
+@raises(ValueError)
+def test_unknown_format():
+    fileformat.encoder('srec', io.BytesIO())
+
+if __name__ == '__main__':
+    nose.main()
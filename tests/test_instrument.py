@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import nose
+from mock import patch
+import pyaardvark
+from pyaardvark import aardvark, instrument
+from nose.tools import eq_, raises
+
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+class TestInstrumentation(object):
+    def setup(self):
+        with patch('pyaardvark.aardvark.api', autospec=True) as api:
+            api.py_aa_open_ext.return_value = (1, (0,) * 6)
+            self.a = pyaardvark.open()
+
+    def teardown(self):
+        aardvark.disable_instrumentation()
+
+    def test_counts(self, api):
+        api.py_aa_i2c_write.return_value = 3
+        api.py_aa_i2c_read.side_effect = [2, -102]
+        instr = aardvark.enable_instrumentation(backend='usb')
+        self.a.i2c_master_write(0x50, b'\x00\x01\x02')
+        self.a.i2c_master_read(0x50, 2)
+        try:
+            self.a.i2c_master_read(0x50, 2)
+        except IOError:
+            pass
+        stats = instr.snapshot()['usb']
+        eq_(stats['py_aa_i2c_write']['calls'], 1)
+        eq_(stats['py_aa_i2c_write']['bytes'], 3)
+        eq_(stats['py_aa_i2c_read']['calls'], 2)
+        eq_(stats['py_aa_i2c_read']['bytes'], 2)
+        eq_(stats['py_aa_i2c_read']['errors'], {'ERR_I2C_READ_ERROR': 1})
+        eq_(sum(stats['py_aa_i2c_read']['histogram'].values()), 2)
+
+    def test_ext_bytes(self, api):
+        api.py_aa_i2c_write_ext.return_value = (0, 4)
+        instr = aardvark.enable_instrumentation(backend='usb')
+        self.a.i2c_master_write_ext(0x50, b'\x00' * 4)
+        eq_(instr.snapshot()['usb']['py_aa_i2c_write_ext']['bytes'], 4)
+
+    def test_open(self, api):
+        api.py_aa_open_ext.return_value = (2, (0,) * 6)
+        instr = aardvark.enable_instrumentation(backend='usb')
+        pyaardvark.open(1)
+        stats = instr.snapshot()['usb']['py_aa_open_ext']
+        eq_(stats['bytes'], 0)
+        eq_(stats['errors'], {})
+
+    def test_exception(self, api):
+        api.py_aa_i2c_write.side_effect = RuntimeError
+        instr = aardvark.enable_instrumentation(backend='remote')
+        try:
+            self.a.i2c_master_write(0x50, b'\x00')
+        except RuntimeError:
+            pass
+        eq_(instr.snapshot()['remote']['py_aa_i2c_write']['errors'],
+                {'RuntimeError': 1})
+
+    def test_disable(self, api):
+        api.py_aa_i2c_write.return_value = 1
+        instr = aardvark.enable_instrumentation()
+        assert isinstance(aardvark.api, instrument.InstrumentedAPI)
+        aardvark.disable_instrumentation()
+        assert aardvark.api is api
+        self.a.i2c_master_write(0x50, b'\x00')
+        eq_(instr.snapshot(), {})
+
+    def test_callback_and_reset(self, api):
+        api.py_aa_spi_write.return_value = 2
+        calls = []
+        instr = aardvark.enable_instrumentation(backend='usb')
+        instr.add_callback(lambda *args: calls.append(args))
+        self.a.spi_write(b'\x00\x00')
+        eq_(len(calls), 1)
+        eq_(calls[0][0:2], ('usb', 'py_aa_spi_write'))
+        eq_(calls[0][3:], (2, 2))
+        assert instr.snapshot(reset=True)
+        eq_(instr.snapshot(), {})
+
+    def test_format_snapshot(self, api):
+        api.py_aa_spi_write.return_value = 2
+        instr = aardvark.enable_instrumentation(backend='usb')
+        self.a.spi_write(b'\x00\x00')
+        line = instrument.format_snapshot(instr.snapshot())
+        assert line.startswith('usb:spi_write calls=1 bytes=2 errors=0')
+
+    def test_periodic_exporter(self, api):
+        snapshots = []
+        instr = instrument.Instrumentation()
+        instr.record('usb', 'py_aa_close', 0.001, 0, 0)
+        exporter = instrument.PeriodicExporter(instr, 10, snapshots.append)
+        exporter.start()
+        exporter.stop()
+        eq_(snapshots[-1]['usb']['py_aa_close']['calls'], 1)
+
+def test_backend_name():
+    eq_(instrument._backend_name(instrument), 'native')
+    eq_(instrument._backend_name(object()), 'object')
+
+if __name__ == '__main__':
+    nose.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+import array
+import os
+import shutil
+import tempfile
+import time
+import nose
+from mock import patch
+import pyaardvark
+from pyaardvark import monitor
+from pyaardvark.constants import *
+from nose.tools import eq_, raises
+
+START = I2C_MONITOR_CMD_START
+STOP = I2C_MONITOR_CMD_STOP
+NACK = I2C_MONITOR_NACK
+
+WORDS = array.array('H', [
+    0x12,                               # garbage before the first start
+    START, 0xa0, 0x00, 0x01,            # write 00 01 to 0x50
+    START, 0xa1, 0x55, 0xaa | NACK,     # repeated start, read 55 aa
+    STOP,
+    START, 0x42 | NACK, STOP,           # address 0x21 not acknowledged
+    START, 0xa0,                        # truncated
+])
+
+EXPECTED = [
+    (0x50, False, b'\x00\x01', [False, False, False], False),
+    (0x50, True, b'\x55\xaa', [False, False, True], True),
+    (0x21, False, b'', [True], True),
+    (0x50, False, b'', [False], False),
+]
+
+def test_decode_python():
+    eq_(monitor._decode_python(WORDS), EXPECTED)
+
+def test_decode_numpy():
+    if monitor.numpy is None:
+        raise nose.SkipTest('numpy not available')
+    eq_(monitor._decode_numpy(WORDS), EXPECTED)
+
+def test_decode_empty():
+    eq_(monitor.decode(array.array('H', [0x12, STOP])), [])
+
+def _monitor_read(words):
+    chunks = [words[i:i + 4] for i in range(0, len(words), 4)]
+    def monitor_read(_handle, length, data):
+        chunk = chunks.pop(0)
+        data[:len(chunk)] = chunk
+        return len(chunk)
+    return monitor_read, len(chunks)
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+class TestI2CMonitor(object):
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_monitor(self, api, **kwargs):
+        api.py_aa_open_ext.return_value = (1, (0,) * 6)
+        (monitor_read, num) = _monitor_read(WORDS)
+        events = [POLL_I2C_MONITOR] * num
+        api.py_aa_async_poll.side_effect = lambda h, t: (events.pop()
+                if events else POLL_NO_DATA)
+        api.py_aa_i2c_monitor_read.side_effect = monitor_read
+        api.py_aa_i2c_monitor_enable.return_value = 0
+        api.py_aa_i2c_monitor_disable.return_value = 0
+        mon = monitor.I2CMonitor(pyaardvark.open(), chunk_words=4, **kwargs)
+        mon.start()
+        while api.py_aa_i2c_monitor_read.call_count < num:
+            pass
+        mon.stop()
+        api.py_aa_i2c_monitor_enable.assert_called_once_with(1)
+        api.py_aa_i2c_monitor_disable.assert_called_once_with(1)
+        return mon
+
+    def test_capture(self, api):
+        mon = self.run_monitor(api)
+        eq_(mon.snapshot(), WORDS)
+        eq_(mon.transactions(), EXPECTED)
+        eq_(mon.stats(), dict(words=len(WORDS), overwritten=0))
+
+    def test_ring_buffer(self, api):
+        mon = self.run_monitor(api, capacity=6)
+        eq_(mon.snapshot(), WORDS[-6:])
+        eq_(mon.stats(), dict(words=len(WORDS), overwritten=len(WORDS) - 6))
+
+    def test_file(self, api):
+        filename = os.path.join(self.tmpdir, 'bus.cap')
+        self.run_monitor(api, capacity=6, filename=filename)
+        words = array.array('H')
+        for chunk in monitor.iter_capture(filename, chunk_words=3):
+            words.extend(chunk)
+        eq_(words, WORDS)
+        if monitor.numpy is not None:
+            eq_(monitor.decode(monitor.load_capture(filename)), EXPECTED)
+
+    def test_stop_not_started(self, api):
+        api.py_aa_open_ext.return_value = (1, (0,) * 6)
+        mon = monitor.I2CMonitor(pyaardvark.open())
+        mon.stop()
+        eq_(api.py_aa_i2c_monitor_disable.call_count, 0)
+
+    def test_read_error(self, api):
+        api.py_aa_open_ext.return_value = (1, (0,) * 6)
+        api.py_aa_async_poll.return_value = POLL_I2C_MONITOR
+        api.py_aa_i2c_monitor_read.return_value = -1
+        api.py_aa_i2c_monitor_enable.return_value = 0
+        api.py_aa_i2c_monitor_disable.return_value = 0
+        with monitor.I2CMonitor(pyaardvark.open(), poll_timeout_ms=10):
+            time.sleep(0.05)
+        # the thread backs off instead of spinning on the error
+        assert api.py_aa_i2c_monitor_read.call_count < 20
+
+    @raises(ValueError)
+    def test_file_invalid(self, api):
+        filename = os.path.join(self.tmpdir, 'bus.cap')
+        with open(filename, 'wb') as f:
+            f.write(b'garbage!')
+        list(monitor.iter_capture(filename))
+
+if __name__ == '__main__':
+    nose.main()
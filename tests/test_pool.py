@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import nose
+from mock import patch
+import pyaardvark
+from nose.tools import eq_, raises
+
+
+def _find_devices(ports):
+    def find_devices(num, devices):
+        for i, port in enumerate(ports[:num]):
+            devices[i] = port
+        return len(ports)
+    return find_devices
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+class TestDevicePool(object):
+    def open(self, api, ports=None):
+        api.py_aa_find_devices.side_effect = _find_devices([1, 2, 3])
+        api.py_aa_open_ext.side_effect = lambda port: (port, (0,) * 6)
+        return pyaardvark.DevicePool(ports)
+
+    def test_all_devices(self, api):
+        with self.open(api) as pool:
+            eq_(sorted(pool.keys()), [1, 2, 3])
+        eq_(api.py_aa_close.call_count, 3)
+
+    def test_map(self, api):
+        with self.open(api, [1, 2]) as pool:
+            futures = pool.map(lambda a, x: (a.handle, x), 42)
+            eq_(futures[1].result(), (1, 42))
+            eq_(futures[2].result(), (2, 42))
+            assert futures[1].run_time >= 0
+            assert futures[1].queue_time >= 0
+
+    def test_run(self, api):
+        with self.open(api, [1, 2]) as pool:
+            eq_(pool.run(lambda a: a.handle * 2), {1: 2, 2: 4})
+
+    def test_submit_order(self, api):
+        order = []
+        with self.open(api, [1]) as pool:
+            futures = [pool.submit(1, lambda a, i: order.append(i), i)
+                    for i in range(10)]
+            futures[-1].result()
+        eq_(order, list(range(10)))
+
+    def test_error(self, api):
+        api.py_aa_i2c_read.return_value = -1
+        with self.open(api, [1, 2]) as pool:
+            futures = pool.map(lambda a: a.i2c_master_read(0x50, 1))
+            assert isinstance(futures[1].exception(), IOError)
+            assert isinstance(futures[2].exception(), IOError)
+            eq_(pool.stats()[1]['errors'], 1)
+            eq_(pool.stats()[2]['calls'], 1)
+
+    @raises(IOError)
+    def test_open_error(self, api):
+        api.py_aa_open_ext.side_effect = [(1, (0,) * 6), (-7, (0,) * 6)]
+        try:
+            pyaardvark.DevicePool([1, 2])
+        finally:
+            api.py_aa_close.assert_called_once_with(1)
+
+if __name__ == '__main__':
+    nose.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+import nose
+from mock import patch
+import pyaardvark
+from pyaardvark.regmap import Register, RegisterMap
+from nose.tools import eq_, raises
+
+
+REGISTERS = [
+    Register('CTRL', 0x10, fields={'EN': (0, 1), 'MODE': (4, 3)}),
+    Register('CFG1', 0x11),
+    Register('CFG2', 0x12),
+    Register('STATUS', 0x20, volatile=True),
+]
+
+class FakeDevice(object):
+    """Register file behind the mocked API with an auto-incrementing
+    register pointer.
+    """
+    def __init__(self, api, address_width=1):
+        self.regs = bytearray(256)
+        self.address_width = address_width
+        self.pointer = 0
+        self.writes = []
+        api.py_aa_i2c_write.side_effect = self.write
+        api.py_aa_i2c_read.side_effect = self.read
+
+    def write(self, handle, addr, flags, length, data):
+        pointer = 0
+        for b in data[:self.address_width]:
+            pointer = (pointer << 8) | b
+        payload = bytearray(data[self.address_width:length])
+        if payload:
+            self.writes.append((pointer, bytes(payload)))
+        self.regs[pointer:pointer + len(payload)] = payload
+        self.pointer = pointer
+        return length
+
+    def read(self, handle, addr, flags, length, data):
+        for i in range(length):
+            data[i] = self.regs[self.pointer + i]
+        return length
+
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+class TestRegisterMap(object):
+    def setup(self):
+        with patch('pyaardvark.aardvark.api', autospec=True) as api:
+            api.py_aa_open_ext.return_value = (1, (0,) * 6)
+            self.a = pyaardvark.open()
+
+    def test_read_cache(self, api):
+        dev = FakeDevice(api)
+        dev.regs[0x10] = 0x42
+        regs = RegisterMap(self.a, 0x40, REGISTERS)
+        eq_(regs.read('CTRL'), 0x42)
+        eq_(regs.read('CTRL'), 0x42)
+        eq_(api.py_aa_i2c_read.call_count, 1)
+        eq_(regs.stats()['hits'], 1)
+        eq_(regs.stats()['misses'], 1)
+
+    def test_volatile(self, api):
+        dev = FakeDevice(api)
+        regs = RegisterMap(self.a, 0x40, REGISTERS)
+        regs.read('STATUS')
+        dev.regs[0x20] = 1
+        eq_(regs.read('STATUS'), 1)
+        eq_(regs.stats()['misses'], 2)
+
+    def test_write_coalescing(self, api):
+        dev = FakeDevice(api)
+        with RegisterMap(self.a, 0x40, REGISTERS) as regs:
+            regs.write('CFG2', 3)
+            regs.write('CTRL', 1)
+            regs.write('CFG1', 2)
+            regs.write(0x30, 4)
+            eq_(dev.writes, [])
+        eq_(dev.writes, [(0x10, b'\x01\x02\x03'), (0x30, b'\x04')])
+        eq_(regs.stats()['write_transactions'], 2)
+        eq_(regs.stats()['coalesced'], 2)
+        # written values are cached
+        eq_(regs.read('CFG1'), 2)
+        eq_(api.py_aa_i2c_read.call_count, 0)
+
+    def test_volatile_write(self, api):
+        dev = FakeDevice(api)
+        regs = RegisterMap(self.a, 0x40, REGISTERS)
+        regs.write('CTRL', 1)
+        regs.write('STATUS', 1)
+        regs.write('STATUS', 2)
+        eq_(dev.writes, [(0x10, b'\x01'), (0x20, b'\x01'), (0x20, b'\x02')])
+        eq_(regs.read('STATUS'), 2)
+        eq_(api.py_aa_i2c_read.call_count, 1)
+
+    def test_flush_error(self, api):
+        dev = FakeDevice(api)
+        regs = RegisterMap(self.a, 0x40, REGISTERS)
+        regs.write('CTRL', 1)
+        regs.write(0x30, 2)
+        api.py_aa_i2c_write.side_effect = [-1]
+        try:
+            regs.flush()
+        except IOError:
+            pass
+        else:
+            assert False
+        api.py_aa_i2c_write.side_effect = dev.write
+        regs.flush()
+        eq_(dev.writes, [(0x10, b'\x01'), (0x30, b'\x02')])
+
+    def test_flush_before_read(self, api):
+        dev = FakeDevice(api)
+        regs = RegisterMap(self.a, 0x40, REGISTERS)
+        regs.write('CTRL', 1)
+        regs.read('STATUS')
+        eq_(dev.writes, [(0x10, b'\x01')])
+
+    def test_update(self, api):
+        dev = FakeDevice(api)
+        dev.regs[0x10] = 0x81
+        regs = RegisterMap(self.a, 0x40, REGISTERS)
+        regs.update('CTRL', EN=0, MODE=5)
+        regs.flush()
+        eq_(dev.regs[0x10], 0xd0)
+        eq_(regs.read_field('CTRL', 'MODE'), 5)
+        eq_(api.py_aa_i2c_read.call_count, 1)
+
+    def test_prefetch(self, api):
+        dev = FakeDevice(api)
+        dev.regs[0x10:0x13] = b'\x01\x02\x03'
+        regs = RegisterMap(self.a, 0x40, REGISTERS)
+        regs.prefetch()
+        eq_(api.py_aa_i2c_read.call_count, 1)
+        eq_([regs.read(r) for r in ('CTRL', 'CFG1', 'CFG2')], [1, 2, 3])
+        eq_(api.py_aa_i2c_read.call_count, 1)
+
+    def test_wide_registers(self, api):
+        dev = FakeDevice(api, address_width=2)
+        dev.regs[0x10:0x14] = b'\x12\x34\x56\x78'
+        regs = RegisterMap(self.a, 0x40, address_width=2, register_size=2,
+                byteorder='little')
+        eq_(regs.read_block(0x10, 2), [0x3412, 0x7856])
+        regs.write(0x20, 0xabcd)
+        regs.flush()
+        eq_(dev.writes, [(0x20, b'\xcd\xab')])
+
+    @raises(ValueError)
+    def test_write_range(self, api):
+        RegisterMap(self.a, 0x40).write(0, 0x100)
+
+if __name__ == '__main__':
+    nose.main()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+
+import array
+import json
+import socket
+import struct
+import threading
+import time
+import nose
+import pyaardvark
+from pyaardvark import aardvark, sim
+from nose.tools import eq_, raises
+
+try:
+    from pyRemoteAardvarkServer import server
+except ImportError:
+    raise nose.SkipTest('asyncio not available')
+
+# importing the client must not connect; don't leave the remote API
+# installed for the other tests
+_api = aardvark.api
+import pyRemoteAardvark
+from pyRemoteAardvark import remoteaardvark
+from pyRemoteAardvark.JsonRPCClient import (JsonRPCClient, ConnectionLost,
+        find_json_object)
+aardvark.api = _api
+
+
+def test_lazy_connect():
+    eq_(remoteaardvark.RemoteAardvarkAPI().rpc.sock, None)
+
+
+class ServerThread(object):
+    def __init__(self, api, port=0):
+        self.loop = server.asyncio.new_event_loop()
+        self.server = server.AardvarkServer(api, self.loop)
+        self.loop.run_until_complete(self.server.start(port=port))
+        self.port = self.server.port
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class TestRemote(object):
+    def setup(self):
+        self.local_api = aardvark.api
+        self.sim = self._simulation()
+        self.server = ServerThread(self.sim)
+
+    def teardown(self):
+        aardvark.api.close()
+        aardvark.api = self.local_api
+        self.server.stop()
+
+    def _simulation(self):
+        api = sim.SimulatedAPI(num_devices=2)
+        self.regs = api.attach_i2c(0, sim.RegisterFileTarget(0x20))
+        return api
+
+    def test_configure(self):
+        api = remoteaardvark.configure(port=self.server.port)
+        eq_(aardvark.api, api)
+        eq_(pyaardvark.find_devices(), [0, 1])
+        a = pyaardvark.open(0)
+        a.i2c_master_write(0x20, b'\x10\xab\xcd')
+        eq_(self.regs.regs[0x10:0x12], bytearray(b'\xab\xcd'))
+        eq_(a.i2c_master_write_read(0x20, b'\x10', 2), b'\xab\xcd')
+        a.close()
+        eq_(self.sim.ports[0].handle, None)
+
+    def test_configure_instrumented(self):
+        instrumentation = aardvark.enable_instrumentation()
+        try:
+            first = remoteaardvark.configure(port=self.server.port)
+            first.rpc.connect()
+            api = remoteaardvark.configure(port=self.server.port)
+            eq_(first.rpc.sock, None)
+            eq_(aardvark.api._api, api)
+            a = pyaardvark.open(0)
+            a.close()
+            eq_(instrumentation.snapshot()['RemoteAardvarkAPI']
+                    ['py_aa_open_ext']['calls'], 1)
+        finally:
+            aardvark.disable_instrumentation()
+
+    def test_reconnect(self):
+        api = remoteaardvark.configure(port=self.server.port, backoff=0.01)
+        a = pyaardvark.open(0)
+        a.i2c_bitrate = 400
+        a.i2c_bitrate
+        port = self.server.port
+        self.server.stop()
+
+        self.sim = self._simulation()
+        self.server = ServerThread(self.sim, port)
+        a.i2c_master_write(0x20, b'\x00\x42')
+        eq_(self.regs.regs[0], 0x42)
+        eq_(self.sim.ports[0].i2c_bitrate, 400)
+        eq_(api.rpc.connections, 2)
+        a.close()
+        eq_(self.sim.ports[0].handle, None)
+
+    def test_reopen_refused(self):
+        remoteaardvark.configure(port=self.server.port, backoff=0.01)
+        a = pyaardvark.open(0)
+        port = self.server.port
+        self.server.stop()
+
+        self.sim = self._simulation()
+        self.sim.py_aa_open_ext(0)
+        self.server = ServerThread(self.sim, port)
+        try:
+            a.i2c_master_write(0x20, b'\x00\x42')
+        except IOError as e:
+            assert 'ERR_UNABLE_TO_OPEN' in str(e)
+        else:
+            assert False
+        eq_(self.regs.regs[0], 0)
+
+    def test_error_codes(self):
+        instrumentation = aardvark.enable_instrumentation()
+        try:
+            remoteaardvark.configure(port=self.server.port)
+            a = pyaardvark.open(0)
+            eq_(aardvark.api.py_aa_i2c_read(a.handle, 0x30, 0, 1,
+                    array.array('B', [0])), pyaardvark.ERR_I2C_READ_ERROR)
+            a.close()
+            eq_(instrumentation.snapshot()['RemoteAardvarkAPI']
+                    ['py_aa_i2c_read']['errors'], {'ERR_I2C_READ_ERROR': 1})
+        finally:
+            aardvark.disable_instrumentation()
+
+    def test_pool(self):
+        api = remoteaardvark.configure(port=self.server.port, pool=True)
+        a = pyaardvark.open(0)
+        b = pyaardvark.open(1)
+        rpcs = [device.rpc for device in api._devices.values()]
+        eq_(len(set(rpcs + [api.rpc])), 3)
+        eq_(api.rpc.sock, None)
+        a.i2c_master_write(0x20, b'\x00\x01')
+        eq_(self.regs.regs[0], 0x01)
+        a.close()
+        b.close()
+        eq_([rpc.sock for rpc in rpcs], [None, None])
+        eq_(self.sim.ports[1].handle, None)
+
+    def test_pipeline(self):
+        api = remoteaardvark.configure(port=self.server.port, pipeline=True)
+        devices = [pyaardvark.open(0), pyaardvark.open(1)]
+        eq_(api.rpc.pipelined, True)
+        results = []
+        def run(a):
+            results.extend(a.unique_id() for _ in range(20))
+        threads = [threading.Thread(target=run, args=(a,)) for a in devices]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        eq_(sorted(set(results)), [2237000000, 2237000001])
+        eq_(len(results), 40)
+
+
+class TestSubmit(object):
+    def setup(self):
+        self.server = ServerThread(sim.SimulatedAPI())
+        self.rpc = JsonRPCClient('127.0.0.1', self.server.port)
+
+    def teardown(self):
+        self.rpc.close()
+        self.server.stop()
+
+    def test_submit(self):
+        response = self.rpc.send_request('Aardvark.aa_open_ext', {'port': 0})
+        handle = response['result']['Aardvark']
+        eq_(self.rpc.pipelined, False)
+        futures = [self.rpc.submit('Aardvark.aa_i2c_bitrate',
+                {'Aardvark': handle, 'bitrate': bitrate})
+                for bitrate in range(100, 200)]
+        eq_(self.rpc.pipelined, True)
+        eq_([f.result()['result']['returnCode'] for f in futures],
+                list(range(100, 200)))
+        eq_(self.rpc.send_request('Aardvark.aa_unique_id',
+                {'Aardvark': handle})['result'], 2237000000)
+
+    def test_reconnect(self):
+        self.rpc.submit('Server.stats', {}).result()
+        port = self.server.port
+        self.server.stop()
+        self.server = ServerThread(sim.SimulatedAPI(), port)
+        for _ in range(100):
+            if not self.rpc.pipelined or self.rpc._pending is None:
+                break
+            time.sleep(0.01)
+        eq_(self.rpc.send_request('Server.stats', {})['result']['clients'], 1)
+        eq_(self.rpc.connections, 2)
+
+
+class FakeServer(object):
+    """Accepts a single connection and passes it to `handler`."""
+    def __init__(self, handler):
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1)
+        self.port = self.sock.getsockname()[1]
+        self.handler = handler
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.start()
+
+    def _serve(self):
+        (conn, _) = self.sock.accept()
+        try:
+            self.handler(conn)
+        finally:
+            conn.close()
+            self.sock.close()
+
+    @staticmethod
+    def _recv(conn, length):
+        data = b''
+        while len(data) < length:
+            chunk = conn.recv(length - len(data))
+            if not chunk:
+                raise EOFError()
+            data += chunk
+        return data
+
+    @staticmethod
+    def read_request(conn):
+        (tag, length) = struct.unpack('>BI', FakeServer._recv(conn, 5))
+        return json.loads(FakeServer._recv(conn, length).decode('utf-8'))
+
+    @staticmethod
+    def respond(conn, request, result):
+        body = json.dumps(dict(jsonrpc='2.0', id=request['id'],
+            result=result)).encode('utf-8')
+        conn.sendall(_message(body))
+
+def test_out_of_order():
+    def handler(conn):
+        requests = [FakeServer.read_request(conn) for _ in range(3)]
+        for request in reversed(requests):
+            FakeServer.respond(conn, request, request['params']['n'])
+    server = FakeServer(handler)
+    rpc = JsonRPCClient('127.0.0.1', server.port)
+    futures = [rpc.submit('echo', {'n': n}) for n in range(3)]
+    eq_([f.result(1)['result'] for f in futures], [0, 1, 2])
+    server.thread.join()
+    rpc.close()
+
+def test_pending_fail():
+    def handler(conn):
+        FakeServer.respond(conn, FakeServer.read_request(conn), 0)
+        FakeServer.read_request(conn)
+    server = FakeServer(handler)
+    rpc = JsonRPCClient('127.0.0.1', server.port)
+    first = rpc.submit('echo', {})
+    second = rpc.submit('echo', {})
+    eq_(first.result(1)['result'], 0)
+    assert isinstance(second.exception(1), ConnectionLost)
+    server.thread.join()
+    rpc.close()
+
+@raises(socket.timeout)
+def test_wait_timeout():
+    def handler(conn):
+        FakeServer.read_request(conn)
+        # never answer, wait for the client to go away
+        conn.recv(1)
+    server = FakeServer(handler)
+    rpc = JsonRPCClient('127.0.0.1', server.port, timeout=0.01)
+    try:
+        rpc.wait(rpc.submit('echo', {}))
+    finally:
+        eq_(rpc._pending, {})
+        rpc.close()
+        server.thread.join()
+
+def test_late_response():
+    def handler(conn):
+        late = FakeServer.read_request(conn)
+        time.sleep(0.05)
+        FakeServer.respond(conn, late, 'late')
+        FakeServer.respond(conn, FakeServer.read_request(conn), 'ok')
+        conn.recv(1)
+    server = FakeServer(handler)
+    rpc = JsonRPCClient('127.0.0.1', server.port, timeout=0.01)
+    try:
+        rpc.wait(rpc.submit('echo', {}))
+    except socket.timeout:
+        pass
+    else:
+        assert False
+    rpc.timeout = 1
+    eq_(rpc.send_request('echo', {})['result'], 'ok')
+    eq_(rpc._pending, {})
+    rpc.close()
+    server.thread.join()
+
+
+@raises(socket.error)
+def test_connect_backoff():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    rpc = JsonRPCClient('127.0.0.1', port, retries=2, backoff=0.01)
+    start = time.time()
+    try:
+        rpc.connect()
+    finally:
+        assert time.time() - start >= 0.03
+
+
+class FakeSocket(object):
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def recv(self, size):
+        return self.chunks.pop(0) if self.chunks else b''
+
+
+def _message(body):
+    return struct.pack('>BI', 93, len(body)) + body
+
+def test_find_json_object():
+    eq_(find_json_object('returnCode', {'returnCode': -101}), -101)
+
+@raises(KeyError)
+def test_find_json_object_missing():
+    find_json_object('result', {'error': {}})
+
+def test_receive_partial():
+    data = _message(b'{"a": 1}') + _message(b'[]')
+    rpc = JsonRPCClient()
+    s = FakeSocket([data[:3], data[3:9], data[9:]])
+    eq_(rpc.receiveEncodedMsg(s), b'{"a": 1}')
+    eq_(rpc.receiveEncodedMsg(s), b'[]')
+
+@raises(ConnectionLost)
+def test_receive_closed():
+    rpc = JsonRPCClient()
+    rpc.receiveEncodedMsg(FakeSocket([_message(b'{}')[:4]]))
+
+@raises(ConnectionLost)
+def test_receive_bad_tag():
+    rpc = JsonRPCClient()
+    rpc.receiveEncodedMsg(FakeSocket([b'\x00' + _message(b'{}')[1:]]))
+
+if __name__ == '__main__':
+    nose.main()
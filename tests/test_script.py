@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+import nose
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.constants import *
+from pyaardvark.script import Script, ScriptError, format_expectation
+from nose.tools import eq_, raises
+
+
+SCRIPT = """
+# configure the sensor
+i2c bitrate 400
+i2c wr 0x48 0x01 0x60 0x50
+i2c wrrd 0x48 2 0x01 expect 0x60 0x50
+i2c rd 0x48 2 expect 0x42 x      # register pointer wrapped around
+spi 0x9f 0 0 0 expect x 0xef 0x40 0x10
+gpio dir 0x03
+gpio set 0x01
+gpio get expect 0x01/0x03
+delay 0
+"""
+
+
+class TestParse(object):
+    def test_parse(self):
+        script = Script.parse(SCRIPT)
+        eq_(len(script), 9)
+        eq_([op.line for op in script.ops], list(range(3, 12)))
+        eq_(script.uses_i2c, True)
+        eq_(script.uses_spi, True)
+
+    def test_buffers_prebuilt(self):
+        op = Script.parse('i2c wrrd 0x50 4 0x00 0x10').ops[0]
+        eq_(op.data_out.tolist(), [0x00, 0x10])
+        eq_(len(op.data_in), 4)
+
+    def test_mask(self):
+        op = Script.parse('i2c rd 0x50 3 expect 0x12 x 0xff/0x0f').ops[0]
+        eq_(op.expected.tolist(), [0x12, 0, 0x0f])
+        eq_(op.mask.tolist(), [0xff, 0, 0x0f])
+        eq_(op.checks, [(0, 0xff, 0x12), (2, 0x0f, 0x0f)])
+
+    def test_format_expectation(self):
+        eq_(format_expectation(b'\x12\x00\x0f', b'\xff\x00\x0f'),
+                '12 xx 0f/0f')
+
+    @raises(ScriptError)
+    def test_unknown_command(self):
+        Script.parse('i2c foo 0x50')
+
+    @raises(ScriptError)
+    def test_invalid_byte(self):
+        Script.parse('i2c wr 0x50 0x100')
+
+    @raises(ScriptError)
+    def test_expectation_length(self):
+        Script.parse('i2c rd 0x50 2 expect 0x00')
+
+    @raises(ScriptError)
+    def test_expectation_on_write(self):
+        Script.parse('i2c wr 0x50 0x00 expect 0x00')
+
+    @raises(ScriptError)
+    def test_missing_argument(self):
+        Script.parse('delay')
+
+    def test_error_line(self):
+        try:
+            Script.parse('delay 1\n\ni2c rd 0x80 1', source='test.txt')
+        except ScriptError as e:
+            eq_(e.line, 3)
+            eq_(str(e), "test.txt:3: address 128 is not in range 0..127")
+        else:
+            assert False
+
+    def test_binary_roundtrip(self):
+        script = Script.parse(SCRIPT)
+        data = script.to_bytes()
+        assert data.startswith(Script.MAGIC)
+        loaded = Script.from_bytes(data)
+        for (a, b) in zip(script.ops, loaded.ops):
+            for attr in _Op_attributes:
+                eq_(getattr(a, attr), getattr(b, attr))
+
+    @raises(ScriptError)
+    def test_binary_corrupt(self):
+        Script.from_bytes(Script.parse(SCRIPT).to_bytes()[:-3])
+
+_Op_attributes = ('kind', 'line', 'addr', 'value', 'data_out', 'data_in',
+        'expected', 'mask', 'checks')
+
+
+class TestRun(object):
+    def setup(self):
+        self.api = sim.install(sim.SimulatedAPI())
+        self.regs = self.api.attach_i2c(0, sim.RegisterFileTarget(0x48,
+                size=3, on_read={0: lambda: 0x42}))
+        self.api.attach_spi(0, sim.SPIFlashTarget(size=1 << 16))
+        self.a = pyaardvark.open(0)
+
+    def teardown(self):
+        self.a.close()
+        sim.uninstall()
+
+    def test_run(self):
+        eq_(Script.parse(SCRIPT).run(self.a), [])
+        eq_(self.a.i2c_bitrate, 400)
+        eq_(self.regs.regs[1:], bytearray(b'\x60\x50'))
+
+    def test_mismatch(self):
+        script = Script.parse('i2c wrrd 0x48 2 0x00 expect 0x42 0x01\n'
+                'i2c rd 0x48 1 expect 0x00\n'
+                'i2c rd 0x48 1 expect 0x01')
+        eq_(script.run(self.a), [(1, b'\x42\x01', b'\xff\xff', b'\x42\x00'),
+                (3, b'\x01', b'\xff', b'\x42')])
+
+    def test_stop_on_mismatch(self):
+        script = Script.parse('i2c rd 0x48 1 expect 0x00\n'
+                'i2c rd 0x48 1 expect 0x00')
+        eq_(len(script.run(self.a, stop_on_mismatch=True)), 1)
+
+    def test_adapter_error(self):
+        script = Script.parse('delay 0\ni2c wr 0x50 0x00', source='x.txt')
+        try:
+            script.run(self.a)
+        except IOError as e:
+            assert str(e).startswith('x.txt:2: ')
+        else:
+            assert False
+
+    def test_replay_compiled(self):
+        script = Script.from_bytes(Script.parse(SCRIPT).to_bytes())
+        for _ in range(3):
+            eq_(script.run(self.a), [])
+
+if __name__ == '__main__':
+    nose.main()
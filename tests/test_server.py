@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+import json
+import socket
+import struct
+import threading
+import time
+import nose
+from pyaardvark import sim
+from pyaardvark.constants import *
+from nose.tools import eq_, raises
+
+try:
+    from pyRemoteAardvarkServer import server
+except ImportError:
+    raise nose.SkipTest('asyncio not available')
+
+HEADER = struct.Struct('>BI')
+
+
+class Client(object):
+    """A minimal client speaking the framing of pyRemoteAardvark."""
+    def __init__(self, port):
+        self.sock = socket.create_connection(('127.0.0.1', port))
+        self.id = 0
+
+    def _recv(self, length):
+        data = b''
+        while len(data) < length:
+            chunk = self.sock.recv(length - len(data))
+            assert chunk
+            data += chunk
+        return data
+
+    def call(self, method, **params):
+        self.id += 1
+        body = json.dumps(dict(jsonrpc='2.0', method=method, params=params,
+            id=self.id)).encode('utf-8')
+        self.sock.sendall(HEADER.pack(93, len(body)) + body)
+        (tag, length) = HEADER.unpack(self._recv(HEADER.size))
+        eq_(tag, 93)
+        response = json.loads(self._recv(length).decode('utf-8'))
+        eq_(response['id'], self.id)
+        return response
+
+    def result(self, method, **params):
+        return self.call('Aardvark.' + method, **params)['result']
+
+    def open(self, port=0):
+        return self.result('aa_open_ext', port=port)['Aardvark']
+
+    def close(self):
+        self.sock.close()
+
+
+class TestServer(object):
+    def setup(self):
+        self.api = sim.SimulatedAPI(num_devices=2)
+        self.api.attach_i2c(0, sim.RegisterFileTarget(0x20))
+        self.api.attach_spi(0, sim.SPIFlashTarget(size=1 << 16))
+        self.loop = server.asyncio.new_event_loop()
+        self.server = server.AardvarkServer(self.api, self.loop)
+        self.loop.run_until_complete(self.server.start(port=0))
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+        self.client = Client(self.server.port)
+
+    def teardown(self):
+        self.client.close()
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def test_find_devices(self):
+        eq_(self.client.result('aa_find_devices', num_devices=0),
+                dict(num_devices=2, devices=[0, 1]))
+        self.client.open(1)
+        eq_(self.client.result('aa_find_devices_ext', num_devices=2),
+                dict(num_devices=2, devices=[0, 1 | PORT_NOT_FREE],
+                    unique_ids=[2237000000, 2237000001]))
+
+    def test_open_close(self):
+        result = self.client.result('aa_open_ext', port=0)
+        handle = result['Aardvark']
+        assert handle > 0
+        eq_(result['AardvarkExt']['AardvarkVersionValue']['firmware'],
+                sim.VERSION[1])
+        eq_(self.client.result('aa_unique_id', Aardvark=handle), 2237000000)
+        eq_(self.client.result('aa_close', Aardvark=handle)['returnCode'], 1)
+        eq_(self.client.result('aa_unique_id', Aardvark=handle), 0)
+        eq_(self.client.result('aa_open_ext', port=0)['Aardvark'] > 0, True)
+
+    def test_invalid_handle(self):
+        eq_(self.client.result('aa_configure', Aardvark=42,
+            AardvarkConfig=CONFIG_QUERY)['returnCode'], ERR_INVALID_HANDLE)
+
+    def test_i2c(self):
+        h = self.client.open()
+        eq_(self.client.result('aa_i2c_write', Aardvark=h, slave_addr=0x20,
+            AardvarkI2cFlags=0, data_out=[0, 0x11, 0x22]),
+            dict(returnCode=3))
+        self.client.result('aa_i2c_write', Aardvark=h, slave_addr=0x20,
+            AardvarkI2cFlags=0, data_out=[0])
+        eq_(self.client.result('aa_i2c_read', Aardvark=h, slave_addr=0x20,
+            AardvarkI2cFlags=0, num_bytes=2),
+            dict(returnCode=2, data_in=[0x11, 0x22]))
+        eq_(self.client.result('aa_i2c_read_ext', Aardvark=h, slave_addr=0x21,
+            AardvarkI2cFlags=0, num_bytes=2),
+            dict(returnCode=I2C_STATUS_SLA_NACK, num_read=0, data_in=[]))
+        eq_(self.client.result('aa_i2c_write_ext', Aardvark=h,
+            slave_addr=0x20, AardvarkI2cFlags=0, data_out=[]),
+            dict(returnCode=I2C_STATUS_OK, num_written=0))
+
+    def test_spi(self):
+        h = self.client.open()
+        eq_(self.client.result('aa_spi_write', Aardvark=h, num_bytes=4,
+            data_out=[0x9f, 0, 0, 0]),
+            dict(returnCode=4, data_in=[0, 0xef, 0x40, 0x10]))
+
+    def test_batch(self):
+        h = self.client.open()
+        result = self.client.result('aa_batch', Aardvark=h,
+                stop_on_error=True, operations=[
+                    dict(op='i2c_write', slave_addr=0x20, AardvarkI2cFlags=0,
+                        data_out=[4, 0xaa], num_bytes=0),
+                    dict(op='i2c_write_read', slave_addr=0x20,
+                        AardvarkI2cFlags=0, data_out=[4], num_bytes=1),
+                    dict(op='gpio_set', value=1, num_bytes=0),
+                    dict(op='i2c_read', slave_addr=0x30, AardvarkI2cFlags=0,
+                        num_bytes=1),
+                    dict(op='delay', num_bytes=1000),
+                ])
+        eq_(result['results'], [dict(returnCode=2),
+            dict(returnCode=1, data_in=[0xaa]), dict(returnCode=0),
+            dict(returnCode=ERR_I2C_READ_ERROR)])
+
+    def test_errors(self):
+        eq_(self.client.call('Aardvark.aa_foo')['error']['code'],
+                server.METHOD_NOT_FOUND)
+        h = self.client.open()
+        eq_(self.client.call('Aardvark.aa_i2c_write', Aardvark=h)
+                ['error']['code'], server.INVALID_PARAMS)
+
+    def test_stats(self):
+        h = self.client.open()
+        for _ in range(3):
+            self.client.result('aa_i2c_bitrate', Aardvark=h, bitrate=0)
+        stats = self.client.call('Server.stats')['result']
+        eq_(stats['clients'], 1)
+        eq_(stats['global']['requests'], 1)
+        device = stats['devices'][str(h)]
+        eq_(device['requests'], 3)
+        assert device['queue_wait_total'] >= 0
+        assert device['device_time_total'] > 0
+
+    def test_close_on_disconnect(self):
+        self.client.open()
+        self.client.close()
+        for _ in range(100):
+            if self.api.ports[0].handle is None:
+                break
+            time.sleep(0.01)
+        eq_(self.api.ports[0].handle, None)
+        self.client = Client(self.server.port)
+
+    def test_concurrent_clients(self):
+        h = self.client.open()
+        results = []
+        def run():
+            c = Client(self.server.port)
+            for _ in range(20):
+                results.append(c.result('aa_i2c_read', Aardvark=h,
+                    slave_addr=0x20, AardvarkI2cFlags=0, num_bytes=1)
+                    ['returnCode'])
+            c.close()
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        eq_(results, [1] * 80)
+
+
+class TestDeviceWorker(object):
+    def setup(self):
+        self.loop = server.asyncio.new_event_loop()
+
+    def teardown(self):
+        self.loop.close()
+
+    def test_round_robin(self):
+        worker = server.DeviceWorker(self.loop)
+        order = []
+        futures = [worker.submit('a', order.append, 'a%d' % i)
+                for i in range(4)]
+        futures.append(worker.submit('b', order.append, 'b0'))
+        for future in futures:
+            self.loop.run_until_complete(future)
+        eq_(order, ['a0', 'a1', 'b0', 'a2', 'a3'])
+        eq_(worker.stats.requests, 5)
+        eq_(worker.stats.max_queue_depth, 4)
+        worker.shutdown()
+
+    @raises(ZeroDivisionError)
+    def test_exception(self):
+        worker = server.DeviceWorker(self.loop)
+        def fail():
+            time.sleep(0.01)
+            return 1 / 0
+        try:
+            self.loop.run_until_complete(worker.submit(None, fail))
+        finally:
+            eq_(worker.stats.errors, 1)
+            assert worker.stats.device_time.total >= 0.01
+            assert worker.stats.queue_wait.total >= 0
+            worker.shutdown()
+
+if __name__ == '__main__':
+    nose.main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+import array
+import nose
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.constants import *
+from pyaardvark.eeprom import EEPROM
+from pyaardvark.regmap import Register, RegisterMap
+from pyaardvark.spiflash import SPIFlash
+from nose.tools import eq_, raises
+
+
+class TestSimulatedAPI(object):
+    def setup(self):
+        self.api = sim.install(sim.SimulatedAPI(num_devices=2))
+        self.a = pyaardvark.open(0)
+
+    def teardown(self):
+        self.a.close()
+        sim.uninstall()
+
+    def test_find_devices(self):
+        eq_(pyaardvark.find_devices(), [1])
+        eq_(pyaardvark.find_devices(filter_in_use=False), [0, 1])
+
+    @raises(IOError)
+    def test_open_in_use(self):
+        pyaardvark.open(0)
+
+    def test_unique_id(self):
+        eq_(self.a.unique_id(), 2237000000)
+        with pyaardvark.open(1) as b:
+            eq_(b.unique_id(), 2237000001)
+
+    def test_configuration(self):
+        self.a.i2c_bitrate = 400
+        eq_(self.a.i2c_bitrate, 400)
+        self.a.spi_bitrate = 100000
+        eq_(self.a.spi_bitrate, 8000)
+        self.a.target_power = True
+        eq_(self.a.target_power, True)
+
+    def test_i2c_absent_device(self):
+        eq_(self.a.i2c_master_write_ext(0x50, b'\x00'),
+                (I2C_STATUS_SLA_NACK, 0))
+
+    @raises(IOError)
+    def test_i2c_absent_device_raises(self):
+        self.a.i2c_master_read(0x50, 1)
+
+    @raises(IOError)
+    def test_i2c_not_enabled(self):
+        self.a.enable_i2c = False
+        self.a.i2c_master_write(0x50, b'\x00')
+
+    def test_scan(self):
+        self.api.attach_i2c(0, sim.EEPROMTarget(0x50, size=2048))
+        self.api.attach_i2c(0, sim.RegisterFileTarget(0x20))
+        eq_(self.a.i2c_scan(), [0x20] + list(range(0x50, 0x58)))
+
+    def test_eeprom(self):
+        self.api.attach_i2c(0, sim.EEPROMTarget(0x50, size=65536,
+                page_size=128))
+        eeprom = EEPROM.from_part(self.a, '24c512')
+        data = bytes(bytearray(i & 0xff for i in range(1000)))
+        eeprom.write(data, 100)
+        eq_(eeprom.read(100, 1000), data)
+        eq_(eeprom.read(0, 100), b'\xff' * 100)
+
+    def test_eeprom_busy(self):
+        target = self.api.attach_i2c(0, sim.EEPROMTarget(0x50))
+        self.a.i2c_master_write(0x50, b'\x00\x01')
+        eq_(self.a.i2c_master_write_ext(0x50, b''),
+                (I2C_STATUS_SLA_NACK, 0))
+        self.api.ports[0].clock += target.write_time
+        eq_(self.a.i2c_master_write_ext(0x50, b''), (I2C_STATUS_OK, 0))
+
+    def test_eeprom_page_wrap(self):
+        target = self.api.attach_i2c(0, sim.EEPROMTarget(0x50))
+        self.a.i2c_master_write(0x50, b'\x06\x01\x02\x03\x04')
+        eq_(target.mem[:8], bytearray(b'\x03\x04\xff\xff\xff\xff\x01\x02'))
+
+    def test_eeprom_block_address(self):
+        target = self.api.attach_i2c(0, sim.EEPROMTarget(0x50, size=1024,
+                page_size=16))
+        self.a.i2c_master_write(0x52, b'\x10\xaa')
+        eq_(target.mem[0x210], 0xaa)
+
+    def test_register_map(self):
+        target = self.api.attach_i2c(0, sim.RegisterFileTarget(0x48,
+                on_read={0: lambda: 0x42}))
+        regs = RegisterMap(self.a, 0x48, [Register('TEMP', 0, volatile=True),
+                Register('CONF', 1), Register('LIMIT', 2)])
+        eq_(regs.read('TEMP'), 0x42)
+        with regs:
+            regs.write('CONF', 0x60)
+            regs.write('LIMIT', 0x50)
+        eq_(target.regs[1:3], bytearray(b'\x60\x50'))
+        eq_(regs.read('LIMIT'), 0x50)
+
+    def test_spi_without_target(self):
+        eq_(self.a.spi_write(b'\x00\x00'), b'\xff\xff')
+
+    def test_spi_flash(self):
+        self.api.attach_spi(0, sim.SPIFlashTarget(size=1 << 16,
+                erase_time=0.001, program_time=0.0001))
+        flash = SPIFlash(self.a)
+        eq_(flash.size, 1 << 16)
+        data = bytes(bytearray(i & 0xff for i in range(10000)))
+        flash.flash(data, offset=4096, verify=True)
+        eq_(flash.read(4096, len(data)), data)
+        flash.erase(4096, 4096)
+        eq_(flash.read(4096, 4096), b'\xff' * 4096)
+        eq_(flash.read(8192, 10), data[4096:4106])
+
+    def test_spi_flash_read_wraps(self):
+        target = self.api.attach_spi(0, sim.SPIFlashTarget(size=16))
+        target.mem[:] = bytearray(range(16))
+        eq_(self.a.spi_write(b'\x03\x00\x00\x0e' + b'\x00' * 4),
+                b'\x00' * 4 + b'\x0e\x0f\x00\x01')
+        eq_(len(self.a.spi_write(b'\x0b\x00\x00\x0f' + b'\x00' * 37)),
+                41)
+
+    def test_spi_flash_write_protected(self):
+        target = self.api.attach_spi(0, sim.SPIFlashTarget(size=1 << 16))
+        self.a.spi_write(b'\x02\x00\x00\x00\x00')
+        eq_(target.mem[0], 0xff)
+
+    def test_i2c_slave(self):
+        self.a.i2c_slave_enable(0x40)
+        self.a.i2c_slave_set_response(b'\x01\x02')
+        eq_(self.a.poll(0), POLL_NO_DATA)
+        self.api.master_write(0, b'\xab\xcd')
+        eq_(self.a.poll(0), POLL_I2C_READ)
+        eq_(self.a.i2c_slave_read(), (0x40, b'\xab\xcd'))
+        eq_(self.api.master_read(0, 3), b'\x01\x02\x01')
+        eq_(self.a.poll(0), POLL_I2C_WRITE)
+        eq_(self.a.i2c_slave_write_stats(), 3)
+
+    def test_i2c_slave_wrong_address(self):
+        self.a.i2c_slave_enable(0x40)
+        eq_(self.api.master_write(0, b'\x00', addr=0x41), False)
+        eq_(self.a.poll(0), POLL_NO_DATA)
+
+    def test_spi_slave(self):
+        self.a.spi_slave_enable()
+        self.a.spi_slave_set_response(b'\x5a')
+        eq_(self.api.spi_master_transfer(0, b'\x01\x02'), b'\x5a\x5a')
+        eq_(self.a.poll(0), POLL_SPI)
+        eq_(self.a.spi_slave_read(), b'\x01\x02')
+
+    def test_gpio(self):
+        self.a.gpio_direction(GPIO_SCL | GPIO_SDA)
+        self.a.gpio_set(GPIO_SCL | GPIO_MOSI)
+        self.api.set_gpio_inputs(0, GPIO_MISO | GPIO_SDA)
+        eq_(self.a.gpio_get(), GPIO_SCL | GPIO_MISO)
+
+    def test_batch(self):
+        self.api.attach_i2c(0, sim.RegisterFileTarget(0x20))
+        results = self.a.batch([('i2c_write', 0x20, b'\x04\x11\x22'),
+                ('i2c_write_read', 0x20, b'\x04', 2),
+                ('i2c_read', 0x21, 1)])
+        eq_(results[1], (2, b'\x11\x22'))
+        eq_(results[2].status, ERR_I2C_READ_ERROR)
+
+    def test_array_buffers(self):
+        target = self.api.attach_i2c(0, sim.RegisterFileTarget(0x20))
+        target.regs[:2] = b'\x12\x34'
+        api = self.api
+        handle = self.a.handle
+        eq_(api.py_aa_i2c_write(handle, 0x20, 0, 1, array.array('B', [0])), 1)
+        buf = array.array('B', [0, 0])
+        eq_(api.py_aa_i2c_read(handle, 0x20, 0, 2, buf), 2)
+        eq_(buf.tolist(), [0x12, 0x34])
+
+
+class TestTiming(object):
+    def setup(self):
+        self.api = sim.install(sim.SimulatedAPI())
+        self.a = pyaardvark.open(0)
+
+    def teardown(self):
+        self.a.close()
+        sim.uninstall()
+
+    def test_i2c_duration(self):
+        self.api.attach_i2c(0, sim.RegisterFileTarget(0x20))
+        self.a.i2c_bitrate = 100
+        self.a.i2c_master_read(0x20, 9)
+        # 10 bytes of 9 bits plus start and stop at 100kHz
+        eq_(round(self.api.ports[0].clock, 9), 0.00092)
+
+    def test_spi_duration(self):
+        self.a.spi_bitrate = 1000
+        self.a.spi_write(b'\x00' * 125)
+        eq_(round(self.api.ports[0].clock, 9), 0.001)
+
+    def test_usb_latency(self):
+        self.api.timing = sim.TimingModel(usb_latency=0.001)
+        self.a.i2c_scan(range(0x08, 0x10))
+        eq_(round(self.api.ports[0].clock, 9), 8 * (0.001 + 0.00011))
+
+    def test_deterministic(self):
+        def run():
+            api = sim.install(sim.SimulatedAPI())
+            api.attach_i2c(0, sim.EEPROMTarget(0x50, size=4096,
+                page_size=32))
+            with pyaardvark.open(0) as a:
+                EEPROM.from_part(a, '24c32').write(b'\x55' * 4096)
+            sim.uninstall()
+            return api.ports[0].clock
+        eq_(run(), run())
+
+if __name__ == '__main__':
+    nose.main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+import threading
+import nose
+from mock import patch
+import pyaardvark
+from pyaardvark.constants import *
+from pyaardvark.slave import I2CSlaveCapture, SPISlaveReceiver
+from nose.tools import eq_
+
+
+def _poll(events):
+    events = list(events)
+    def poll(_handle, _timeout):
+        if events:
+            return events.pop(0)
+        return POLL_NO_DATA
+    return poll
+
+def _slave_read(messages):
+    messages = list(messages)
+    def slave_read(_handle, length, data):
+        msg = messages.pop(0)
+        if isinstance(msg, int):
+            return (msg, 0)
+        data[:len(msg)] = msg
+        return (len(msg), 0x50)
+    return slave_read
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+class TestI2CSlaveCapture(object):
+    def open(self, api):
+        api.py_aa_open_ext.return_value = (1, (0,) * 6)
+        return pyaardvark.open()
+
+    def test_capture(self, api):
+        api.py_aa_async_poll.side_effect = _poll([POLL_I2C_READ,
+            POLL_I2C_READ | POLL_I2C_WRITE])
+        api.py_aa_i2c_slave_read.side_effect = _slave_read([b'\x01\x02',
+            b'\x03'])
+        api.py_aa_i2c_slave_write_stats.return_value = 4
+        capture = I2CSlaveCapture(self.open(api))
+        capture.start()
+        msgs = [capture.get(1), capture.get(1), capture.get(1)]
+        capture.stop()
+        eq_([(m.event, m.slave_addr, m.data, m.length) for m in msgs], [
+            (POLL_I2C_READ, 0x50, b'\x01\x02', 2),
+            (POLL_I2C_READ, 0x50, b'\x03', 1),
+            (POLL_I2C_WRITE, None, None, 4),
+        ])
+        stats = capture.stats()
+        eq_(stats['reads'], 2)
+        eq_(stats['rx_bytes'], 3)
+        eq_(stats['tx_bytes'], 4)
+        eq_(stats['overruns'], 0)
+
+    def test_iterator(self, api):
+        api.py_aa_async_poll.side_effect = _poll([POLL_I2C_READ] * 3)
+        api.py_aa_i2c_slave_read.side_effect = _slave_read([b'a', b'b', b'c'])
+        with I2CSlaveCapture(self.open(api)) as capture:
+            it = iter(capture)
+            eq_([next(it).data for _ in range(3)], [b'a', b'b', b'c'])
+
+    def test_overrun_and_dropped_bytes(self, api):
+        api.py_aa_async_poll.side_effect = _poll([POLL_I2C_READ] * 4)
+        api.py_aa_i2c_slave_read.side_effect = _slave_read([b'a',
+            ERR_I2C_DROPPED_EXCESS_BYTES, b'b', b'c'])
+        dev = self.open(api)
+        capture = I2CSlaveCapture(dev, maxlen=2)
+        capture.start()
+        while api.py_aa_async_poll.call_count < 5:
+            pass
+        capture.stop()
+        eq_([m.data for m in capture], [b'b', b'c'])
+        eq_(capture.stats()['overruns'], 1)
+        eq_(capture.stats()['dropped_excess_bytes'], 1)
+        # all receive buffers went back to the pool
+        eq_(dev.i2c_slave_rx_pool.allocated, 1)
+
+    def test_callback(self, api):
+        api.py_aa_async_poll.side_effect = _poll([POLL_I2C_READ] * 2)
+        api.py_aa_i2c_slave_read.side_effect = _slave_read([b'a', b'b'])
+        received = []
+        done = threading.Event()
+        def callback(msg):
+            received.append(msg.data)
+            if len(received) == 2:
+                done.set()
+        with I2CSlaveCapture(self.open(api), callback=callback):
+            done.wait(1)
+        eq_(received, [b'a', b'b'])
+
+    def test_stop_not_started(self, api):
+        capture = I2CSlaveCapture(self.open(api))
+        capture.stop()
+        eq_(capture.get(0), None)
+        api.py_aa_async_poll.side_effect = _poll([])
+        capture.start()
+        capture.stop()
+        capture.stop()
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+class TestSPISlaveReceiver(object):
+    def open(self, api):
+        api.py_aa_open_ext.side_effect = lambda port: (port, (0,) * 6)
+        return pyaardvark.open(1), pyaardvark.open(2)
+
+    def test_receive(self, api):
+        pending = {1: [b'a', b'bb'], 2: [ERR_SPI_DROPPED_EXCESS_BYTES, b'c']}
+        def poll(handle, _timeout):
+            return POLL_SPI if pending[handle] else POLL_NO_DATA
+        def spi_slave_read(handle, length, data):
+            msg = pending[handle].pop(0)
+            if isinstance(msg, int):
+                return msg
+            data[:len(msg)] = msg
+            return len(msg)
+        api.py_aa_async_poll.side_effect = poll
+        api.py_aa_spi_slave_read.side_effect = spi_slave_read
+
+        (a, b) = self.open(api)
+        rx = SPISlaveReceiver(dict(a=a, b=b))
+        rx.start()
+        msgs = [rx.get(1) for _ in range(3)]
+        rx.stop()
+        received = dict(a=[], b=[])
+        for msg in msgs:
+            with msg.buf:
+                received[msg.device].append(msg.buf.tobytes())
+        eq_(received, dict(a=[b'a', b'bb'], b=[b'c']))
+
+        stats = rx.stats()
+        eq_(stats['devices']['a']['rx_bytes'], 3)
+        eq_(stats['devices']['b']['dropped_excess_bytes'], 1)
+        eq_(b.spi_slave_rx_pool.allocated, 1)
+
+    def test_overrun_releases_buffer(self, api):
+        pending = [b'a', b'b', b'c']
+        api.py_aa_async_poll.side_effect = lambda h, t: (POLL_SPI
+                if pending and h == 1 else POLL_NO_DATA)
+        def spi_slave_read(handle, length, data):
+            data[0:1] = pending.pop(0)
+            return 1
+        api.py_aa_spi_slave_read.side_effect = spi_slave_read
+
+        (a, b) = self.open(api)
+        rx = SPISlaveReceiver([a], maxlen=1)
+        rx.start()
+        while pending:
+            pass
+        rx.stop()
+        msgs = list(rx)
+        eq_([m.buf.tobytes() for m in msgs], [b'c'])
+        eq_((msgs[0].device, rx.stats()['overruns']), (0, 2))
+        eq_(a.spi_slave_rx_pool.stats()['allocated'], 2)
+        eq_(a.spi_slave_rx_pool.stats()['reused'], 1)
+
+if __name__ == '__main__':
+    nose.main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+import io
+import nose
+from mock import patch
+import pyaardvark
+from pyaardvark import spiflash
+from pyaardvark.spiflash import SPIFlash, erase_plan
+from nose.tools import eq_, raises
+
+
+class FakeFlash(object):
+    """Emulates a SPI NOR flash behind the mocked API. Every program or
+    erase operation keeps the device busy for `busy_polls` status reads.
+    """
+    ERASE_SIZES = {0x20: 4096, 0x52: 32768, 0xd8: 65536}
+
+    def __init__(self, api, size=1 << 20, busy_polls=2):
+        self.mem = bytearray(b'\xff' * size)
+        self.busy_polls = busy_polls
+        self.busy = 0
+        self.wel = False
+        self.commands = []
+        api.py_aa_spi_write.side_effect = self.spi_write
+
+    def spi_write(self, handle, len_out, data_out, len_in, data_in):
+        cmd = data_out[0]
+        addr = (data_out[1] << 16) | (data_out[2] << 8) | data_out[3] \
+                if len_out >= 4 else None
+        self.commands.append((cmd, addr))
+        if cmd == 0x05:
+            data_in[1] = 1 if self.busy else 0
+            self.busy = max(0, self.busy - 1)
+        elif cmd == 0x9f:
+            data_in[1:4] = bytearray(b'\xef\x40\x14')
+        elif cmd == 0x06:
+            self.wel = True
+        elif cmd == 0x0b:
+            data_in[5:len_out] = self.mem[addr:addr + len_out - 5]
+        elif cmd == 0x02:
+            assert self.wel and not self.busy
+            assert addr // 256 == (addr + len_out - 5) // 256
+            for i, b in enumerate(data_out[4:len_out]):
+                self.mem[addr + i] &= b
+            self.wel = False
+            self.busy = self.busy_polls
+        elif cmd in self.ERASE_SIZES or cmd == 0xc7:
+            assert self.wel and not self.busy
+            size = self.ERASE_SIZES.get(cmd, len(self.mem))
+            addr = addr or 0
+            assert addr % size == 0
+            self.mem[addr:addr + size] = b'\xff' * size
+            self.wel = False
+            self.busy = self.busy_polls
+        return len_out
+
+
+def test_erase_plan():
+    eq_(erase_plan(0, 0x20000), [(0xd8, 0, 0x10000), (0xd8, 0x10000, 0x10000)])
+    eq_(erase_plan(0xf000, 0x19000), [
+        (0x20, 0xf000, 0x1000),
+        (0xd8, 0x10000, 0x10000),
+        (0x52, 0x20000, 0x8000)])
+    # the region is extended to sector boundaries
+    eq_(erase_plan(0x1100, 0x100), [(0x20, 0x1000, 0x1000)])
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+class TestSPIFlash(object):
+    def setup(self):
+        with patch('pyaardvark.aardvark.api', autospec=True) as api:
+            api.py_aa_open_ext.return_value = (1, (0,) * 6)
+            self.a = pyaardvark.open()
+
+    def flash(self, api, **kwargs):
+        api.py_aa_spi_master_ss_polarity.return_value = 0
+        self.dev = FakeFlash(api, **kwargs)
+        return SPIFlash(self.a)
+
+    def test_jedec_id(self, api):
+        f = self.flash(api)
+        eq_(f.jedec_id(), (0xef, 0x40, 0x14))
+        eq_(len(f), 1 << 20)
+        api.py_aa_spi_master_ss_polarity.assert_called_once_with(
+                self.a.handle, pyaardvark.SPI_SS_ACTIVE_LOW)
+
+    def test_program_and_read(self, api):
+        f = self.flash(api)
+        data = bytearray(i & 0xff for i in range(1000))
+        f.program(data, 0x1f0)
+        eq_(self.dev.mem[0x1f0:0x1f0 + 1000], data)
+        eq_([a for (c, a) in self.dev.commands if c == 0x02],
+                [0x1f0, 0x200, 0x300, 0x400, 0x500])
+        eq_(f.read(0x1f0, 1000), bytes(data))
+        assert f.timings['program'] > 0
+
+    def test_read_chunks(self, api):
+        f = self.flash(api)
+        self.dev.mem[:] = bytearray(i & 0xff for i in range(1 << 20))
+        eq_(f.read(0, 200000), bytes(self.dev.mem[:200000]))
+        eq_(len([c for (c, a) in self.dev.commands if c == 0x0b]), 4)
+
+    def test_erase(self, api):
+        f = self.flash(api)
+        self.dev.mem[:] = b'\x00' * len(self.dev.mem)
+        f.erase(0x1000, 0x10000)
+        eq_([c for (c, a) in self.dev.commands if c in (0x20, 0x52, 0xd8)],
+                [0x20] * 7 + [0x52, 0x20])
+        eq_(self.dev.mem[0x1000:0x11000], b'\xff' * 0x10000)
+        eq_(self.dev.mem[0x11000], 0)
+
+    def test_erase_unaligned(self, api):
+        f = self.flash(api)
+        pattern = bytearray(i & 0xff for i in range(0x3000))
+        self.dev.mem[:0x3000] = pattern
+        f.erase(0x1100, 0x1000)
+        eq_([(c, a) for (c, a) in self.dev.commands if c == 0x20],
+                [(0x20, 0x1000), (0x20, 0x2000)])
+        eq_(self.dev.mem[0x1100:0x2100], b'\xff' * 0x1000)
+        eq_(self.dev.mem[:0x1100], pattern[:0x1100])
+        eq_(self.dev.mem[0x2100:0x3000], pattern[0x2100:])
+
+    def test_flash_unaligned(self, api):
+        f = self.flash(api)
+        pattern = bytearray(i & 0xff for i in range(0x2000))
+        self.dev.mem[:0x2000] = pattern
+        f.flash(b'\x00' * 10, 0x1005)
+        eq_(self.dev.mem[0x1005:0x100f], b'\x00' * 10)
+        eq_(self.dev.mem[:0x1005], pattern[:0x1005])
+        eq_(self.dev.mem[0x100f:0x2000], pattern[0x100f:])
+
+    def test_erase_chip(self, api):
+        f = self.flash(api)
+        f.erase(0, len(f))
+        eq_([c for (c, a) in self.dev.commands if c not in (0x05, 0x06)],
+                [0x9f, 0xc7])
+        eq_(self.dev.commands[-1], (0x05, None))
+
+    def test_flash_from_file(self, api):
+        f = self.flash(api)
+        data = bytes(bytearray(i * 7 & 0xff for i in range(70000)))
+        stats = f.flash(io.BytesIO(data), 0x8000, verify=True)
+        eq_(stats.bytes, 70000)
+        eq_(stats.chunks, 2)
+        eq_(self.dev.mem[0x8000:0x8000 + 70000], data)
+        for phase in ('erase', 'program', 'verify'):
+            assert phase in f.timings
+
+    @raises(IOError)
+    def test_flash_verify_error(self, api):
+        f = self.flash(api)
+        self.dev.mem[:] = b'\x00' * len(self.dev.mem)
+        f.flash(b'\xff', erase=False, verify=True)
+
+    def test_dump(self, api):
+        f = self.flash(api)
+        out = io.BytesIO()
+        stats = f.dump(out, 0x100, 0x200)
+        eq_(out.getvalue(), b'\xff' * 0x200)
+        eq_(stats.bytes, 0x200)
+
+    @raises(IOError)
+    def test_busy_timeout(self, api):
+        f = self.flash(api)
+        f.timeout = 0.01
+        def spi_write(handle, len_out, data_out, len_in, data_in):
+            data_in[1] = 1
+            return len_out
+        api.py_aa_spi_write.side_effect = spi_write
+        f.wait_ready()
+
+if __name__ == '__main__':
+    nose.main()
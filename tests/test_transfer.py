@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import io
+import nose
+from mock import patch
+import pyaardvark
+from pyaardvark import transfer
+from nose.tools import eq_, raises
+
+
+def test_reader_buffer():
+    readinto = transfer.reader(b'abcde')
+    buf = bytearray(2)
+    eq_([readinto(buf) for _ in range(4)], [2, 2, 1, 0])
+
+def test_reader_iterable():
+    readinto = transfer.reader([b'ab', b'', b'cde', b'f'])
+    buf = bytearray(4)
+    eq_(readinto(buf), 4)
+    eq_(buf, bytearray(b'abcd'))
+    eq_(readinto(buf), 2)
+    eq_(buf[:2], bytearray(b'ef'))
+
+def test_reader_file():
+    readinto = transfer.reader(io.BytesIO(b'abc'))
+    buf = bytearray(2)
+    eq_(readinto(buf), 2)
+    eq_(readinto(buf), 1)
+    eq_(buf[:1], bytearray(b'c'))
+
+def test_writer():
+    out = io.BytesIO()
+    transfer.writer(out)(b'ab')
+    eq_(out.getvalue(), b'ab')
+    received = []
+    transfer.writer(received.append)(b'cd')
+    eq_(received, [b'cd'])
+    transfer.writer(None)(b'ef')
+
+def _spi_write(_handle, len_tx, tx, len_rx, rx):
+    for i in range(len_rx):
+        rx[i] = tx[i] ^ 0xff
+    return len_rx
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+class TestSpiStream(object):
+    def open(self, api):
+        api.py_aa_open_ext.return_value = (1, (0,) * 6)
+        api.py_aa_spi_write.side_effect = _spi_write
+        return pyaardvark.open()
+
+    def test_stream(self, api):
+        a = self.open(api)
+        data = bytearray(range(256)) * 4
+        out = io.BytesIO()
+        stats = transfer.spi_stream(a, io.BytesIO(bytes(data)), out,
+                chunk_size=300)
+        eq_(out.getvalue(), bytes(bytearray(b ^ 0xff for b in data)))
+        eq_((stats.bytes, stats.chunks), (1024, 4))
+        eq_([c[0][1] for c in api.py_aa_spi_write.call_args_list],
+                [300, 300, 300, 124])
+        eq_([c[0][3] for c in api.py_aa_spi_write.call_args_list],
+                [300, 300, 300, 124])
+
+    def test_stream_exact_chunks(self, api):
+        a = self.open(api)
+        received = []
+        stats = transfer.spi_stream(a, b'\x00' * 8, received.append,
+                chunk_size=4)
+        eq_(received, [b'\xff' * 4] * 2)
+        eq_(stats.chunks, 2)
+
+    def test_stream_empty(self, api):
+        a = self.open(api)
+        stats = transfer.spi_stream(a, b'')
+        eq_((stats.bytes, stats.chunks), (0, 0))
+        eq_(api.py_aa_spi_write.call_count, 0)
+
+    @raises(IOError)
+    def test_stream_error(self, api):
+        a = self.open(api)
+        api.py_aa_spi_write.side_effect = None
+        api.py_aa_spi_write.return_value = -1
+        transfer.spi_stream(a, b'\x00' * 16, chunk_size=4)
+
+    @raises(ValueError)
+    def test_source_error(self, api):
+        a = self.open(api)
+        def source():
+            yield b'\x00' * 4
+            raise ValueError()
+        transfer.spi_stream(a, source(), chunk_size=4)
+
+if __name__ == '__main__':
+    nose.main()